@@ -5,6 +5,7 @@ import plotly.express as px
 
 from supa import get_client
 from utils import require_login, logout, sidebar_logout_bottom
+from utils_cache import dashboard
 
 # =========================
 # Page config
@@ -28,31 +29,41 @@ st.caption("Import Strava en 2 clics, dédoublonnage intelligent, KPIs lisibles
 st.button("Importer mes données")
 
 # =========================
-# KPIs (exemples statiques — remplace par tes vraies variables)
+# KPIs + kilométrage quotidien (un appel agrégé côté serveur, en cache par utilisateur + version des données)
 # =========================
 st.subheader("Tes stats clés")
 st.caption("Mise à jour après chaque import.")
 
+user_id = st.session_state["user"]["id"]
+today = pd.Timestamp.now(tz="UTC").tz_convert(None).floor("D")
+kpis, daily = dashboard(sb, user_id, today)  # courses seulement, comme les Stats
+
+def _delta(metric: str) -> str:
+    cur, prev, ly = (kpis[w][metric] for w in ("current", "previous", "last_year"))
+    parts = [f"{(cur - prev) / prev * 100:+.0f}% vs 7j préc." if prev > 0 else None,
+             f"{(cur - ly) / ly * 100:+.0f}% vs an dernier" if ly > 0 else None]
+    return " · ".join(p for p in parts if p) or None
+
+cur = kpis["current"]
+h, m = divmod(int(round(cur["moving_time"])), 60)
+
 cols = st.columns(3)
 with cols[0]:
-    st.metric(label="Distance (7j)", value="58.3 km", delta="+12% vs N-1")
-    st.caption("Total semaine en cours")
+    st.metric(label="Distance (7j)", value=f"{cur['distance']:.1f} km", delta=_delta("distance"))
+    st.caption("7 derniers jours")
 with cols[1]:
-    st.metric(label="D+ (7j)", value="+2 150 m", delta="+5%")
+    st.metric(label="D+ (7j)", value=f"+{cur['elevation_gain']:,.0f} m".replace(",", " "),
+              delta=_delta("elevation_gain"))
 with cols[2]:
-    st.metric(label="Temps actif (7j)", value="6 h 42", delta="-8%")
+    st.metric(label="Temps actif (7j)", value=f"{h} h {m:02d}", delta=_delta("moving_time"))
 
 # =========================
-# Graphique (exemple)
+# Graphique : kilométrage quotidien (28 jours)
 # =========================
 st.subheader("Vue quotidienne")
 st.caption("Un coup d’œil sur ta charge récente.")
 
-df = pd.DataFrame({
-    "date": pd.date_range("2025-08-25", periods=10, freq="D"),
-    "km": [5.1, 8.2, 0.0, 10.3, 7.5, 6.2, 0.0, 12.4, 11.1, 9.0]
-})
-fig = px.bar(df, x="date", y="km", title="Kilométrage quotidien")
+fig = px.bar(daily, x="date", y="km", title="Kilométrage quotidien")
 st.plotly_chart(fig, use_container_width=True)
 
 # =========================
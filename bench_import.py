@@ -0,0 +1,88 @@
+# bench_import.py — Benchmark du typage de l'import Strava (cellule par cellule vs colonnaire)
+#
+# Usage : python bench_import.py [nb_lignes]
+# Génère un activities.csv synthétique (en-têtes FR, virgules décimales), vérifie que
+# convert_frame donne exactement les mêmes payloads que l'ancien chemin, puis chronomètre.
+import io
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils_import import (
+    TABLE_COLS, BOOL_COLS, INT_COLS, FLOAT_COLS, TS_COLS, TIME_COLS, FR_HEADER_MAP,
+    _snake, convert_frame, convert_frame_rowwise, frame_to_payloads,
+)
+
+USER_ID = "00000000-0000-0000-0000-000000000000"
+
+
+def synthetic_csv(n: int, seed: int = 0) -> bytes:
+    """activities.csv factice au format export FR (virgules décimales, cases vides)."""
+    rng = np.random.default_rng(seed)
+    fr_by_target = {}
+    for fr, target in FR_HEADER_MAP.items():
+        fr_by_target.setdefault(target, fr)
+    start = pd.Timestamp("2015-01-01")
+    cols = {}
+    for c in TABLE_COLS:
+        if c in BOOL_COLS:
+            v = rng.choice(["true", "false", "", "1", "0"], n).astype(object)
+        elif c in TS_COLS:
+            ts = start + pd.to_timedelta(rng.integers(0, 3650 * 86400, n), unit="s")
+            fmt = "%d/%m/%Y %H:%M:%S" if c == "activity_date" else "%b %d, %Y, %I:%M:%S %p"
+            v = ts.strftime(fmt).to_numpy(dtype=object)
+            odd = rng.random(n) < 0.01  # quelques formats inattendus -> chemin lent
+            v[odd] = ts[odd].strftime("%Y-%m-%dT%H:%M:%S+02:00")
+            v[rng.random(n) < 0.005] = "inconnue"
+        elif c in TIME_COLS:
+            v = pd.Series(rng.integers(0, 86400, n)).map(
+                lambda s: f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}").to_numpy(dtype=object)
+            v[rng.random(n) < 0.01] = "7:05"
+        elif c in INT_COLS:
+            v = rng.integers(0, 20000, n).astype(str).astype(object)
+        elif c in FLOAT_COLS:
+            v = np.char.replace(np.round(rng.uniform(0, 500, n), 2).astype(str), ".", ",").astype(object)
+        else:
+            v = np.array([f"Sortie {i}" for i in range(n)], dtype=object)
+        v[rng.random(n) < 0.1] = ""
+        cols[fr_by_target.get(c, c)] = v
+    cols[fr_by_target["activity_type"]] = "Course à pied"
+    buf = io.StringIO()
+    pd.DataFrame(cols).to_csv(buf, index=False)
+    return buf.getvalue().encode("utf-8")
+
+
+def load(raw: bytes) -> pd.DataFrame:
+    df = pd.read_csv(io.BytesIO(raw))
+    df.columns = [FR_HEADER_MAP.get(_snake(c), _snake(c)) for c in df.columns]
+    return df[[c for c in TABLE_COLS if c in df.columns]]
+
+
+def main(n: int):
+    df = load(synthetic_csv(n))
+
+    t0 = time.perf_counter()
+    ref = convert_frame_rowwise(df, USER_ID)
+    t1 = time.perf_counter()
+    report = {}
+    new = frame_to_payloads(convert_frame(df, report=report), USER_ID)
+    t2 = time.perf_counter()
+
+    assert len(ref) == len(new)
+    for i, (a, b) in enumerate(zip(ref, new)):
+        if a != b or any(type(a[k]) is not type(b[k]) for k in a):
+            diff = {k: (a[k], b[k]) for k in a if a[k] != b[k] or type(a[k]) is not type(b[k])}
+            raise AssertionError(f"ligne {i} différente : {diff}")
+
+    print(f"{n} lignes × {len(TABLE_COLS)} colonnes — payloads identiques")
+    print(f"  cellule par cellule : {t1 - t0:8.3f} s")
+    print(f"  colonnaire          : {t2 - t1:8.3f} s   (×{(t1 - t0) / max(t2 - t1, 1e-9):.1f})")
+    for col, rep in report.items():
+        print(f"  {col:<26} format={rep['format']!r}  vectorisé={rep['vectorized']}  "
+              f"chemin lent={rep['fallback']}  illisibles={rep['failed']}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,13 @@
+# conftest.py — Configuration pytest (tests dans tests/)
+#
+# Les modules lisent st.secrets à l'import (CACHE_TTL_S, CHART_WIDTH_PX…) ; hors `streamlit run`
+# et sans .streamlit/secrets.toml, Streamlit lève une erreur. On pointe donc vers un fichier de
+# secrets vide : chaque module retombe sur ses valeurs par défaut.
+import os
+import tempfile
+
+from streamlit import config
+
+_SECRETS = os.path.join(tempfile.mkdtemp(prefix="tests-secrets-"), "secrets.toml")
+open(_SECRETS, "w").close()
+config.set_option("secrets.files", [_SECRETS])
@@ -11,6 +11,10 @@ st.session_state["user"] = {"id": u.user.id, "email": u.user.email}
 
 from datetime import date
 
+from utils_zones import load_zone_index, day_zones_from_index, ZONE_COLS
+from utils_cache import bump_data_version
+from utils_rollup import refresh_days
+
 st.set_page_config(page_title="Saisie — Journal", layout="wide")
 
 from utils_ui import inject_base_css, hero, section, stat_cards, callout, app_footer
@@ -143,12 +147,18 @@ with st.container(border=True):
         ppm       = cM.number_input("PPM",        min_value=0, step=1, value=0)
 
         # Ligne 5 : Zones côte à côte (ENTIERS) avec libellés clairs en %
+        # Pré-remplies avec les zones calculées depuis la FC des traces du jour, si importées
+        auto_zones = day_zones_from_index(load_zone_index(user["id"]), [dt.isoformat()])
+        zdef = ([int(round(float(auto_zones.iloc[0][c]))) for c in ZONE_COLS]
+                if len(auto_zones) else [0] * len(ZONE_COLS))
         z1c, z2c, z3c, z4c, z5c = st.columns(5)
-        z1 = z1c.number_input("Zone 1 (%)", min_value=0, max_value=100, value=0, step=1)
-        z2 = z2c.number_input("Zone 2 (%)", min_value=0, max_value=100, value=0, step=1)
-        z3 = z3c.number_input("Zone 3 (%)", min_value=0, max_value=100, value=0, step=1)
-        z4 = z4c.number_input("Zone 4 (%)", min_value=0, max_value=100, value=0, step=1)
-        z5 = z5c.number_input("Zone 5 (%)", min_value=0, max_value=100, value=0, step=1)
+        z1 = z1c.number_input("Zone 1 (%)", min_value=0, max_value=100, value=zdef[0], step=1)
+        z2 = z2c.number_input("Zone 2 (%)", min_value=0, max_value=100, value=zdef[1], step=1)
+        z3 = z3c.number_input("Zone 3 (%)", min_value=0, max_value=100, value=zdef[2], step=1)
+        z4 = z4c.number_input("Zone 4 (%)", min_value=0, max_value=100, value=zdef[3], step=1)
+        z5 = z5c.number_input("Zone 5 (%)", min_value=0, max_value=100, value=zdef[4], step=1)
+        if len(auto_zones):
+            st.caption("Zones calculées automatiquement depuis la fréquence cardiaque des traces du jour.")
 
         zones_sum = z1 + z2 + z3 + z4 + z5
         if zones_sum > 0 and abs(zones_sum - 100) > 3:
@@ -216,7 +226,12 @@ if submit_clicked:
                 payload[k] = None
 
         sb.table("journal").insert(payload).execute()
+        bump_data_version(user["id"])
         st.success("Ligne enregistrée ✔")
+        try:
+            refresh_days(sb, user["id"], [dt.isoformat()], journal=True)
+        except Exception as e:
+            st.warning(f"Agrégats non mis à jour : {e}")
     except Exception as e:
         st.error(f"Erreur d’enregistrement : {e}")
 
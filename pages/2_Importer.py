@@ -1,10 +1,7 @@
 # pages/02_Importer.py
-import io
-import re
-import math
-import unicodedata
-from datetime import datetime, timezone
-from typing import Dict, Any, List, Tuple
+import hashlib
+import zipfile
+from typing import Dict, Any, List, Optional, Tuple
 
 import pandas as pd
 import streamlit as st
@@ -18,304 +15,28 @@ st.set_page_config(page_title="Importer — Strava", layout="wide")
 from utils_ui import inject_base_css, hero, section, stat_cards, callout, app_footer
 inject_base_css()
 
-# =========================
-# Helpers
-# =========================
-_NUMERIC_STR_RE = re.compile(r'^[+-]?\d+(?:[.,]\d+)?$')  # ← gère , et .
-
-def _looks_numeric_str(s: Any) -> bool:
-    return isinstance(s, str) and _NUMERIC_STR_RE.match(s.strip() or "") is not None
-
-def _coerce_numeric_str_any(s: Any):
-    """'7'/'7.0'/'7,0'/'-3,50' -> int ou float ; sinon inchangé."""
-    if s is None:
-        return s
-    # si c'est déjà un nombre
-    if isinstance(s, (int, float)):
-        try:
-            if isinstance(s, float) and not math.isfinite(s):
-                return None
-            return s
-        except Exception:
-            return None
-    if not isinstance(s, str):
-        return s
-    raw = s.strip()
-    if raw == "":
-        return None
-    if _looks_numeric_str(raw):
-        # virgule décimale -> point si pas déjà de point
-        if "," in raw and "." not in raw:
-            raw = raw.replace(",", ".")
-        try:
-            f = float(raw)
-        except Exception:
-            return s
-        if math.isfinite(f) and float(f).is_integer():
-            return int(f)
-        return f if math.isfinite(f) else None
-    return s
-
-def _snake(s: str) -> str:
-    if s is None:
-        return s
-    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
-    s = s.strip().lower()
-    s = s.replace(".", "_").replace("-", "_").replace("/", "_").replace(" ", "_").replace("’", "_").replace("'", "_")
-    while "__" in s:
-        s = s.replace("__", "_")
-    return s
-
-def _to_bool(x):
-    if x is None or (isinstance(x, float) and pd.isna(x)): return None
-    if isinstance(x, bool): return x
-    s = str(x).strip().lower()
-    if s in ("true","1","yes","y","vrai","oui"):  return True
-    if s in ("false","0","no","n","faux","non"):  return False
-    return None
-
-def _to_int(x):
-    if x is None or (isinstance(x, float) and pd.isna(x)) or str(x).strip()=="":
-        return None
-    x = _coerce_numeric_str_any(x)
-    try:
-        return int(x)
-    except Exception:
-        try:
-            return int(float(str(x).strip()))
-        except Exception:
-            return None
-
-def _to_float(x):
-    if x is None or (isinstance(x, float) and pd.isna(x)) or str(x).strip()=="":
-        return None
-    x = _coerce_numeric_str_any(x)
-    try:
-        v = float(x)
-        return v if math.isfinite(v) else None
-    except Exception:
-        return None
-
-def _to_time(s):
-    """Renvoie 'HH:MM:SS' ou None (JSON-safe)."""
-    if s is None or (isinstance(s, float) and pd.isna(s)) or str(s).strip()=="":
-        return None
-    txt = str(s).strip()
-    for fmt in ("%H:%M:%S", "%H:%M"):
-        try:
-            t = datetime.strptime(txt, fmt).time()
-            return t.strftime("%H:%M:%S")
-        except Exception:
-            continue
-    return None
-
-def _to_timestamptz(s):
-    """Renvoie ISO 8601 (UTC si pas de tz) ou None."""
-    if s is None or (isinstance(s, float) and pd.isna(s)) or str(s).strip()=="":
-        return None
-    txt = str(s).strip()
-    for fmt in ("%Y-%m-%d %H:%M:%S%z", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d", "%d/%m/%Y"):
-        try:
-            dt = datetime.strptime(txt, fmt)
-            if dt.tzinfo is None:
-                dt = dt.replace(tzinfo=timezone.utc)
-            return dt.isoformat()
-        except Exception:
-            continue
-    try:
-        dt = pd.to_datetime(txt, utc=True)
-        return dt.isoformat()
-    except Exception:
-        # fallback contrôlé
-        return None
-
-# =========================
-# Conversions spécifiques
-# =========================
-def _sec_to_min_int(x):
-    """secondes -> minutes (entier, arrondi)."""
-    v = _to_float(x)
-    if v is None: return None
-    return int(round(v / 60.0))
-
-def _sec_to_min_float(x):
-    """secondes -> minutes (float)."""
-    v = _to_float(x)
-    if v is None: return None
-    return v / 60.0
-
-def _ms_to_min_per_km(x):
-    """m/s -> min/km."""
-    v = _to_float(x)
-    if v is None or v == 0: return None
-    return 1000.0 / (v * 60.0)  # = 16.6666667 / v
-
-# =========================
-# Schéma / Types (identiques à ta version)
-# =========================
-TABLE_COLS = [
-    "activity_id","activity_date","activity_name","activity_type","activity_description",
-    "elapsed_time","distance","max_heart_rate","relative_effort","commute","activity_private_note",
-    "activity_gear","filename","athlete_weight",
-    # "bike_weight" SUPPRIMÉ
-    # "elapsed_time_1" SUPPRIMÉ
-    "moving_time",
-    # "distance_1" SUPPRIMÉ
-    "max_speed","average_speed","elevation_gain","elevation_loss","elevation_low",
-    "elevation_high","max_grade","average_grade","average_positive_grade","average_negative_grade",
-    "max_cadence","average_cadence","max_heart_rate_1","average_heart_rate",
-    # "max_watts","average_watts" SUPPRIMÉS
-    "calories","max_temperature","average_temperature","relative_effort_1",
-    "total_work","number_of_runs","uphill_time","downhill_time","other_time","perceived_exertion",
-    "type_text","start_time","weighted_average_power","power_count","prefer_perceived_exertion",
-    "perceived_relative_effort","commute_1","total_weight_lifted","from_upload","grade_adjusted_distance",
-    "weather_observation_time","weather_condition","weather_temperature","apparent_temperature",
-    "dewpoint","humidity","weather_pressure","wind_speed","wind_gust","wind_bearing",
-    "precipitation_intensity",
-    # "sunrise_time","sunset_time" SUPPRIMÉS
-    "moon_phase",
-    # "bike_text","gear_text" SUPPRIMÉS
-    "precipitation_probability","precipitation_type","cloud_cover","weather_visibility","uv_index",
-    "weather_ozone","jump_count","total_grit","average_flow","flagged","average_elapsed_speed",
-    "dirt_distance","newly_explored_distance","newly_explored_dirt_distance","activity_count",
-    "total_steps",
-    # "carbon_saved" SUPPRIMÉ
-    "pool_length","training_load","intensity",
-    "average_grade_adjusted_pace","timer_time","total_cycles","recovery","with_pet","competition",
-    "long_run","for_a_cause","media_text",
-]
-
-# En-têtes anglais spéciaux déjà gérés
-SPECIAL_HEADER_MAP = {"type":"type_text","media":"media_text","bike":"bike_text","gear":"gear_text"}
-
-# === Mapping des en-têtes FR normalisés -> colonnes cibles ===
-FR_HEADER_MAP = {
-    "id_de_l_activite": "activity_id",
-    "date_de_l_activite": "activity_date",
-    "nom_de_l_activite": "activity_name",
-    "type_d_activite": "activity_type",
-    "description_de_l_activite": "activity_description",
-    "temps_ecoule": "elapsed_time",
-    "distance": "distance",
-    "frequence_cardiaque_max": "max_heart_rate",
-    "effort_relatif": "relative_effort",
-    "deplacement_transport": "commute",
-    "note_privee_sur_les_activites": "activity_private_note",
-    "materiel_utilise_pour_l_activite": "activity_gear",
-    "nom_du_fichier": "filename",
-    "poids_de_l_athlete": "athlete_weight",
-    "poids_du_velo": "bike_weight",
-    "temps_ecoule_1": "elapsed_time_1",
-    "temps_en_mouvement": "moving_time",
-    "distance_1": "distance_1",
-    "vitesse_max": "max_speed",
-    "vitesse_moyenne": "average_speed",
-    "denivele_positif": "elevation_gain",
-    "denivele_negatif": "elevation_loss",
-    "altitude_min": "elevation_low",
-    "altitude_max": "elevation_high",
-    "pente_max": "max_grade",
-    "pente_moyenne": "average_grade",
-    "pente_positive_moyenne": "average_positive_grade",
-    "pente_negative_moyenne": "average_negative_grade",
-    "cadence_max": "max_cadence",
-    "cadence_moyenne": "average_cadence",
-    "frequence_cardiaque_max_1": "max_heart_rate_1",
-    "frequence_cardiaque_moyenne": "average_heart_rate",
-    "calories": "calories",
-    "temperature_max": "max_temperature",
-    "temperature_moyenne": "average_temperature",
-    "effort_relatif_1": "relative_effort_1",
-    "effort_total": "total_work",
-    "nombre_de_sorties_course_a_pied": "number_of_runs",
-    "temps_de_montee": "uphill_time",
-    "temps_de_descente": "downhill_time",
-    "autres_temps": "other_time",
-    "effort_ressenti": "perceived_exertion",
-    "type": "type_text",
-    "heure_de_debut": "start_time",
-    "puissance_moyenne_ponderee": "weighted_average_power",
-    "nombre_d_echantillons_de_puissance": "power_count",
-    "utiliser_l_effort_ressenti": "prefer_perceived_exertion",
-    "effort_relatif_ressenti": "perceived_relative_effort",
-    "deplacement_transport_1": "commute_1",
-    "poids_total_souleve": "total_weight_lifted",
-    "depuis_un_import": "from_upload",
-    "importe": "from_upload",
-    "distance_ajustee_selon_la_pente": "grade_adjusted_distance",
-    "heure_d_observation_meteo": "weather_observation_time",
-    "conditions_meteo": "weather_condition",
-    "temperature": "weather_temperature",
-    "temperature_ressentie": "apparent_temperature",
-    "point_de_rosee": "dewpoint",
-    "humidite": "humidity",
-    "pression_meteo": "weather_pressure",
-    "vitesse_du_vent": "wind_speed",
-    "rafale_de_vent": "wind_gust",
-    "direction_du_vent": "wind_bearing",
-    "intensite_des_precipitations": "precipitation_intensity",
-    "phase_lunaire": "moon_phase",
-    "probabilite_de_precipitations": "precipitation_probability",
-    "type_de_precipitations": "precipitation_type",
-    "nebulosite": "cloud_cover",
-    "visibilite_meteo": "weather_visibility",
-    "indice_uv": "uv_index",
-    "ozone_meteo": "weather_ozone",
-    "sauts": "jump_count",
-    "grit_total": "total_grit",
-    "flow_moyen": "average_flow",
-    "signale": "flagged",
-    "vitesse_moyenne_ecoulee": "average_elapsed_speed",
-    "distance_sur_route_non_goudronnee": "dirt_distance",
-    "distance_nouvellement_exploree": "newly_explored_distance",
-    "distance_nouvellement_exploree_sur_route_non_goudronnee": "newly_explored_dirt_distance",
-    "nombre_d_activites": "activity_count",
-    "nombre_total_de_pas": "total_steps",
-    # "co2_economise": "carbon_saved",
-    "longueur_de_piscine": "pool_length",
-    "charge_d_entrainement": "training_load",
-    "intensite": "intensity",
-    "vitesse_moyenne_ajustee_selon_la_pente": "average_grade_adjusted_pace",
-    "temps_enregistre_par_le_chronometre": "timer_time",
-    "nombre_total_de_cycles": "total_cycles",
-    "recuperation": "recovery",
-    "avec_mon_animal_de_compagnie": "with_pet",
-    "competition": "competition",
-    "sortie_longue": "long_run",
-    "pour_la_bonne_cause": "for_a_cause",
-    "support": "media_text",
-}
-
-# Types par colonne
-BOOL_COLS  = {"commute","prefer_perceived_exertion","commute_1","from_upload","flagged","with_pet","competition","long_run","for_a_cause"}
-INT_COLS   = {"elapsed_time","activity_id","uphill_time","downhill_time","other_time","power_count","perceived_relative_effort","relative_effort_1","number_of_runs","jump_count","total_cycles","timer_time","max_heart_rate_1","average_heart_rate","total_steps"}
-TIME_COLS  = {"start_time"}
-TS_COLS    = {"activity_date","weather_observation_time"}
-
-FLOAT_COLS = set(TABLE_COLS) - BOOL_COLS - INT_COLS - TIME_COLS - TS_COLS - {
-    "type_text","activity_name","activity_type","activity_description","activity_private_note",
-    "activity_gear","filename","weather_condition","precipitation_type","media_text"
-}
-TEXT_COLS  = set(TABLE_COLS) - (BOOL_COLS | INT_COLS | TIME_COLS | TS_COLS | FLOAT_COLS)
-
-def _text_conv(x):
-    if x is None or (isinstance(x, float) and pd.isna(x)) or str(x).strip()=="":
-        return None
-    return str(x)
-
-CONVERTER_BY_COL: Dict[str, Any] = {}
-for c in BOOL_COLS:  CONVERTER_BY_COL[c] = _to_bool
-for c in INT_COLS:   CONVERTER_BY_COL[c] = _to_int
-for c in FLOAT_COLS: CONVERTER_BY_COL[c] = _to_float
-for c in TIME_COLS:  CONVERTER_BY_COL[c] = _to_time
-for c in TS_COLS:    CONVERTER_BY_COL[c] = _to_timestamptz
-for c in TEXT_COLS:  CONVERTER_BY_COL[c] = _text_conv
-
-# Distances Strava : déjà en km
-DIST_M_COLS = set()  # (désactivé)
-
-# Doublons: tolérances (sur km / mètres)
-D_TOL_KM, DPLUS_TOL, DMOINS_TOL = 0.2, 50.0, 50.0
+from utils_import import (
+    TABLE_COLS, FR_HEADER_MAP, SPECIAL_HEADER_MAP, RUN_TYPES_CANON,
+    _snake, _json_safe_row, _normalize_activity_type_value,
+    STREAM_CHUNK_ROWS, STREAM_THRESHOLD_BYTES,
+    convert_frame, frame_to_payloads, read_runs_streaming, match_duplicates, fill_missing,
+    ImportCache, upload_digest, DECISIONS, collect_actions, review_frame,
+    HighWaterMark, drop_known,
+)
+from utils_db import WRITE_BATCH_SIZE, fetch_by_ids, bulk_upsert, fetch_date_range, fetch_known_keys
+from utils_tracks import find_activities_csv, link_entries, parse_zip_tracks, track_summary
+from utils_streams import open_store
+from utils_efforts import update_index
+from utils_splits import analyse_batch, save_results as save_split_results
+from utils_routes import fingerprint_many, load_route_index, update_route_index, route_check
+from utils_heatmap import HeatmapStore
+from utils_cache import CACHE_TTL_S, bump_data_version, data_version
+from utils_load import update_training_load
+from utils_rollup import ensure_cube, refresh_days, rebuild_cube
+from utils_zones import (
+    zone_bounds, compute_zones, zones_from_store, update_zone_index, daily_zone_percentages,
+    day_zones_from_index, write_journal_zones,
+)
 
 # =========================
 # Auth
@@ -328,101 +49,378 @@ user = st.session_state["user"]
 st.title("📥 Importer — Strava (CSV)")
 sidebar_logout_bottom(sb)
 
+# =========================
+# DB I/O
+# =========================
+EXISTING_COLS = ["id","user_id","activity_id","activity_date","activity_name","activity_type",
+                 "distance","elevation_gain","elevation_loss","moving_time"]
+
+def fetch_existing_rows(min_dt_iso: str, max_dt_iso: str) -> pd.DataFrame:
+    """Lignes existantes sur [min, max[ : sous-plages parallèles paginées par (activity_date, id),
+    donc aucune troncature par le plafond de lignes PostgREST."""
+    return fetch_date_range(sb, "strava_import", EXISTING_COLS, user["id"], min_dt_iso, max_dt_iso)
+
+# `_sb` hors de la clé de cache ; la version des données l'invalide à chaque import
+@st.cache_data(ttl=CACHE_TTL_S, show_spinner=False)
+def _history_dates_cached(_sb, user_id: str, version: int) -> Dict[int, Any]:
+    known = fetch_date_range(_sb, "strava_import", ["activity_id"], user_id,
+                             "1970-01-01", pd.Timestamp.now(tz="UTC") + pd.Timedelta(days=1))
+    known = known.dropna(subset=["activity_id"])
+    return dict(zip(known["activity_id"].astype("int64"), known["activity_date"]))
+
+def _history_dates(user_id: Any) -> Dict[int, Any]:
+    """{activity_id: activity_date} de tout l'historique (traitements des traces)."""
+    return _history_dates_cached(sb, str(user_id), data_version(user_id))
+
+WRITE_BATCH = int(st.secrets.get("IMPORT_BATCH_SIZE", WRITE_BATCH_SIZE))
+STREAM_STORE = open_store(sb, st.secrets.get("STREAMS_BUCKET"))
+
+def _hr_max_from_history() -> Optional[float]:
+    res = (sb.table("strava_import")
+             .select("max_heart_rate")
+             .eq("user_id", user["id"])
+             .not_.is_("max_heart_rate", "null")
+             .order("max_heart_rate", desc=True)
+             .limit(1)
+           ).execute()
+    return float(res.data[0]["max_heart_rate"]) if res.data else None
+
+def apply_zones(zone_seconds: Dict[Any, Any], dates: Dict[Any, Any]) -> None:
+    """Index local des zones par activité + pourcentages du jour écrits dans le journal."""
+    if not zone_seconds:
+        return
+    idx = update_zone_index(user["id"], zone_seconds, dates)
+    days = daily_zone_percentages(zone_seconds, dates)["date"]
+    res = write_journal_zones(sb, user["id"], day_zones_from_index(idx, days))
+    if res["updated"]:
+        bump_data_version(user["id"])
+    msg = (f"Zones FC : {len(zone_seconds)} activité(s) → journal ({res['updated']} jour(s) mis à jour, "
+           f"{res['skipped']} saisi(s) à la main conservé(s))")
+    if res["failed"]:
+        st.warning(f"{msg} — {res['failed']} écriture(s) en échec.")
+    else:
+        st.caption(msg)
+
+def run_splits(activity_ids) -> int:
+    """Splits / D+ lissé / GAP des traces enregistrées ; les traces en échec sont listées."""
+    paths = {aid: STREAM_STORE.local_path(user["id"], aid) for aid in activity_ids}
+    results, errors = analyse_batch({a: p for a, p in paths.items() if p})
+    errors.update({a: "trace absente du cache local" for a, p in paths.items() if not p})
+    if errors:
+        # pas d'expander : aussi appelé depuis l'expander « Traitements des traces »
+        st.warning(f"Splits / GAP : {len(errors)} trace(s) en échec.")
+        st.dataframe(pd.DataFrame({"activity_id": list(errors), "erreur": list(errors.values())}),
+                     hide_index=True)
+    return save_split_results(user["id"], results)
+
+def save_tracks(entry: Dict[str, Any], written: List[Dict[str, Any]]) -> None:
+    """Enregistre les traces (import ZIP) des activités effectivement écrites, puis met à jour
+    l'index des meilleurs efforts pour ces seules activités."""
+    tracks = entry.get("tracks")
+    if not tracks:
+        return
+    dates = {p.get("activity_id"): p.get("activity_date") for p in written}
+    todo = {aid: s for aid, s in tracks.items() if aid in dates}
+    n = STREAM_STORE.save_many(user["id"], todo)
+    update_index(user["id"], todo, dates)
+    routes = entry.get("routes") or {}
+    update_route_index(user["id"], {aid: routes[aid] for aid in todo if aid in routes}, dates)
+    heat = HeatmapStore(user["id"]).add_tracks(todo)
+    if heat["activities"]:
+        st.caption(f"Carte de chaleur : {heat['points']} point(s) ajouté(s), {heat['tiles']} tuile(s) à redessiner")
+    if n:
+        st.caption(f"Traces enregistrées : {n} (meilleurs efforts mis à jour)")
+    if ZONE_BOUNDS is not None:
+        apply_zones(compute_zones(todo, ZONE_BOUNDS), dates)
+    # splits / D+ lissé / GAP : les processus relisent les traces depuis le cache local
+    n_split = run_splits(todo)
+    if n_split:
+        st.caption(f"Splits, D+ lissé et GAP recalculés : {n_split} activité(s)")
+
+def do_upserts(rows_insert: List[Dict[str, Any]],
+               rows_replace: List[Tuple[int, Dict[str, Any]]],
+               rows_combine: List[Tuple[int, Dict[str, Any]]],
+               batch_size: int = WRITE_BATCH) -> List[Dict[str, Any]]:
+    """Écritures groupées : inserts, remplacements et fusions envoyés en upserts par lots.
+    Les cibles 'combine' sont lues en une requête in_ par lot, la fusion est faite ici.
+    Retourne le rapport par lot (voir bulk_upsert)."""
+    report: List[Dict[str, Any]] = []
+    # horodatage explicite (pas de trigger en base) : la synchro incrémentale de Questions s'y fie
+    stamp = {"updated_at": pd.Timestamp.now(tz="UTC").isoformat()}
+    if rows_insert:
+        report += bulk_upsert(sb, "strava_import", [_json_safe_row({**r, **stamp}) for r in rows_insert],
+                              on_conflict="user_id,activity_id", label="insert", batch_size=batch_size)
+    old_dates: List[Any] = []
+    if rows_replace:
+        # ancienne date des lignes remplacées : une activité redatée doit quitter son ancien jour
+        # dans les agrégats et la charge
+        old_dates = [r.get("activity_date") for r in fetch_by_ids(
+            sb, "strava_import", [db_id for db_id, _ in rows_replace], user["id"],
+            columns="id,activity_date", batch_size=batch_size).values()]
+        replaced = [_json_safe_row({**payload, **stamp, "id": db_id, "user_id": user["id"]})
+                    for db_id, payload in rows_replace]
+        report += bulk_upsert(sb, "strava_import", replaced, on_conflict="id",
+                              label="replace", batch_size=batch_size)
+    if rows_combine:
+        current = fetch_by_ids(sb, "strava_import", [db_id for db_id, _ in rows_combine],
+                               user["id"], batch_size=batch_size)
+        merged = []
+        for db_id, payload in rows_combine:
+            curr = current.get(db_id)
+            if not curr: continue
+            to_set = fill_missing(curr, payload)
+            if to_set:
+                row = {k: curr.get(k) for k in TABLE_COLS}
+                row.update(to_set)
+                merged.append(_json_safe_row({**row, **stamp, "id": db_id, "user_id": user["id"]}))
+        report += bulk_upsert(sb, "strava_import", merged, on_conflict="id",
+                              label="combine", batch_size=batch_size)
+    # au moins un lot écrit : les lectures en cache (Stats…) de l'utilisateur sont périmées
+    if any(b["ok"] and b["rows"] for b in report):
+        bump_data_version(user["id"])
+        # charge d'entraînement : recalculée seulement à partir du plus ancien jour écrit
+        written = rows_insert + [p for _, p in rows_replace] + [p for _, p in rows_combine]
+        dates = pd.to_datetime(pd.Series([p.get("activity_date") for p in written] + old_dates, dtype=object),
+                               utc=True, errors="coerce", format="ISO8601")
+        try:
+            update_training_load(sb, user["id"], since=dates.min() if dates.notna().any() else None)
+        except Exception as e:
+            st.warning(f"Charge d'entraînement non mise à jour : {e}")
+        # agrégats jour / semaine / mois / année : seulement les périodes des jours écrits ; sans
+        # cube sur cette instance, construit en entier (l'import est l'endroit où l'attente est prévue)
+        try:
+            if not refresh_days(sb, user["id"], dates.dropna()):
+                ensure_cube(sb, user["id"])
+        except Exception as e:
+            st.warning(f"Agrégats non mis à jour : {e}")
+    return report
+
+def _write_report_ok(report: List[Dict[str, Any]]) -> bool:
+    """Affiche les lots en échec (s'il y en a) ; True si tout est passé."""
+    failed = [b for b in report if not b["ok"]]
+    if failed:
+        st.error(f"{len(failed)} lot(s) en échec sur {len(report)} — "
+                 f"{sum(b['rows'] for b in failed)} ligne(s) non écrite(s).")
+    if len(report) > 1 or failed:
+        with st.expander("Détail des lots", expanded=bool(failed)):
+            st.dataframe(pd.DataFrame(report), use_container_width=True)
+    return not failed
+
 # =========================
 # UI
 # =========================
-st.markdown("Charge ton fichier **activities.csv** exporté depuis Strava (anglais **ou** français).")
-up = st.file_uploader("Déposer le CSV Strava", type=["csv"], accept_multiple_files=False)
+st.markdown("Charge ton fichier **activities.csv** exporté depuis Strava (anglais **ou** français), "
+            "ou l'**archive ZIP** complète de l'export (traces GPX / TCX / FIT comprises).")
+up = st.file_uploader("Déposer le CSV Strava ou l'export ZIP", type=["csv", "zip"], accept_multiple_files=False)
+
+# -- Zones cardiaques : seuils utilisés pour calculer pct_zone*_course depuis les traces
+with st.expander("❤️ Zones cardiaques (calculées depuis la FC des traces)", expanded=False):
+    if "hr_max_default" not in st.session_state:
+        st.session_state.hr_max_default = st.secrets.get("HR_MAX") or _hr_max_from_history() or 190
+    zc1, zc2 = st.columns(2)
+    hr_max = zc1.number_input("FC max (bpm)", min_value=100, max_value=240,
+                              value=int(st.session_state.hr_max_default), step=1,
+                              help="Par défaut : HR_MAX (secrets) ou la FC max la plus haute de l'historique.")
+    bounds_txt = zc2.text_input("Seuils personnalisés (bpm, optionnel)", placeholder="ex: 120, 140, 155, 170",
+                                help="4 valeurs séparant Z1|Z2|Z3|Z4|Z5. Vide : 60/70/80/90 % de la FC max.")
+    try:
+        ZONE_BOUNDS = zone_bounds(hr_max, [float(x) for x in bounds_txt.replace(";", ",").split(",") if x.strip()])
+        st.caption("Seuils : " + " | ".join(f"{b:.0f}" for b in ZONE_BOUNDS) + " bpm")
+    except ValueError as e:
+        ZONE_BOUNDS = None
+        st.warning(f"Seuils invalides : {e}")
+
+    if ZONE_BOUNDS is not None and st.button("Recalculer les zones de tout l'historique"):
+        stored = STREAM_STORE.activity_ids(user["id"])
+        if not stored:
+            st.info("Aucune trace enregistrée : importe d'abord l'export ZIP.")
+        else:
+            hist_dates = _history_dates(user["id"])
+            with st.spinner(f"Calcul des zones pour {len(stored)} activité(s)…"):
+                apply_zones(zones_from_store(STREAM_STORE, user["id"], stored, ZONE_BOUNDS), hist_dates)
+
+with st.expander("🧮 Traitements des traces (historique)", expanded=False):
+    st.caption("Recalcule, pour toutes les traces enregistrées, les splits au km, le dénivelé lissé "
+               "et l'allure ajustée à la pente (en parallèle sur tous les cœurs), les meilleurs efforts, "
+               "ou l'index des parcours utilisé pour les doublons et les parcours répétés. "
+               "Ces index sont stockés sur le disque du serveur : à reconstruire après un redéploiement.")
+    if st.button("Recalculer splits, D+ lissé et GAP"):
+        stored = STREAM_STORE.activity_ids(user["id"])
+        if not stored:
+            st.info("Aucune trace enregistrée : importe d'abord l'export ZIP.")
+        else:
+            with st.spinner(f"Analyse de {len(stored)} trace(s)…"):
+                n_split = run_splits(stored)
+            st.success(f"{n_split} activité(s) analysée(s).")
+    if st.button("Recalculer les meilleurs efforts"):
+        stored = STREAM_STORE.activity_ids(user["id"])
+        if not stored:
+            st.info("Aucune trace enregistrée : importe d'abord l'export ZIP.")
+        else:
+            hist_dates = _history_dates(user["id"])
+            with st.spinner(f"Meilleurs efforts de {len(stored)} trace(s)…"):
+                tracks = {aid: STREAM_STORE.load(user["id"], aid, channels=["time", "lat", "lon", "dist"])
+                          for aid in stored}
+                n_eff = update_index(user["id"], {a: t for a, t in tracks.items() if t}, hist_dates)
+            st.success(f"{n_eff} activité(s) indexée(s).")
+    if st.button("Reconstruire l'index des parcours"):
+        stored = STREAM_STORE.activity_ids(user["id"])
+        if not stored:
+            st.info("Aucune trace enregistrée : importe d'abord l'export ZIP.")
+        else:
+            hist_dates = _history_dates(user["id"])
+            with st.spinner(f"Empreintes de {len(stored)} parcours…"):
+                fps = fingerprint_many({aid: STREAM_STORE.load(user["id"], aid, channels=["time", "lat", "lon"])
+                                        for aid in stored})
+                idx = update_route_index(user["id"], fps, hist_dates)
+            st.success(f"{len(idx)} parcours indexé(s).")
+    st.caption("Les agrégats suivent les imports et le journal ; une activité supprimée en base ou "
+               "modifiée hors de l'application n'y disparaît qu'après reconstruction.")
+    if st.button("Reconstruire les agrégats (jour / semaine / mois / année)"):
+        with st.spinner("Agrégation de tout l'historique…"):
+            cube = rebuild_cube(sb, user["id"])
+        st.success(f"Agrégats : {len(cube)} ligne(s).")
+    if st.button("Reconstruire la carte de chaleur"):
+        stored = STREAM_STORE.activity_ids(user["id"])
+        heat_store = HeatmapStore(user["id"])
+        heat_store.reset()
+        with st.spinner(f"Points GPS de {len(stored)} trace(s)…"):
+            heat = heat_store.add_tracks({aid: STREAM_STORE.load(user["id"], aid, channels=["lat", "lon"])
+                                          for aid in stored})
+        st.success(f"Carte de chaleur : {heat['activities']} activité(s), {heat['points']} point(s).")
 
 global_action_col, apply_col = st.columns([3,1])
 if "import_decisions" not in st.session_state:
     st.session_state.import_decisions = {}
 
 # =========================
-# Normalisation JSON — Garde-fou universel
+# Revue des doublons
 # =========================
-def _json_safe_row(row: Dict[str, Any]) -> Dict[str, Any]:
-    safe: Dict[str, Any] = {}
-    for k, v in row.items():
+REVIEW_PAGE_SIZE = 50   # lignes par page de revue
+REVIEW_GROUP_SIZE = 10  # lignes par fragment (re-rendu isolé)
+TABLE_PAGE_SIZE = 200   # lignes par page en mode tableau
+TABLE_MODE_THRESHOLD = 50  # au-delà de ce nombre de doublons, le mode tableau est proposé par défaut
+
+# st.fragment (récent) / st.experimental_fragment ; sinon rendu classique (toute la page)
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda f: f)
+
+def _render_review_row(i: int, new_row: Dict[str, Any], existing_row: Optional[Dict[str, Any]]):
+    box = st.container(border=True)
+    with box:
+        left, right = st.columns([3,2])
         try:
-            if pd.isna(v): v = None
+            date_lbl = pd.to_datetime(new_row.get("activity_date")).strftime("%Y-%m-%d %H:%M")
         except Exception:
-            pass
-        if isinstance(v, str) and _looks_numeric_str(v):
-            v = _coerce_numeric_str_any(v)
-        if isinstance(v, float) and math.isfinite(v) and float(v).is_integer():
-            v = int(v)
-        if isinstance(v, float) and not math.isfinite(v):
-            v = None
-        if isinstance(v, (pd.Timestamp, datetime)):
-            v = v.isoformat()
-        safe[k] = v
-    return safe
+            date_lbl = "?"
+
+        with left:
+            st.markdown(f"### {new_row.get('activity_name') or 'Activité'} — {date_lbl}")
+            st.caption(f"Type: {new_row.get('activity_type') or '-'} | Distance: {new_row.get('distance')} km | D+: {new_row.get('elevation_gain')} m | D-: {new_row.get('elevation_loss')} m")
+        with right:
+            key = f"choice_{i}"
+            if key not in st.session_state:
+                st.session_state[key] = st.session_state.import_decisions.get(i) or ("replace" if existing_row else "insert")
+            choice = st.radio(
+                f"Action pour la ligne #{i}",
+                options=DECISIONS,
+                captions=["Compléter la ligne DB avec les infos manquantes du CSV",
+                          "Remplacer entièrement la ligne DB par le CSV",
+                          "Ignorer cette ligne",
+                          "Insérer une nouvelle ligne quand même"],
+                key=key,
+                horizontal=True
+            )
+            st.session_state.import_decisions[i] = choice
+
+        if existing_row:
+            st.write("**Dans la base (potentiel doublon):**")
+            cdb1, cdb2, cdb3, cdb4 = st.columns(4)
+            cdb1.write(f"ID: `{existing_row['id']}`")
+            cdb2.write(f"Date: {existing_row.get('activity_date')}")
+            cdb3.write(f"Dist (km): {existing_row.get('distance')}")
+            cdb4.write(f"D+ / D-: {existing_row.get('elevation_gain')} / {existing_row.get('elevation_loss')}")
+        else:
+            st.info("Aucune ligne existante trouvée pour cette date/valeurs.")
 
-# =========================
-# DB I/O
-# =========================
-def fetch_existing_rows(min_dt_iso: str, max_dt_iso: str) -> List[Dict[str, Any]]:
-    sel = ["id","user_id","activity_id","activity_date","activity_name","activity_type",
-           "distance","elevation_gain","elevation_loss","moving_time"]
-    res = (sb.table("strava_import")
-             .select(",".join(sel))
-             .eq("user_id", user["id"])
-             .gte("activity_date", min_dt_iso)
-             .lte("activity_date", max_dt_iso)
-             .order("activity_date", desc=False)
-           ).execute()
-    return res.data or []
+        st.write("**Ligne importée (CSV):**")
+        cnp1, cnp2, cnp3, cnp4 = st.columns(4)
+        cnp1.write(f"Activity ID: {new_row.get('activity_id')}")
+        cnp2.write(f"Date: {new_row.get('activity_date')}")
+        cnp3.write(f"Dist (km): {new_row.get('distance')}")
+        cnp4.write(f"D+ / D-: {new_row.get('elevation_gain')} / {new_row.get('elevation_loss')}")
 
-def _finalize_payload(row_dict: Dict[str, Any]) -> Dict[str, Any]:
-    payload = {}
-    for k in TABLE_COLS:
-        conv = CONVERTER_BY_COL.get(k, lambda x: x)
-        payload[k] = conv(row_dict.get(k, None))
-    payload["user_id"] = user["id"]
-    return _json_safe_row(payload)
+        st.markdown("---")
 
-def do_upserts(rows_insert: List[Dict[str, Any]],
-               rows_replace: List[Tuple[int, Dict[str, Any]]],
-               rows_combine: List[Tuple[int, Dict[str, Any]]]):
-    if rows_insert:
-        sb.table("strava_import").upsert([_json_safe_row(r) for r in rows_insert],
-                                         on_conflict="user_id,activity_id").execute()
-    for db_id, payload in rows_replace:
-        sb.table("strava_import").update(_json_safe_row(payload)).eq("id", db_id).eq("user_id", user["id"]).execute()
-    for db_id, payload in rows_combine:
-        curr = sb.table("strava_import").select("*").eq("id", db_id).single().execute().data
-        if not curr: continue
-        to_set = {}
-        for k, v in payload.items():
-            if k in ("id","user_id","created_at","updated_at"): continue
-            if k not in TABLE_COLS: continue
-            if (curr.get(k) is None) and (v is not None and v != ""):
-                to_set[k] = v
-        if to_set:
-            sb.table("strava_import").update(_json_safe_row(to_set)).eq("id", db_id).eq("user_id", user["id"]).execute()
+@_fragment
+def review_group(rows: List[Tuple[int, Dict[str, Any], Optional[Dict[str, Any]]]]):
+    """Groupe de lignes rendu comme un fragment isolé."""
+    for i, new_row, existing_row in rows:
+        _render_review_row(i, new_row, existing_row)
+
+@_fragment
+def review_table(rows_to_show: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]):
+    """Revue en tableau : seules les lignes avec doublon, une colonne « decision » éditable.
+    Les lignes sans doublon gardent leur décision (insert par défaut)."""
+    decisions = st.session_state.import_decisions
+    frame = review_frame(rows_to_show, decisions)
+    n_free = len(rows_to_show) - len(frame)
+    if n_free:
+        st.caption(f"{n_free} ligne(s) sans doublon, non affichées : insérées par défaut "
+                   "(les actions globales s'y appliquent aussi).")
+
+    f1, f2 = st.columns([3,1])
+    n_total = len(frame)
+    shown = f1.multiselect("Filtrer par décision", DECISIONS, default=DECISIONS, key="review_table_filter")
+    frame = frame[frame["decision"].isin(shown)]
+    n_pages = max(1, -(-len(frame) // TABLE_PAGE_SIZE))
+    page_no = int(f2.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1, step=1,
+                                  key="review_table_page"))
+    page = frame.iloc[(page_no - 1) * TABLE_PAGE_SIZE: page_no * TABLE_PAGE_SIZE]
+
+    # Clé stable (génération des actions globales + page + filtre) : la grille garde ses
+    # modifications en attente. Elle est affichée sur un instantané de la page, pris à sa création,
+    # et chaque modification (edited_rows, par position) est rapportée à sa ligne via « ligne ».
+    view = hashlib.sha1(repr(sorted(shown)).encode()).hexdigest()[:8]
+    key = f"review_table_{st.session_state.get('review_table_gen', 0)}_{page_no}_{view}"
+    snapshots = st.session_state.setdefault("review_table_snapshots", {})
+    if key not in snapshots:
+        snapshots.clear()
+        snapshots[key] = page.reset_index(drop=True)
+    base = snapshots[key]
+    st.data_editor(
+        base,
+        hide_index=True,
+        use_container_width=True,
+        disabled=[c for c in base.columns if c != "decision"],
+        column_config={
+            "decision": st.column_config.SelectboxColumn("Décision", options=DECISIONS, required=True),
+        },
+        key=key,
+    )
+    for pos, change in st.session_state[key].get("edited_rows", {}).items():
+        if "decision" in change:
+            decisions[int(base.iloc[int(pos)]["ligne"])] = change["decision"]
+    st.caption(f"{len(frame)} doublon(s) affiché(s) sur {n_total}.")
 
 # =========================
-# Import
+# Parsing
 # =========================
-# Normalisation des valeurs de Type activité (FR/EN)
-RUN_TYPES_CANON = {"run", "trail_run", "virtual_run"}
-RUN_TYPES_FR_MAP = {
-    "course_a_pied": "run",
-    "course": "run",
-    "course_sur_sentier": "trail_run",
-    "course_a_pied_virtuelle": "virtual_run",
-}
-
-def _normalize_activity_type_value(v: Any) -> str:
-    if v is None:
-        return ""
-    s = _snake(str(v))
-    return RUN_TYPES_FR_MAP.get(s, s)  # garde l'anglais si déjà présent
+def parse_upload(up, stream_mode: bool, mark: Optional[HighWaterMark] = None,
+                 skipped: Optional[Dict[str, int]] = None) -> Tuple[pd.DataFrame, int, Dict[str, Dict[str, Any]]]:
+    """CSV déposé -> (runs convertis, nb de lignes lues, rapport des dates). Stoppe la page si
+    le fichier est inexploitable. Avec `mark`, les lignes déjà en base sont écartées avant typage."""
+    parse_report: Dict[str, Dict[str, Any]] = {}
+    if stream_mode:
+        up.seek(0)
+        try:
+            df, before = read_runs_streaming(up, report=parse_report, mark=mark, skipped=skipped)
+        except ValueError:
+            st.warning("Colonne `activity_type` absente : impossible de filtrer les 'run'.")
+            st.stop()
+        return df, before, parse_report
 
-if up:
-    raw = up.read()
-    df = pd.read_csv(io.BytesIO(raw))
+    up.seek(0)
+    df = pd.read_csv(up)
 
     # -- Headers normalisés
     original_cols = list(df.columns)
@@ -444,11 +442,6 @@ if up:
         df["__atype_norm"] = df["activity_type"].map(_normalize_activity_type_value)
         before = len(df)
         df = df[df["__atype_norm"].isin(RUN_TYPES_CANON)].drop(columns=["__atype_norm"])
-        if len(df) == 0:
-            st.warning("Aucune activité de type course (run) trouvée dans ce CSV.")
-            st.stop()
-        else:
-            st.caption(f"Filtre 'run' appliqué : {len(df)}/{before} lignes conservées.")
     else:
         st.warning("Colonne `activity_type` absente : impossible de filtrer les 'run'.")
         st.stop()
@@ -468,96 +461,181 @@ if up:
             df[col] = None
     df = df[TABLE_COLS]
 
-    # ========= Transformations AVANT typage final =========
-
-    # elapsed_time (s) -> minutes (int arrondi)
-    if "elapsed_time" in df.columns:
-        df["elapsed_time"] = df["elapsed_time"].map(_sec_to_min_int)
-
-    # moving_time (s) -> minutes (float)
-    if "moving_time" in df.columns:
-        df["moving_time"] = df["moving_time"].map(_sec_to_min_float)
-
-    # Vitesse (m/s) -> allure (min/km)
-    if "max_speed" in df.columns:
-        df["max_speed"] = df["max_speed"].map(_ms_to_min_per_km)
-    if "average_speed" in df.columns:
-        df["average_speed"] = df["average_speed"].map(_ms_to_min_per_km)
+    # -- Import incrémental : lignes déjà connues écartées avant le typage
+    if mark is not None:
+        df = drop_known(df, mark, skipped)
 
-    # Cadence rpm -> ppm (×2)
-    if "max_cadence" in df.columns:
-        df["max_cadence"] = df["max_cadence"].map(lambda v: _to_float(v)*2 if _to_float(v) is not None else None)
-    if "average_cadence" in df.columns:
-        df["average_cadence"] = df["average_cadence"].map(lambda v: _to_float(v)*2 if _to_float(v) is not None else None)
+    # -- Typage final colonnaire (unités, virgules FR, NaN -> None) : une passe par colonne
+    df = convert_frame(df, report=parse_report)
+    return df, before, parse_report
 
-    # average_grade_adjusted_pace (m/s) -> min/km
-    if "average_grade_adjusted_pace" in df.columns:
-        df["average_grade_adjusted_pace"] = df["average_grade_adjusted_pace"].map(_ms_to_min_per_km)
-
-    # (Aucune conversion distance -> km : déjà en km)
-
-    # -- Chaînes numériques -> nombres (gère virgules FR)
-    for c in df.columns:
-        df[c] = df[c].map(_coerce_numeric_str_any)
+# =========================
+# Import
+# =========================
+if up:
+    # -- Export ZIP : activities.csv lu depuis l'archive, traces rattachées ensuite
+    is_zip = up.name.lower().endswith(".zip")
+    csv_size = up.size
+    if is_zip:
+        try:
+            with zipfile.ZipFile(up) as zf:
+                csv_name = find_activities_csv(zf)
+                csv_size = zf.getinfo(csv_name).file_size if csv_name else 0
+        except zipfile.BadZipFile:
+            st.error("Archive ZIP illisible.")
+            st.stop()
+        if csv_name is None:
+            st.warning("Aucun `activities.csv` dans cette archive.")
+            st.stop()
 
-    # -- NaN -> None
-    df = df.where(pd.notna(df), None)
+    stream_mode = st.toggle(
+        "Lecture par blocs (gros exports)",
+        value=csv_size > STREAM_THRESHOLD_BYTES,
+        help=f"Lit seulement les colonnes utiles, par blocs de {STREAM_CHUNK_ROWS} lignes, "
+             "et filtre les 'run' au fil de l'eau : mémoire stable quelle que soit la taille du fichier.",
+    )
+
+    incremental = st.toggle(
+        "Import incrémental (seulement les nouvelles activités)",
+        value=True,
+        help="Écarte avant tout traitement les activités dont l'activity_id est déjà en base. "
+             "Les activités plus anciennes mais inconnues sont conservées (rattrapage). "
+             "Désactiver pour ré-examiner tout l'historique.",
+    )
+
+    # -- Cache de session : un rerun (clic sur un bouton radio...) ne re-parse pas le fichier
+    cache: ImportCache = st.session_state.setdefault("import_cache", ImportCache())
+    digests: Dict[str, str] = st.session_state.setdefault("upload_digests", {})
+    file_key = getattr(up, "file_id", None) or f"{up.name}:{up.size}"
+    if file_key not in digests:
+        digests[file_key] = upload_digest(up.getbuffer())
+    cache_key = (f"{user['id']}:{digests[file_key]}:{'stream' if stream_mode else 'full'}"
+                 f"{':inc' if incremental else ''}")
+
+    # -- Nouveau fichier : repartir de décisions vierges
+    if st.session_state.get("import_decisions_for") != digests[file_key]:
+        st.session_state.import_decisions = {}
+        st.session_state.import_decisions_for = digests[file_key]
+        st.session_state.review_table_gen = st.session_state.get("review_table_gen", 0) + 1
+        for k in [k for k in st.session_state if str(k).startswith("choice_")]:
+            del st.session_state[k]
+
+    entry = cache.get(cache_key)
+    if entry is None:
+        mark, skipped = None, None
+        if incremental:
+            known_ids, latest = fetch_known_keys(sb, "strava_import", user["id"])
+            mark, skipped = HighWaterMark(known_ids, latest), {"known": 0, "backfill": 0}
+        if is_zip:
+            # activities.csv lu directement dans l'archive (décompression au fil de la lecture) :
+            # le mode streaming garde sa mémoire bornée
+            with zipfile.ZipFile(up) as zf, zf.open(csv_name) as src:
+                df, before, parse_report = parse_upload(src, stream_mode, mark, skipped)
+        else:
+            df, before, parse_report = parse_upload(up, stream_mode, mark, skipped)
+        entry = {"df": df, "payloads": frame_to_payloads(df, user["id"]),
+                 "parse_report": parse_report, "before": before, "skipped": skipped, "dedupe": {}}
+        if is_zip and len(df):
+            # -- Traces des seules activités retenues, parsées dans un pool de processus
+            with zipfile.ZipFile(up) as zf:
+                links = link_entries(zf, df)
+            bar = st.progress(0.0, text=f"Lecture des traces : 0/{len(links)}")
+            up.seek(0)
+            tracks, track_errors = parse_zip_tracks(
+                up, links, progress=lambda d, n: bar.progress(d / n, text=f"Lecture des traces : {d}/{n}"))
+            bar.empty()
+            entry.update(tracks=tracks, track_errors=track_errors)
+        cache.put(cache_key, entry)
+    df, payloads, parse_report = entry["df"], entry["payloads"], entry["parse_report"]
+    skipped = entry["skipped"]
+    if skipped is None:
+        st.caption(f"Filtre 'run' appliqué : {len(df)}/{entry['before']} lignes conservées.")
+    else:
+        st.caption(f"Import incrémental : {len(df)} nouvelle(s) activité(s) sur {entry['before']} lignes lues "
+                   f"— {skipped['known']} écartée(s), déjà en base (activity_id) ; "
+                   f"{skipped['backfill']} conservée(s) bien qu'antérieure(s) à la dernière activité importée.")
+    if "tracks" in entry:
+        tracks, track_errors = entry["tracks"], entry["track_errors"]
+        st.caption(f"Traces : {len(tracks)} rattachée(s) à une activité importée, "
+                   f"{len(track_errors)} fichier(s) illisible(s), "
+                   f"{len(df) - len(tracks)} activité(s) sans trace.")
+        with st.expander("Détail des traces", expanded=False):
+            st.dataframe(track_summary(tracks), hide_index=True)
+            if track_errors:
+                st.dataframe(pd.DataFrame({"fichier": list(track_errors), "erreur": list(track_errors.values())}),
+                             hide_index=True)
+    if len(df) == 0:
+        if skipped is not None and skipped["known"]:
+            st.info("Rien de nouveau dans ce fichier : toutes les courses sont déjà importées.")
+        else:
+            st.warning("Aucune activité de type course (run) trouvée dans ce CSV.")
+        st.stop()
 
-    # -- Fenêtre temporelle pour lookup des doublons
-    try:
-        min_dt = pd.to_datetime(df["activity_date"]).min()
-        max_dt = pd.to_datetime(df["activity_date"]).max()
-        if pd.isna(min_dt) or pd.isna(max_dt):
+    # -- Dates/heures illisibles : rapport par colonne
+    for col, rep in parse_report.items():
+        if rep["failed"]:
+            st.warning(f"`{col}` : {rep['failed']} valeur(s) de date/heure illisible(s) "
+                       f"(format détecté : {rep['format'] or 'aucun'}) — laissées vides.")
+    with st.expander("Formats de date détectés", expanded=False):
+        st.dataframe(pd.DataFrame.from_dict(parse_report, orient="index"))
+
+    # -- Détection doublons (sur km + D+/D- en m), indexée par jour puis distance
+    tz_window = st.checkbox("Tolérer ±1 jour (activités décalées par le fuseau horaire)", value=False)
+    day_window = 1 if tz_window else 0
+    dedupe = entry["dedupe"].get(day_window)
+    if dedupe is None:
+        # -- Fenêtre temporelle pour lookup des doublons
+        try:
+            min_dt = pd.to_datetime(df["activity_date"]).min()
+            max_dt = pd.to_datetime(df["activity_date"]).max()
+            if pd.isna(min_dt) or pd.isna(max_dt):
+                min_dt = pd.Timestamp.utcnow() - pd.Timedelta(days=3650)
+                max_dt = pd.Timestamp.utcnow() + pd.Timedelta(days=1)
+        except Exception:
             min_dt = pd.Timestamp.utcnow() - pd.Timedelta(days=3650)
             max_dt = pd.Timestamp.utcnow() + pd.Timedelta(days=1)
-    except Exception:
-        min_dt = pd.Timestamp.utcnow() - pd.Timedelta(days=3650)
-        max_dt = pd.Timestamp.utcnow() + pd.Timedelta(days=1)
-
-    existing = fetch_existing_rows(min_dt.isoformat(), max_dt.isoformat())
-
-    def _date_only(ts):
-        try: return pd.to_datetime(ts).date()
-        except Exception: return None
-
-    by_day: Dict[Any, List[Dict[str, Any]]] = {}
-    for r in existing:
-        d = _date_only(r.get("activity_date"))
-        by_day.setdefault(d, []).append(r)
-
-    # -- Détection doublons (sur km + D+/D- en m)
-    rows_to_show = []
-    duplicate_found = False
-    for _, row in df.iterrows():
-        d_day = _date_only(row.get("activity_date"))
-        dist_km_new = _to_float(row.get("distance")) or 0.0
-        dplus_new   = _to_float(row.get("elevation_gain")) or 0.0
-        dmoins_new  = _to_float(row.get("elevation_loss")) or 0.0
-
-        candidates = by_day.get(d_day, [])
-        match = None
-        for cand in candidates:
-            dist_km_old = _to_float(cand.get("distance")) or 0.0
-            dplus_old   = _to_float(cand.get("elevation_gain")) or 0.0
-            dmoins_old  = _to_float(cand.get("elevation_loss")) or 0.0
-            if abs(dist_km_new - dist_km_old) <= D_TOL_KM and \
-               abs(dplus_new - dplus_old) <= DPLUS_TOL and \
-               abs(dmoins_new - dmoins_old) <= DMOINS_TOL:
-                match = cand
-                duplicate_found = True
-                break
-
-        rows_to_show.append((row.to_dict(), match))
+
+        # jours complets : un existant plus tard dans la journée reste un candidat
+        existing = fetch_existing_rows((min_dt.floor("D") - pd.Timedelta(days=day_window)).isoformat(),
+                                       (max_dt.floor("D") + pd.Timedelta(days=1 + day_window)).isoformat())
+        matches = match_duplicates(df, existing, day_window=day_window)
+        # -- Signal parcours (import ZIP) : écarte les doublons date / distance dont la trace diffère,
+        #    retrouve par la trace les activités déjà importées avec une autre date
+        route_stats = None
+        if entry.get("tracks"):
+            if "routes" not in entry:
+                entry["routes"] = fingerprint_many(entry["tracks"])
+            new_ids = [p.get("activity_id") for p in payloads]
+            checked, by_route = route_check(new_ids, matches, entry["routes"], load_route_index(user["id"]))
+            rows_by_aid = fetch_by_ids(sb, "strava_import", list(by_route.values()), user["id"],
+                                       columns=",".join(EXISTING_COLS), key="activity_id") if by_route else {}
+            for i, aid in by_route.items():
+                if aid in rows_by_aid:
+                    checked[i] = rows_by_aid[aid]
+            route_stats = {"dropped": sum(1 for a, b in zip(matches, checked) if a is not None and b is None),
+                           "found": sum(1 for i, aid in by_route.items() if aid in rows_by_aid)}
+            matches = checked
+        dedupe = {"existing": existing, "matches": matches, "routes": route_stats}
+        entry["dedupe"][day_window] = dedupe
+        cache.put(cache_key, entry)
+
+    matches = dedupe["matches"]
+    if dedupe.get("routes"):
+        st.caption(f"Parcours GPS : {dedupe['routes']['dropped']} doublon(s) date/distance écarté(s) "
+                   f"(trace différente), {dedupe['routes']['found']} doublon(s) retrouvé(s) par la trace.")
+    rows_to_show = list(zip(payloads, matches))
+    duplicate_found = any(m is not None for m in matches)
 
     # ===== Aucun doublon -> import silencieux =====
     if not duplicate_found:
-        insert_payloads: List[Dict[str, Any]] = []
-        for (new_row, _) in rows_to_show:
-            insert_payloads.append(_finalize_payload(new_row))
+        insert_payloads: List[Dict[str, Any]] = [new_row for (new_row, _) in rows_to_show]
         try:
-            do_upserts(insert_payloads, [], [])
-            st.success(f"Import terminé ✅  | Insérés: {len(insert_payloads)}")
-            st.balloons()
+            report = do_upserts(insert_payloads, [], [])
+            cache.invalidate(user["id"])
+            if _write_report_ok(report):
+                save_tracks(entry, insert_payloads)
+                st.success(f"Import terminé ✅  | Insérés: {len(insert_payloads)}")
+                st.balloons()
             with st.expander("Aperçu (premières lignes importées)", expanded=False):
                 st.dataframe(pd.DataFrame(insert_payloads).head(10))
         except Exception as e:
@@ -568,92 +646,62 @@ if up:
         with st.expander("Aperçu rapide du parsing (premières lignes)", expanded=False):
             st.dataframe(df.head(10))
         st.subheader("Vérification des doublons et choix d’action")
+        decisions = st.session_state.import_decisions
+
+        def _set_all(choice_for):
+            for i, (_, m) in enumerate(rows_to_show):
+                decisions[i] = choice_for(m)
+                st.session_state[f"choice_{i}"] = decisions[i]
+            # nouvelle grille en mode tableau, recréée sur les décisions globales
+            st.session_state.review_table_gen = st.session_state.get("review_table_gen", 0) + 1
 
         with global_action_col:
             st.write("Actions globales :")
             c1, c2, c3, c4 = st.columns(4)
             if c1.button("Tout combiner"):
-                for i, (new_row, m) in enumerate(rows_to_show):
-                    st.session_state.import_decisions[i] = "combine" if m else "insert"
+                _set_all(lambda m: "combine" if m else "insert")
             if c2.button("Tout remplacer"):
-                for i, (new_row, m) in enumerate(rows_to_show):
-                    st.session_state.import_decisions[i] = "replace" if m else "insert"
+                _set_all(lambda m: "replace" if m else "insert")
             if c3.button("Tout ignorer"):
-                for i, _ in enumerate(rows_to_show):
-                    st.session_state.import_decisions[i] = "ignore"
+                _set_all(lambda m: "ignore")
             if c4.button("Tout insérer quand même"):
-                for i, _ in enumerate(rows_to_show):
-                    st.session_state.import_decisions[i] = "insert"
+                _set_all(lambda m: "insert")
 
         st.markdown("---")
 
-        insert_payloads: List[Dict[str, Any]] = []
-        replace_payloads: List[Tuple[int, Dict[str, Any]]] = []
-        combine_payloads: List[Tuple[int, Dict[str, Any]]] = []
+        n_matched = sum(1 for _, m in rows_to_show if m)
+        review_mode = st.radio("Mode de revue", ["Tableau", "Cartes"], horizontal=True,
+                               index=0 if n_matched > TABLE_MODE_THRESHOLD else 1,
+                               help="Tableau : une seule grille éditable, seulement les lignes avec doublon.")
 
-        for i, (new_row, existing_row) in enumerate(rows_to_show):
-            box = st.container(border=True)
-            with box:
-                left, right = st.columns([3,2])
-                try:
-                    date_lbl = pd.to_datetime(new_row.get("activity_date")).strftime("%Y-%m-%d %H:%M")
-                except Exception:
-                    date_lbl = "?"
-
-                with left:
-                    st.markdown(f"### {new_row.get('activity_name') or 'Activité'} — {date_lbl}")
-                    st.caption(f"Type: {new_row.get('activity_type') or '-'} | Distance: {new_row.get('distance')} km | D+: {new_row.get('elevation_gain')} m | D-: {new_row.get('elevation_loss')} m")
-                with right:
-                    default_choice = st.session_state.import_decisions.get(i) or ("replace" if existing_row else "insert")
-                    choice = st.radio(
-                        f"Action pour la ligne #{i}",
-                        options=["combine","replace","ignore","insert"],
-                        captions=["Compléter la ligne DB avec les infos manquantes du CSV",
-                                  "Remplacer entièrement la ligne DB par le CSV",
-                                  "Ignorer cette ligne",
-                                  "Insérer une nouvelle ligne quand même"],
-                        index=["combine","replace","ignore","insert"].index(default_choice),
-                        key=f"choice_{i}",
-                        horizontal=True
-                    )
-                    st.session_state.import_decisions[i] = choice
-
-                if existing_row:
-                    st.write("**Dans la base (potentiel doublon):**")
-                    cdb1, cdb2, cdb3, cdb4 = st.columns(4)
-                    cdb1.write(f"ID: `{existing_row['id']}`")
-                    cdb2.write(f"Date: {existing_row.get('activity_date')}")
-                    cdb3.write(f"Dist (km): {existing_row.get('distance')}")
-                    cdb4.write(f"D+ / D-: {existing_row.get('elevation_gain')} / {existing_row.get('elevation_loss')}")
-                else:
-                    st.info("Aucune ligne existante trouvée pour cette date/valeurs.")
-
-                st.write("**Ligne importée (CSV):**")
-                cnp1, cnp2, cnp3, cnp4 = st.columns(4)
-                cnp1.write(f"Activity ID: {new_row.get('activity_id')}")
-                cnp2.write(f"Date: {new_row.get('activity_date')}")
-                cnp3.write(f"Dist (km): {new_row.get('distance')}")
-                cnp4.write(f"D+ / D-: {new_row.get('elevation_gain')} / {new_row.get('elevation_loss')}")
-
-                payload = _finalize_payload(new_row)
-                if choice == "insert" and not existing_row:
-                    insert_payloads.append(payload)
-                elif choice == "replace" and existing_row:
-                    replace_payloads.append((existing_row["id"], payload.copy()))
-                elif choice == "combine" and existing_row:
-                    combine_payloads.append((existing_row["id"], payload))
-
-                st.markdown("---")
+        if review_mode == "Tableau":
+            review_table(rows_to_show)
+        else:
+            # -- Revue paginée ; chaque groupe de lignes est un fragment : changer une décision
+            #    ne ré-exécute que son groupe, pas toute la page
+            n_pages = max(1, -(-len(rows_to_show) // REVIEW_PAGE_SIZE))
+            page_no = st.number_input(f"Page (sur {n_pages})", min_value=1, max_value=n_pages, value=1, step=1,
+                                      key="review_page") if n_pages > 1 else 1
+            page_start = (int(page_no) - 1) * REVIEW_PAGE_SIZE
+            page_rows = [(i, *rows_to_show[i])
+                         for i in range(page_start, min(page_start + REVIEW_PAGE_SIZE, len(rows_to_show)))]
+            for g in range(0, len(page_rows), REVIEW_GROUP_SIZE):
+                review_group(page_rows[g:g + REVIEW_GROUP_SIZE])
 
         with apply_col:
             if st.button("Appliquer les actions", type="primary", use_container_width=True):
+                insert_payloads, replace_payloads, combine_payloads = collect_actions(rows_to_show, decisions)
                 try:
-                    do_upserts(insert_payloads, replace_payloads, combine_payloads)
-                    st.success(
-                        f"Import terminé ✅  | Insérés: {len(insert_payloads)}  •  Remplacés: {len(replace_payloads)}  •  "
-                        f"Combinés: {len(combine_payloads)}  •  Ignorés: {len(rows_to_show) - (len(insert_payloads)+len(replace_payloads)+len(combine_payloads))}"
-                    )
-                    st.balloons()
+                    report = do_upserts(insert_payloads, replace_payloads, combine_payloads)
+                    cache.invalidate(user["id"])
+                    if _write_report_ok(report):
+                        save_tracks(entry, insert_payloads + [p for _, p in replace_payloads]
+                                    + [p for _, p in combine_payloads])
+                        st.success(
+                            f"Import terminé ✅  | Insérés: {len(insert_payloads)}  •  Remplacés: {len(replace_payloads)}  •  "
+                            f"Combinés: {len(combine_payloads)}  •  Ignorés: {len(rows_to_show) - (len(insert_payloads)+len(replace_payloads)+len(combine_payloads))}"
+                        )
+                        st.balloons()
                 except Exception as e:
                     st.error(f"Erreur pendant l'import : {e}")
 
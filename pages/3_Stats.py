@@ -13,6 +13,12 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 
+from utils_efforts import load_index, best_by_effort, EFFORT_LABELS
+from utils_routes import load_route_index, route_groups_frame
+from utils_cache import weekly_summary
+from utils_rollup import ensure_cube, load_cube, query_cube, period_keys, run_types
+from utils_charts import prepare_series
+
 st.set_page_config(page_title="📊 Semaine — agrégats", layout="wide")
 
 from utils_ui import inject_base_css, hero, section, stat_cards, callout, app_footer
@@ -29,17 +35,61 @@ def mmss_from_min_per_km(x: float) -> str:
     ss = total_sec % 60
     return f"{mm}:{ss:02d}/km"
 
-# ---------- 1) Récupération via RPC ----------
-res = sb.rpc("weekly_summary_for_me").execute()
-df = pd.DataFrame(res.data or [])
+# ---------- 1) Agrégats : cube jour / semaine / mois / année, sinon RPC filtrée sur la période ----------
+GRAIN_LABELS = {"Semaine": "week", "Jour": "day", "Mois": "month", "Année": "year"}
+c_grain, c_range = st.columns([2, 3])
+grain_label = c_grain.radio("Granularité", list(GRAIN_LABELS), index=0, horizontal=True)
+grain = GRAIN_LABELS[grain_label]
+today = pd.Timestamp.now().normalize()
+picked = c_range.date_input("Période", value=((today - pd.Timedelta(days=364)).date(), today.date()),
+                            max_value=today.date(), format="DD/MM/YYYY")
+if not isinstance(picked, (list, tuple)) or len(picked) < 2:
+    st.info("Choisis une date de début et une date de fin.")
+    sidebar_logout_bottom(sb)
+    st.stop()
+range_start, range_end = pd.Timestamp(picked[0]), pd.Timestamp(picked[1])
+
+def cube_frame(cube: pd.DataFrame, grain: str, start: pd.Timestamp, end: pd.Timestamp) -> pd.DataFrame:
+    """Périodes du cube qui recoupent [start, end], mêmes colonnes que le RPC weekly_summary_for_me
+    (courses seulement, comme le RPC)."""
+    first = period_keys(pd.Series([start]), grain)[1].iloc[0]  # début de la période contenant start
+    runs = query_cube(cube, grain, start=first, end=end + pd.Timedelta(days=1), types=run_types(cube))
+    if runs.empty:
+        return pd.DataFrame()
+    out = pd.DataFrame({
+        "week_key": runs["period"], "period_start": runs["period_start"], "activities": runs["n"],
+        "run_km": runs["distance_sum"], "run_dplus_m": runs["elevation_gain_sum"],
+        "run_time_s": runs["moving_time_sum"] * 60.0,
+        "average_speed": runs["moving_time_sum"] / runs["distance_sum"].where(runs["distance_sum"] > 0),
+        "allure_avg_min_km": runs["average_speed_avg"],
+        "vap_avg_min_km": runs["average_grade_adjusted_pace_avg"],
+        "average_grade_adjusted_pace": runs["average_grade_adjusted_pace_avg"],
+        "fc_avg_simple": runs["average_heart_rate_avg"], "calories_total": runs["calories_sum"],
+        "relative_effort_avg": runs["relative_effort_avg"],
+    })
+    steps = query_cube(cube, grain, start=first, end=end + pd.Timedelta(days=1), journal=True)
+    if not steps.empty:
+        out = out.merge(steps[["period", "total_steps_sum"]].rename(
+            columns={"period": "week_key", "total_steps_sum": "steps_total"}), on="week_key", how="left")
+    return out
+
+# cube déjà présent sur cette instance : lu localement. Sinon, agrégats de la période filtrés côté
+# serveur (sans reconstruire tout le cube) ; le cube n'est construit ici que si la fonction SQL manque.
+cube = load_cube(st.session_state["user"]["id"])
+if len(cube):
+    df = cube_frame(cube, grain, range_start, range_end)
+else:
+    df = weekly_summary(sb, st.session_state["user"]["id"], range_start, range_end, grain)
+    if df is None:
+        cube = ensure_cube(sb, st.session_state["user"]["id"])
+        df = cube_frame(cube, grain, range_start, range_end) if len(cube) else pd.DataFrame()
 
 if df.empty:
-    st.info("Pas encore de données.")
+    st.info("Pas de données sur cette période.")
     sidebar_logout_bottom(sb)
     st.stop()
 
-# ---------- 2) Tri + nettoyage numérique ----------
-df = df.sort_values(["iso_year", "week_no"]).reset_index(drop=True)
+# ---------- 2) Nettoyage numérique ----------
 
 numeric_cols = [
     "run_km", "run_dplus_m", "run_time_s",
@@ -85,8 +135,9 @@ if not metrics:
 label = st.selectbox("Choisis la métrique à tracer", list(metrics.keys()), index=0)
 ycol = metrics[label]
 
-fig = px.line(df, x="week_key", y=ycol, markers=True, title=label)
-fig.update_layout(xaxis_title="Semaine ISO", yaxis_title=label)
+plot_df = prepare_series(df, "week_key", [ycol], key="stats_zoom")
+fig = px.line(plot_df, x="week_key", y=ycol, markers=len(plot_df) <= 200, title=label)
+fig.update_layout(xaxis_title="Semaine ISO" if grain == "week" else grain_label, yaxis_title=label)
 st.plotly_chart(fig, use_container_width=True)
 
 # ---------- 5) Tableau récap ----------
@@ -97,7 +148,7 @@ if "average_grade_adjusted_pace" in df_display.columns:
     df_display["VAP (mm:ss/km)"] = df_display["average_grade_adjusted_pace"].apply(mmss_from_min_per_km)
 
 table_cols = [
-    "iso_year", "week_no", "week_key",
+    "iso_year", "week_no", "week_key", "activities",
     "run_km", "run_dplus_m", "run_time_s", "run_time_minutes",
     "allure_avg_min_km", "vap_avg_min_km",
     "average_speed", "Allure (mm:ss/km)",
@@ -109,4 +160,46 @@ table_cols = [c for c in table_cols if c in df_display.columns]
 
 st.dataframe(df_display[table_cols], use_container_width=True)
 
+# ---------- 6) Meilleurs efforts (index calculé depuis les traces importées) ----------
+efforts = load_index(st.session_state["user"]["id"])
+if not efforts.empty:
+    st.subheader("🏅 Meilleurs efforts")
+    years = sorted(efforts["activity_date"].dt.year.dropna().astype(int).unique(), reverse=True)
+    period = st.selectbox("Période", ["Toutes"] + [str(y) for y in years], index=0)
+    best = best_by_effort(efforts, year=None if period == "Toutes" else int(period))
+    if best.empty:
+        st.info("Aucun effort sur cette période.")
+    else:
+        st.dataframe(pd.DataFrame({
+            "Distance": best["effort"].map(EFFORT_LABELS),
+            "Temps": best["seconds"].map(lambda s: f"{int(s // 3600)}:{int(s % 3600 // 60):02d}:{int(round(s % 60)):02d}"
+                                         if s >= 3600 else f"{int(s // 60)}:{int(round(s % 60)):02d}"),
+            "Allure": best["pace_min_km"].map(mmss_from_min_per_km),
+            "Date": best["activity_date"].dt.strftime("%Y-%m-%d"),
+            "Activité": best["activity_id"],
+        }), use_container_width=True, hide_index=True)
+
+# ---------- 7) Parcours répétés (index des empreintes GPS) ----------
+routes = route_groups_frame(load_route_index(st.session_state["user"]["id"]))
+if not routes.empty:
+    st.subheader("🔁 Parcours répétés")
+    summary = (routes.groupby("route")
+                     .agg(sorties=("activity_id", "size"), distance_km=("length_m", lambda s: round(s.median() / 1000, 1)),
+                          meilleur_s=("duration_s", "min"), derniere=("activity_date", "max"))
+                     .sort_values("sorties", ascending=False))
+    summary["Meilleur temps"] = summary["meilleur_s"].map(
+        lambda s: f"{int(s // 60)}:{int(round(s % 60)):02d}" if pd.notna(s) else "")
+    summary["Dernière sortie"] = summary["derniere"].dt.strftime("%Y-%m-%d")
+    st.dataframe(summary[["sorties", "distance_km", "Meilleur temps", "Dernière sortie"]]
+                 .rename(columns={"sorties": "Sorties", "distance_km": "Distance (km)"}),
+                 use_container_width=True)
+    route_no = st.selectbox("Comparer les sorties du parcours", list(summary.index), index=0)
+    runs = routes[routes["route"] == route_no].copy()
+    runs["Temps (min)"] = (runs["duration_s"] / 60.0).round(1)
+    runs = prepare_series(runs.sort_values("activity_date"), "activity_date", ["Temps (min)"], key="route_zoom")
+    fig = px.line(runs, x="activity_date", y="Temps (min)", markers=True,
+                  title=f"Parcours n°{route_no} — temps par sortie")
+    fig.update_layout(xaxis_title="Date", yaxis_title="Temps (min)")
+    st.plotly_chart(fig, use_container_width=True)
+
 sidebar_logout_bottom(sb)
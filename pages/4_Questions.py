@@ -24,6 +24,10 @@ import requests  # ← on utilise l’API REST OpenAI (pas de SDK)
 st.set_page_config(page_title="🤖 Questions — strava_import", layout="wide")
 
 from utils_ui import inject_base_css, hero, section, stat_cards, callout, app_footer
+from utils_efforts import load_index, efforts_wide
+from utils_splits import load_summary, summary_columns
+from utils_rollup import load_cube, aggregate_days, ROLLUP_METRICS
+from utils_cache import activity_frame
 inject_base_css()
 
 st.title("🤖 Questions (réponse en phrases) — strava_import")
@@ -82,28 +86,27 @@ def dtype_str(series: pd.Series) -> str:
     if pd.api.types.is_datetime64_any_dtype(series): return "timestamp"
     return "text"
 
+# Colonnes utiles à l'agent (dimensions + métriques des synonymes ci-dessous), projetées à la lecture
+AGENT_COLS = [
+    "activity_id", "activity_date", "activity_type", "activity_name", "activity_description", "filename",
+    "distance", "moving_time", "elapsed_time", "average_speed", "max_speed",
+    "average_heart_rate", "max_heart_rate", "elevation_gain", "elevation_loss", "elevation_low",
+    "elevation_high", "max_grade", "average_grade", "relative_effort", "calories", "athlete_weight",
+    "average_grade_adjusted_pace", "total_steps", "training_load",
+]
+
 def load_table_df() -> pd.DataFrame:
-    q = sb.table(TABLE).select("*").eq("user_id", user["id"])
-    res = q.execute()
-    df = pd.DataFrame(res.data or [])
+    # frame en cache par utilisateur, typée selon le schéma d'import, resynchronisée par updated_at
+    df = activity_frame(sb, user["id"], AGENT_COLS)
     if df.empty:
         return df
-    rename = {c: snake(c) for c in df.columns}
-    df = df.rename(columns=rename)
-    for c in df.columns:
-        if any(k in c for k in ["date","time","start","end","_at","_ts"]):
-            try:
-                df[c] = pd.to_datetime(df[c], errors="coerce", utc=True)
-            except Exception:
-                pass
-    time_cols = [c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])]
-    if time_cols:
-        t = time_cols[0]
-        iso = df[t].dt.isocalendar()
-        if "iso_year" not in df.columns: df["iso_year"] = iso.year
-        if "iso_week" not in df.columns: df["iso_week"] = iso.week.astype("Int64")
-        if "month" not in df.columns:    df["month"] = df[t].dt.month
-        if "date_only" not in df.columns: df["date_only"] = df[t].dt.date.astype("string")
+    df = df.sort_values(["activity_date", "id"], ignore_index=True)
+    t = "activity_date"
+    iso = df[t].dt.isocalendar()
+    df["iso_year"] = iso.year
+    df["iso_week"] = iso.week.astype("Int64")
+    df["month"] = df[t].dt.month
+    df["date_only"] = df[t].dt.date.astype("string")
     return df
 
 df = load_table_df()
@@ -111,7 +114,19 @@ if df.empty:
     st.markdown("Je n’ai trouvé aucune activité dans ta table `strava_import` pour cet utilisateur.")
     st.stop()
 
+# Meilleurs efforts (index calculé depuis les traces) : colonnes best_<distance>_s par activité
+if "activity_id" in df.columns:
+    _wide = efforts_wide(load_index(user["id"]))
+    if not _wide.empty:
+        df = df.merge(_wide, on="activity_id", how="left")
+    # D+ / D- lissés, GAP et allure recalculés depuis les traces
+    _summary = load_summary(user["id"])
+    if not _summary.empty:
+        df = df.merge(summary_columns(_summary), on="activity_id", how="left")
+
 NUMERIC_COLS = [c for c in df.columns if pd.api.types.is_numeric_dtype(df[c])]
+# Cube d'agrégats (jour / semaine / mois / année) : réponses sans reparcourir les activités
+CUBE = load_cube(user["id"])
 
 # =========================
 # Synonymes FR -> colonnes existantes (utilisé par l'agent)
@@ -143,7 +158,15 @@ RAW_ALIASES: Dict[str, List[str]] = {
     "iso_week": ["iso_week", "semaine", "num semaine", "sem"],
     "iso_year": ["iso_year", "année", "an", "year"],
     "month": ["month", "mois"],
-    "date_only": ["date_only", "jour (date)", "date simple"]
+    "date_only": ["date_only", "jour (date)", "date simple"],
+    "best_1k_s": ["best_1k_s", "meilleur 1 km", "meilleur 1k", "record 1 km", "record 1k"],
+    "best_5k_s": ["best_5k_s", "meilleur 5 km", "meilleur 5k", "record 5 km", "record 5k"],
+    "best_10k_s": ["best_10k_s", "meilleur 10 km", "meilleur 10k", "record 10 km", "record 10k"],
+    "best_half_s": ["best_half_s", "meilleur semi", "record semi", "semi-marathon", "meilleur semi-marathon"],
+    "elevation_gain_smoothed": ["elevation_gain_smoothed", "d+ lissé", "dénivelé positif lissé", "d+ recalculé"],
+    "elevation_loss_smoothed": ["elevation_loss_smoothed", "d- lissé", "dénivelé négatif lissé", "d- recalculé"],
+    "gap_stream_min_km": ["gap_stream_min_km", "gap", "allure ajustée", "allure ajustée à la pente", "vap recalculée"],
+    "pace_stream_min_km": ["pace_stream_min_km", "allure recalculée", "allure trace"]
 }
 ALIASES: Dict[str, List[str]] = {col: [s for s in syns if col in df.columns]
                                  for col, syns in RAW_ALIASES.items() if col in df.columns}
@@ -310,6 +333,9 @@ def tool_aggregate_dataframe(filters: Optional[Dict[str, Any]], group_by: str, o
         F["where"] = (F.get("where") or []) + [{"column":"activity_type","op":"=","value":st.session_state.agent_filters["type"]}]
 
     col = resolve_column(column)
+    fast = _aggregate_from_cube(F, group_by, op, col)
+    if fast is not None:
+        return fast
     dd, group_key = apply_filters(df, {"filters":F, "group_by":group_by})
     if dd.empty:
         return {"empty": True}
@@ -339,6 +365,41 @@ def tool_aggregate_dataframe(filters: Optional[Dict[str, Any]], group_by: str, o
             "group_by": group_key or "none"
         }
 
+def _aggregate_from_cube(F: Dict[str, Any], group_by: str, op: str, col: str) -> Optional[Dict[str, Any]]:
+    """Même réponse que tool_aggregate_dataframe, lue dans le cube d'agrégats (lignes jour)
+    quand la question s'y prête : métrique du cube, filtres année / mois / semaines / type."""
+    op = (op or "sum").lower()
+    if CUBE.empty or col not in ROLLUP_METRICS or op not in ("sum", "avg", "min", "max", "count"):
+        return None
+    types = None
+    for cond in (F.get("where") or []):
+        if cond.get("column") != "activity_type" or cond.get("op") != "=":
+            return None  # filtre hors cube : table brute
+        # conditions combinées en ET, comme sur la table brute
+        value = {str(cond.get("value"))}
+        types = value if types is None else types & value
+    if types is not None and not types:
+        return {"empty": True}
+    w = F.get("weeks")
+    try:
+        weeks = (int(w["from"]), int(w["to"])) if w else None
+    except Exception:
+        weeks = None
+    res = aggregate_days(CUBE, col, op, group_by if group_by in ("week", "month", "day") else "none",
+                         year=F.get("year"), month=F.get("month"), weeks=weeks, types=types)
+    if isinstance(res, pd.DataFrame):
+        if res.empty:
+            return {"empty": True}
+        return {"empty": False, "mode": "grouped",
+                "rows": [{"group": str(g), "value": None if pd.isna(v) else float(v)}
+                         for g, v in zip(res["group"], res["value"])],
+                "metric": f"{op}_{col}", "filters": F,
+                "group_by": {"week": "iso_week", "month": "month", "day": "date_only"}[group_by]}
+    if res is None:
+        return {"empty": True}
+    return {"empty": False, "mode": "single", "label": f"{op}_{col}",
+            "value": None if pd.isna(res) else float(res), "filters": F, "group_by": group_by}
+
 # Mise à jour mémoire implicite
 txt_low = txt.lower()
 if "run" in txt_low or "course" in txt_low:
@@ -358,6 +419,7 @@ Tu es un analyste d'entraînement. Tu réponds en français, de façon claire et
 - Quand un calcul est nécessaire, appelle la fonction aggregate_dataframe avec des filtres raisonnables (par ex. activity_type='run' si la question parle de course), puis explique le résultat simplement (phrases).
 - Si tu ignores les colonnes disponibles, appelle list_columns.
 - N'invente pas de colonnes.
+- Les colonnes best_1k_s, best_5k_s, best_10k_s, best_half_s donnent, par activité, le temps (secondes) du meilleur effort sur la distance : pour « mon meilleur 5 km cette année », utilise op=min sur best_5k_s et convertis en minutes:secondes.
 - Reste concis et utile. Pas de tableaux sauf si l'utilisateur le demande explicitement.
 """
 
@@ -0,0 +1,59 @@
+# --- Header commun à toutes les pages ---
+import streamlit as st
+from supa import get_client
+from utils import require_login
+from utils import sidebar_logout_bottom
+
+sb = get_client()
+u = require_login(sb)  # bloque la page tant que l'utilisateur n'est pas connecté
+st.session_state["user"] = {"id": u.user.id, "email": u.user.email}
+# --- Fin du header commun ---
+
+import plotly.graph_objects as go
+
+from utils_heatmap import HeatmapStore, tile_to_lonlat, png_data_uri, MIN_ZOOM, MAX_ZOOM
+
+st.set_page_config(page_title="🔥 Carte de chaleur", layout="wide")
+
+from utils_ui import inject_base_css, hero, section, stat_cards, callout, app_footer
+inject_base_css()
+
+st.title("🔥 Carte de chaleur")
+st.caption("Tous les points GPS de tes courses, rendus en tuiles raster côté serveur (mises en cache) : "
+           "le navigateur ne reçoit qu'une image, jamais les millions de points.")
+
+store = HeatmapStore(st.session_state["user"]["id"])
+spots = store.hot_spots(z=10)
+if not spots:
+    st.info("Aucune trace GPS : importe ton export Strava (ZIP) depuis la page Importer.")
+    sidebar_logout_bottom(sb)
+    st.stop()
+
+# ---------- Zone + zoom ----------
+def _spot_center(tx: int, ty: int):
+    return tile_to_lonlat(10, tx + 0.5, ty + 0.5)
+
+labels = {f"{_spot_center(tx, ty)[1]:.3f}, {_spot_center(tx, ty)[0]:.3f} — {n:,} points".replace(",", " "): (tx, ty)
+          for tx, ty, n in spots}
+c1, c2 = st.columns([3, 2])
+zone = c1.selectbox("Zone", list(labels), index=0, help="Zones les plus parcourues (tuiles de ~40 km).")
+zoom = c2.slider("Zoom", min_value=MIN_ZOOM, max_value=MAX_ZOOM, value=12)
+lon, lat = _spot_center(*labels[zone])
+
+# ---------- Rendu ----------
+png, corners = store.view(zoom, lon, lat)
+fig = go.Figure(go.Scattermap(lon=[lon], lat=[lat], mode="markers", marker={"size": 1, "opacity": 0},
+                              hoverinfo="skip"))
+fig.update_layout(
+    map={"style": "carto-darkmatter", "center": {"lon": lon, "lat": lat},
+         # MapLibre travaille en tuiles de 512 px : même échelle qu'une tuile de 256 px au zoom - 1
+         "zoom": zoom - 1,
+         "layers": [{"sourcetype": "image", "source": png_data_uri(png), "coordinates": corners}]},
+    margin={"l": 0, "r": 0, "t": 0, "b": 0}, height=700,
+)
+st.plotly_chart(fig, use_container_width=True)
+man = store.manifest()
+st.caption(f"{len(man['activities'])} activité(s) • version des données {man['version']} • "
+           f"image {len(png) // 1024} Ko")
+
+sidebar_logout_bottom(sb)
@@ -0,0 +1,83 @@
+# --- Header commun à toutes les pages ---
+import streamlit as st
+from supa import get_client
+from utils import require_login
+from utils import sidebar_logout_bottom
+
+sb = get_client()
+u = require_login(sb)  # bloque la page tant que l'utilisateur n'est pas connecté
+st.session_state["user"] = {"id": u.user.id, "email": u.user.email}
+# --- Fin du header commun ---
+
+import pandas as pd
+import plotly.graph_objects as go
+
+from utils_cache import data_version
+from utils_charts import prepare_series
+from utils_load import (
+    load_series, update_training_load, ATL_DAYS, CTL_DAYS, ACWR_SWEET_SPOT, ACWR_DANGER,
+)
+
+st.set_page_config(page_title="📈 Charge d'entraînement", layout="wide")
+
+from utils_ui import inject_base_css, hero, section, stat_cards, callout, app_footer
+inject_base_css()
+
+st.title("📈 Charge d'entraînement")
+st.caption(f"Fatigue (ATL, {ATL_DAYS:.0f} j), forme de fond (CTL, {CTL_DAYS:.0f} j), fraîcheur (TSB = CTL − ATL) "
+           "et ratio aigu:chronique (ACWR = ATL / CTL), depuis l'effort relatif de chaque activité.")
+
+user = st.session_state["user"]
+
+# ---------- 1) Série : prolongée jusqu'à aujourd'hui une fois par jour / version des données ----------
+marker = (user["id"], data_version(user["id"]), pd.Timestamp.now(tz="UTC").strftime("%Y-%m-%d"))
+if st.session_state.get("training_load_marker") != marker:
+    with st.spinner("Mise à jour de la charge…"):
+        series = update_training_load(sb, user["id"])
+    st.session_state["training_load_marker"] = marker
+else:
+    series = load_series(user["id"])
+
+if series.empty:
+    st.info("Pas encore d'activités : importe ton export Strava pour calculer la charge.")
+    sidebar_logout_bottom(sb)
+    st.stop()
+
+series["date"] = pd.to_datetime(series["date"])
+
+# ---------- 2) Valeurs du jour ----------
+last, prev = series.iloc[-1], series.iloc[-8] if len(series) > 7 else series.iloc[0]
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("Fatigue (ATL)", f"{last['atl']:.0f}", f"{last['atl'] - prev['atl']:+.0f} vs J-7")
+c2.metric("Forme (CTL)", f"{last['ctl']:.0f}", f"{last['ctl'] - prev['ctl']:+.0f} vs J-7")
+c3.metric("Fraîcheur (TSB)", f"{last['tsb']:+.0f}", f"{last['tsb'] - prev['tsb']:+.0f} vs J-7")
+c4.metric("ACWR", f"{last['acwr']:.2f}" if pd.notna(last["acwr"]) else "—")
+if pd.notna(last["acwr"]) and last["acwr"] > ACWR_DANGER:
+    st.warning(f"ACWR au-dessus de {ACWR_DANGER} : hausse de charge brutale, risque de blessure accru.")
+
+# ---------- 3) Période ----------
+periods = {"3 mois": 91, "6 mois": 182, "1 an": 365, "Tout": None}
+label = st.radio("Période", list(periods), index=1, horizontal=True)
+days = periods[label]
+view = series if days is None else series[series["date"] > series["date"].iloc[-1] - pd.Timedelta(days=days)]
+view = prepare_series(view, "date", ["load", "ctl", "atl", "tsb", "acwr"], key="charge_zoom")
+
+# ---------- 4) Graphes ----------
+fig = go.Figure()
+fig.add_bar(x=view["date"], y=view["load"], name="Charge du jour", marker_color="rgba(148,163,184,0.5)")
+fig.add_scatter(x=view["date"], y=view["ctl"], name="CTL (forme)", line={"color": "#2563eb", "width": 2})
+fig.add_scatter(x=view["date"], y=view["atl"], name="ATL (fatigue)", line={"color": "#dc2626", "width": 2})
+fig.add_scatter(x=view["date"], y=view["tsb"], name="TSB (fraîcheur)", line={"color": "#16a34a", "dash": "dot"})
+fig.update_layout(title="Charge, fatigue, forme et fraîcheur", xaxis_title="Date", yaxis_title="Charge",
+                  legend={"orientation": "h"})
+st.plotly_chart(fig, use_container_width=True)
+
+fig_r = go.Figure()
+fig_r.add_hrect(y0=ACWR_SWEET_SPOT[0], y1=ACWR_SWEET_SPOT[1], fillcolor="#16a34a", opacity=0.12, line_width=0)
+fig_r.add_hline(y=ACWR_DANGER, line_dash="dash", line_color="#dc2626")
+fig_r.add_scatter(x=view["date"], y=view["acwr"], name="ACWR", line={"color": "#7c3aed"})
+fig_r.update_layout(title=f"Ratio aigu:chronique (zone verte {ACWR_SWEET_SPOT[0]}–{ACWR_SWEET_SPOT[1]})",
+                    xaxis_title="Date", yaxis_title="ACWR")
+st.plotly_chart(fig_r, use_container_width=True)
+
+sidebar_logout_bottom(sb)
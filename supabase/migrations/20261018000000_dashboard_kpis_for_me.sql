@@ -0,0 +1,32 @@
+-- KPIs de l'accueil (Accueil.py, utils_cache.dashboard_kpis) : sommes distance / D+ / temps en
+-- mouvement de l'utilisateur connecté sur trois fenêtres de p_days jours, en un seul appel.
+--   current   : [p_today - (p_days - 1), p_today]
+--   previous  : les p_days jours précédents
+--   last_year : la fenêtre current 52 semaines plus tôt (mêmes jours de la semaine)
+-- p_types : valeurs d'activity_type retenues (NULL : toutes).
+create or replace function public.dashboard_kpis_for_me(p_today date, p_days int default 7, p_types text[] default null)
+returns table (window_name text, distance float8, elevation_gain float8, moving_time float8)
+language sql
+stable
+security invoker
+set search_path = public
+as $$
+  with w(window_name, d0) as (
+    values ('current',   p_today - (p_days - 1)),
+           ('previous',  p_today - (2 * p_days - 1)),
+           ('last_year', p_today - (p_days - 1) - 364)
+  )
+  select w.window_name,
+         coalesce(sum(s.distance), 0)::float8,
+         coalesce(sum(s.elevation_gain), 0)::float8,
+         coalesce(sum(s.moving_time), 0)::float8
+  from w
+  left join public.strava_import s
+    on s.user_id = auth.uid()
+   and s.activity_date >= w.d0
+   and s.activity_date < w.d0 + p_days
+   and (p_types is null or s.activity_type = any(p_types))
+  group by w.window_name
+$$;
+
+grant execute on function public.dashboard_kpis_for_me(date, int, text[]) to authenticated;
@@ -0,0 +1,48 @@
+-- Accueil.py (utils_cache.dashboard) : KPIs ET kilométrage quotidien en un seul appel, sans cube local.
+-- Remplace dashboard_kpis_for_me(date, int, text[]) de 20261018000000_dashboard_kpis_for_me.sql.
+--
+-- Sommes distance / D+ / temps en mouvement de l'utilisateur connecté, par activity_type :
+--   window_name = 'current'   : [p_today - (p_days - 1), p_today]                (day NULL)
+--   window_name = 'previous'  : les p_days jours précédents                      (day NULL)
+--   window_name = 'last_year' : la fenêtre current 52 semaines plus tôt          (day NULL)
+--   window_name = 'daily'     : une ligne par jour de [p_today - (p_daily_days - 1), p_today]
+-- Le filtre « courses » (normalisation des libellés FR / EN) reste côté Python (utils_import.run_mask) :
+-- les lignes sont donc rendues par activity_type.
+drop function if exists public.dashboard_kpis_for_me(date, int, text[]);
+
+create or replace function public.dashboard_kpis_for_me(p_today date, p_days int default 7, p_daily_days int default 28)
+returns table (window_name text, day date, activity_type text,
+               distance float8, elevation_gain float8, moving_time float8)
+language sql
+stable
+security invoker
+set search_path = public
+as $$
+  with w(window_name, d0) as (
+    values ('current',   p_today - (p_days - 1)),
+           ('previous',  p_today - (2 * p_days - 1)),
+           ('last_year', p_today - (p_days - 1) - 364)
+  )
+  select w.window_name, null::date, s.activity_type,
+         coalesce(sum(s.distance), 0)::float8,
+         coalesce(sum(s.elevation_gain), 0)::float8,
+         coalesce(sum(s.moving_time), 0)::float8
+  from w
+  join public.strava_import s
+    on s.user_id = auth.uid()
+   and s.activity_date >= w.d0
+   and s.activity_date < w.d0 + p_days
+  group by w.window_name, s.activity_type
+  union all
+  select 'daily', s.activity_date::date, s.activity_type,
+         coalesce(sum(s.distance), 0)::float8,
+         coalesce(sum(s.elevation_gain), 0)::float8,
+         coalesce(sum(s.moving_time), 0)::float8
+  from public.strava_import s
+  where s.user_id = auth.uid()
+    and s.activity_date >= p_today - (p_daily_days - 1)
+    and s.activity_date < p_today + 1
+  group by s.activity_date::date, s.activity_type
+$$;
+
+grant execute on function public.dashboard_kpis_for_me(date, int, int) to authenticated;
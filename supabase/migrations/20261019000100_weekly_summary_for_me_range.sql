@@ -0,0 +1,73 @@
+-- pages/3_Stats.py (utils_cache.weekly_summary) : agrégats des courses de l'utilisateur connecté,
+-- filtrés côté serveur sur la période choisie, à la granularité p_grain ('day' | 'week' | 'month' | 'year').
+-- Surcharge de weekly_summary_for_me() (sans paramètre), inchangée.
+--
+-- Une ligne par période qui recoupe [p_from, p_to] (p_from ramené au début de sa période), mêmes
+-- clés que utils_rollup.period_keys : 2024-03-05 / 2024-W10 / 2024-03 / 2024.
+-- Courses : activity_type normalisé comme utils_import.run_mask (libellés FR / EN).
+-- Unités de strava_import : distance en km, moving_time en minutes, allures en min/km.
+create or replace function public.weekly_summary_for_me(p_from date, p_to date, p_grain text default 'week')
+returns table (week_key text, period_start date, activities bigint,
+               run_km float8, run_dplus_m float8, run_time_s float8,
+               average_speed float8, allure_avg_min_km float8,
+               average_grade_adjusted_pace float8, vap_avg_min_km float8,
+               fc_avg_simple float8, calories_total float8, relative_effort_avg float8,
+               steps_total float8)
+language sql
+stable
+security invoker
+set search_path = public
+as $$
+  with bounds as (
+    select date_trunc(p_grain, p_from::timestamp)::date as d0, p_to + 1 as d1
+  ),
+  runs as (
+    select date_trunc(p_grain, s.activity_date::date::timestamp)::date as period_start, s.*
+    from public.strava_import s, bounds b
+    where s.user_id = auth.uid()
+      and s.activity_date >= b.d0
+      and s.activity_date < b.d1
+      and regexp_replace(translate(lower(trim(s.activity_type)), 'àâäéèêëîïôöùûüç', 'aaaeeeeiioouuuc'),
+                         '[^a-z0-9]+', '_', 'g')
+          in ('run', 'trail_run', 'virtual_run', 'course', 'course_a_pied', 'course_sur_sentier',
+              'course_a_pied_virtuelle')
+  ),
+  per_period as (
+    select period_start,
+           count(*) as activities,
+           sum(distance)::float8 as run_km,
+           sum(elevation_gain)::float8 as run_dplus_m,
+           (sum(moving_time) * 60)::float8 as run_time_s,
+           (sum(moving_time) / nullif(sum(distance), 0))::float8 as average_speed,
+           avg(average_speed)::float8 as allure_avg_min_km,
+           avg(average_grade_adjusted_pace)::float8 as vap_avg_min_km,
+           avg(average_heart_rate)::float8 as fc_avg_simple,
+           sum(calories)::float8 as calories_total,
+           avg(relative_effort)::float8 as relative_effort_avg
+    from runs
+    group by period_start
+  ),
+  steps as (
+    select date_trunc(p_grain, j.date::date::timestamp)::date as period_start,
+           sum(j.nombre_de_pas)::float8 as steps_total
+    from public.journal j, bounds b
+    where j.user_id = auth.uid()
+      and j.date >= b.d0
+      and j.date < b.d1
+    group by 1
+  )
+  select case p_grain
+           when 'week'  then to_char(p.period_start, 'IYYY-"W"IW')
+           when 'month' then to_char(p.period_start, 'YYYY-MM')
+           when 'year'  then to_char(p.period_start, 'YYYY')
+           else to_char(p.period_start, 'YYYY-MM-DD')
+         end,
+         p.period_start, p.activities, p.run_km, p.run_dplus_m, p.run_time_s,
+         p.average_speed, p.allure_avg_min_km, p.vap_avg_min_km, p.vap_avg_min_km,
+         p.fc_avg_simple, p.calories_total, p.relative_effort_avg, st.steps_total
+  from per_period p
+  left join steps st using (period_start)
+  order by p.period_start
+$$;
+
+grant execute on function public.weekly_summary_for_me(date, date, text) to authenticated;
@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+
+from utils_charts import downsample, lttb
+
+
+def test_lttb_keeps_ends_sorted_and_unique():
+    x = np.arange(10_000, dtype=float)
+    y = np.sin(x / 50.0)
+    idx = lttb(x, y, 200)
+    assert len(idx) == 200
+    assert idx[0] == 0 and idx[-1] == len(x) - 1
+    assert np.all(np.diff(idx) > 0)
+
+def test_lttb_keeps_spike():
+    x = np.arange(5_000, dtype=float)
+    y = np.zeros_like(x)
+    y[3_217] = 100.0
+    assert 3_217 in lttb(x, y, 50)
+
+def test_lttb_short_series_untouched():
+    x = np.arange(10, dtype=float)
+    assert list(lttb(x, x, 10)) == list(range(10))
+    assert list(lttb(x, x, 50)) == list(range(10))
+    assert list(lttb(x, x, 2)) == list(range(10))
+
+def test_downsample_union_of_series_and_nan():
+    n = 3_000
+    df = pd.DataFrame({"x": np.arange(n), "a": np.random.default_rng(0).normal(size=n),
+                       "b": np.where(np.arange(n) % 2, np.nan, 1.0)})
+    out = downsample(df, "x", ["a", "b"], n_out=100)
+    assert len(out) <= 100
+    assert out["x"].is_monotonic_increasing
+    assert len(downsample(df.head(50), "x", "a", n_out=100)) == 50
+
+def _lttb_loop(x, y, n_out):
+    """LTTB séquentiel de référence (un paquet après l'autre)."""
+    n = len(x)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out, a = [0], 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 1 < n_out - 2:
+            nx, ny = x[edges[i + 1]:edges[i + 2]].mean(), y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            nx, ny = x[-1], y[-1]
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(np.argmax(area))
+        out.append(a)
+    return np.array(out + [n - 1])
+
+def test_lttb_matches_sequential_algorithm():
+    rng = np.random.default_rng(3)
+    for n, n_out in ((20_000, 1_100), (5_000, 300), (3_000, 2_000), (50, 7)):
+        x = np.sort(rng.uniform(0, 1e6, n))
+        for y in (np.cumsum(rng.normal(size=n)), np.sin(x / 5e3), np.zeros(n)):
+            assert np.array_equal(lttb(x, y, n_out), _lttb_loop(x, y, n_out))
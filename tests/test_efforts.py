@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from utils_efforts import best_efforts
+
+
+def _run(speeds):
+    """Streams à 1 Hz : canal dist cumulé depuis une vitesse (m/s) par seconde."""
+    v = np.asarray(speeds, dtype="float64")
+    return {"time": np.arange(len(v) + 1, dtype="float64"), "dist": np.concatenate([[0.0], np.cumsum(v)])}
+
+def test_best_efforts_constant_pace():
+    out = best_efforts(_run([4.0] * 3000))  # 12 km à 4 m/s
+    assert set(out) == {"1k", "5k", "10k"}
+    assert out["1k"]["seconds"] == pytest.approx(250.0)
+    assert out["10k"]["seconds"] == pytest.approx(2500.0)
+
+def test_best_efforts_finds_fast_segment():
+    speeds = [4.0] * 1000 + [5.0] * 400 + [4.0] * 1000
+    out = best_efforts(_run(speeds))
+    assert out["1k"]["seconds"] == pytest.approx(200.0)
+    assert 1000.0 <= out["1k"]["start_offset_s"] <= 1200.0
+
+def test_best_efforts_pause_and_latlon():
+    # arrêt de 60 s au milieu : le km le plus rapide l'évite
+    speeds = [4.0] * 300 + [0.0] * 60 + [4.0] * 300
+    assert best_efforts(_run(speeds))["1k"]["seconds"] == pytest.approx(250.0)
+    # sans canal dist : distance GPS le long d'un méridien (1 km ≈ 0.008993°)
+    t = np.arange(0.0, 601.0)
+    lat = 45.0 + t * 4.0 / 111_195.0
+    out = best_efforts({"time": t, "lat": lat, "lon": np.full_like(t, 5.0)})
+    assert out["1k"]["seconds"] == pytest.approx(250.0, rel=1e-3)
+
+def test_best_efforts_without_time():
+    assert best_efforts({"dist": np.arange(0.0, 5000.0, 10.0)}) == {}
+    assert best_efforts(_run([4.0] * 100)) == {}  # 400 m : aucune distance couverte
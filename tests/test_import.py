@@ -0,0 +1,63 @@
+import pandas as pd
+
+from utils_import import HighWaterMark, drop_known, match_duplicates
+
+
+def _rows(*rows):
+    return pd.DataFrame(rows, columns=["activity_id", "activity_date", "distance", "elevation_gain", "elevation_loss"])
+
+EXISTING = _rows(
+    (1, "2024-05-01T07:00:00+00:00", 10.0, 100.0, 100.0),
+    (2, "2024-05-01T18:00:00+00:00", 10.15, 120.0, 110.0),
+    (3, "2024-05-02T07:00:00+00:00", 21.1, 300.0, 300.0),
+)
+
+def test_match_duplicates_best_candidate_same_day():
+    new = _rows((10, "2024-05-01T09:00:00+00:00", 10.02, 102.0, 101.0))
+    assert match_duplicates(new, EXISTING)[0]["activity_id"] == 1
+    # plus proche de la 2e en D+ / D- : l'écart normalisé départage
+    new = _rows((10, "2024-05-01T09:00:00+00:00", 10.12, 121.0, 111.0))
+    assert match_duplicates(new, EXISTING)[0]["activity_id"] == 2
+
+def test_match_duplicates_tolerances():
+    new = _rows(
+        (10, "2024-05-01T09:00:00+00:00", 10.5, 100.0, 100.0),  # distance hors D_TOL_KM
+        (11, "2024-05-01T09:00:00+00:00", 10.0, 200.0, 100.0),  # D+ hors DPLUS_TOL
+        (12, "2024-05-03T09:00:00+00:00", 21.1, 300.0, 300.0),  # mauvais jour
+    )
+    assert match_duplicates(new, EXISTING) == [None, None, None]
+
+def test_match_duplicates_day_window():
+    new = _rows((10, "2024-05-03T00:30:00+00:00", 21.1, 300.0, 300.0))
+    assert match_duplicates(new, EXISTING) == [None]
+    assert match_duplicates(new, EXISTING, day_window=1)[0]["activity_id"] == 3
+
+def test_match_duplicates_prefers_same_day_over_better_score():
+    existing = _rows(
+        (1, "2024-05-01T07:00:00+00:00", 10.15, 140.0, 140.0),
+        (2, "2024-05-02T07:00:00+00:00", 10.0, 100.0, 100.0),
+    )
+    new = _rows((10, "2024-05-01T09:00:00+00:00", 10.0, 100.0, 100.0))
+    assert match_duplicates(new, existing, day_window=1)[0]["activity_id"] == 1
+
+def test_match_duplicates_empty_and_records():
+    new = _rows((10, "2024-05-01T09:00:00+00:00", 10.0, 100.0, 100.0))
+    assert match_duplicates(new, []) == [None]
+    assert match_duplicates(new.iloc[:0], EXISTING) == []
+    assert match_duplicates(new, EXISTING.to_dict("records"))[0]["activity_id"] == 1
+
+def test_drop_known_keeps_unknown_older_rows():
+    chunk = pd.DataFrame({
+        "activity_id": ["1", "2", "3", ""],
+        "activity_date": ["Jan 5, 2024, 10:00:00 AM", "Jan 6, 2024, 10:00:00 AM",
+                          "Jan 4, 2024, 10:00:00 AM", "Mar 1, 2024, 10:00:00 AM"],
+    })
+    mark = HighWaterMark(known_ids=[1, 2], latest="2024-01-06T10:00:00+00:00")
+    skipped = {}
+    out = drop_known(chunk, mark, skipped)
+    assert list(out["activity_id"]) == ["3", ""]
+    assert skipped == {"known": 2, "backfill": 1}
+
+def test_drop_known_without_history():
+    chunk = pd.DataFrame({"activity_id": ["1"], "activity_date": ["Jan 5, 2024, 10:00:00 AM"]})
+    assert len(drop_known(chunk, HighWaterMark())) == 1
@@ -0,0 +1,32 @@
+import numpy as np
+import pandas as pd
+
+from utils_load import ATL_DAYS, CTL_DAYS, SERIES_COLS, extend_series
+
+
+def _loads(values, start="2024-01-01"):
+    return pd.Series(values, index=pd.date_range(start, periods=len(values), freq="D"), dtype="float64")
+
+def test_extend_series_first_day():
+    out = extend_series(_loads([70.0, 0.0]))
+    assert list(out.columns) == SERIES_COLS
+    assert list(out["date"]) == ["2024-01-01", "2024-01-02"]
+    first = out.iloc[0]
+    assert np.isclose(first["atl"], 70.0 * (1 - np.exp(-1 / ATL_DAYS)))
+    assert np.isclose(first["ctl"], 70.0 * (1 - np.exp(-1 / CTL_DAYS)))
+    assert first["tsb"] == 0.0  # forme du jour = état de la veille
+    assert np.isclose(out.iloc[1]["tsb"], first["ctl"] - first["atl"])
+
+def test_extend_series_resumes_from_state():
+    loads = _loads(np.random.default_rng(1).uniform(0, 120, 90))
+    full = extend_series(loads)
+    head = extend_series(loads.iloc[:60])
+    last = head.iloc[-1]
+    tail = extend_series(loads.iloc[60:], atl0=last["atl"], ctl0=last["ctl"])
+    pd.testing.assert_frame_equal(pd.concat([head, tail], ignore_index=True), full)
+
+def test_extend_series_converges_and_acwr():
+    out = extend_series(_loads([50.0] * 400))
+    assert np.isclose(out["atl"].iloc[-1], 50.0) and np.isclose(out["ctl"].iloc[-1], 50.0, rtol=1e-3)
+    assert np.isclose(out["acwr"].iloc[-1], 1.0, rtol=1e-3)
+    assert np.isnan(extend_series(_loads([0.0, 0.0]))["acwr"]).all()
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils_rollup import CUBE_COLS, ROLLUP_METRICS, day_rollup, period_keys, roll_up
+
+
+def _days(*values):
+    return pd.Series(pd.to_datetime(list(values)))
+
+def test_period_keys_week_is_iso():
+    # 2021-01-03 est un dimanche de la semaine ISO 2020-W53
+    key, start = period_keys(_days("2021-01-03", "2021-01-04", "2024-12-30"), "week")
+    assert list(key) == ["2020-W53", "2021-W01", "2025-W01"]
+    assert list(start.dt.strftime("%Y-%m-%d")) == ["2020-12-28", "2021-01-04", "2024-12-30"]
+
+@pytest.mark.parametrize("grain, keys, starts", [
+    ("day", ["2024-02-29", "2024-03-01"], ["2024-02-29", "2024-03-01"]),
+    ("month", ["2024-02", "2024-03"], ["2024-02-01", "2024-03-01"]),
+    ("year", ["2024", "2024"], ["2024-01-01", "2024-01-01"]),
+])
+def test_period_keys(grain, keys, starts):
+    key, start = period_keys(_days("2024-02-29", "2024-03-01"), grain)
+    assert list(key) == keys
+    assert list(pd.to_datetime(start).dt.strftime("%Y-%m-%d")) == starts
+
+def test_period_keys_unknown_grain():
+    with pytest.raises(ValueError):
+        period_keys(_days("2024-01-01"), "quarter")
+
+def _acts():
+    return pd.DataFrame({
+        "day": pd.to_datetime(["2024-01-30", "2024-01-30", "2024-01-31", "2024-02-01"]),
+        "activity_type": ["Run", "Run", "Run", "Ride"],
+        "distance": [10.0, 5.0, np.nan, 40.0],
+        "moving_time": [50.0, 25.0, 30.0, 90.0],
+    }).reindex(columns=["day", "activity_type"] + list(ROLLUP_METRICS))
+
+def test_day_rollup():
+    days = day_rollup(_acts()).set_index(["period", "activity_type"])
+    run = days.loc[("2024-01-30", "Run")]
+    assert run["n"] == 2 and run["distance_sum"] == 15.0 and run["distance_cnt"] == 2
+    assert run["distance_min"] == 5.0 and run["distance_max"] == 10.0
+    # métrique entièrement absente : somme NaN (pas 0), compte 0
+    assert np.isnan(days.loc[("2024-01-31", "Run")]["distance_sum"])
+    assert days.loc[("2024-01-31", "Run")]["distance_cnt"] == 0
+
+def test_roll_up_composes_day_rows():
+    days = day_rollup(_acts())
+    month = roll_up(days, "month").set_index(["period", "activity_type"])
+    jan = month.loc[("2024-01", "Run")]
+    assert jan["n"] == 3 and jan["distance_sum"] == 15.0 and jan["moving_time_sum"] == 105.0
+    assert jan["moving_time_min"] == 25.0 and jan["moving_time_max"] == 50.0
+    assert pd.Timestamp(jan["period_start"]) == pd.Timestamp("2024-01-01")
+    assert set(month.index) == {("2024-01", "Run"), ("2024-02", "Ride")}
+    year = roll_up(days, "year")
+    assert set(year["period"]) == {"2024"} and year["n"].sum() == 4
+
+def test_roll_up_empty():
+    out = roll_up(pd.DataFrame(columns=CUBE_COLS), "week")
+    assert out.empty and list(out.columns) == CUBE_COLS
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from utils_routes import N_HASHES, RouteIndex, fingerprint, jaccard
+
+_rng = np.random.default_rng(7)
+
+def _mh():
+    return _rng.integers(0, 2**32, size=N_HASHES, dtype=np.uint64).astype(np.uint32)
+
+def _index(hashes):
+    return RouteIndex(pd.DataFrame({"activity_id": list(hashes),
+                                    "minhash": [" ".join(map(str, h)) for h in hashes.values()]}))
+
+def test_groups_are_transitive():
+    a = _mh()
+    b = a.copy()
+    b[45:] = _mh()[45:]  # b ~ a (45/64)
+    c = b.copy()
+    c[:19] = _mh()[:19]  # c ~ b (45/64), c !~ a (26/64)
+    assert jaccard(a, c) < 0.6
+    index = _index({"a": a, "b": b, "c": c, "d": _mh()})
+    assert [sorted(g) for g in index.groups()] == [["a", "b", "c"]]
+
+def test_fingerprint_same_track():
+    t = np.arange(0.0, 1800.0)
+    lat = 45.0 + 0.01 * np.sin(t / 300.0)
+    lon = 5.0 + 0.01 * np.cos(t / 300.0)
+    fp = fingerprint({"time": t, "lat": lat, "lon": lon})
+    again = fingerprint({"time": t, "lat": lat + 1e-6, "lon": lon})
+    assert jaccard(fp["minhash"], again["minhash"]) > 0.85
+    index = _index({1: fp["minhash"]})
+    assert index.query(again)[0][0] == 1
+    assert fingerprint({"time": t}) is None
+
+def test_find_duplicate_by_digest_and_route():
+    t = np.arange(0.0, 1800.0)
+    streams = {"time": t, "lat": 45.0 + 0.01 * np.sin(t / 300.0), "lon": 5.0 + 0.01 * np.cos(t / 300.0)}
+    fp = fingerprint(streams)
+    row = {k: v for k, v in fp.items() if k != "minhash"}
+    index = RouteIndex(pd.DataFrame([{"activity_id": 7, "activity_date": "2024-05-01", **row,
+                                      "minhash": " ".join(map(str, fp["minhash"]))}]))
+    assert index.row(7)["length_m"] == fp["length_m"] and index.row(8) is None
+    assert index.find_duplicate(fp) == 7
+    # même parcours, autre fichier (digest différent), distance et durée proches
+    other = fingerprint({**streams, "lat": streams["lat"] + 1e-6})
+    assert other["digest"] != fp["digest"] and index.find_duplicate(other) == 7
+    assert index.find_duplicate({**other, "duration_s": fp["duration_s"] * 2}) is None
@@ -0,0 +1,247 @@
+# utils_cache.py — Lectures Supabase mises en cache par utilisateur + version des données
+#
+# Chaque utilisateur a un numéro de version des données (data/versions/<user_id>), changé
+# après chaque écriture réussie (import, saisie du journal). Les lectures en cache sont indexées
+# par (utilisateur, version) : une écriture les invalide toutes d'un coup, sans attendre le TTL,
+# et le fichier partagé garde plusieurs processus Streamlit d'accord sur la version courante.
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+import streamlit as st
+from postgrest.exceptions import APIError
+
+from utils_db import fetch_all_ranges, fetch_by_ids, fetch_changed_since, fetch_date_range, fetch_ids
+from utils_import import BOOL_COLS, INT_COLS, FLOAT_COLS, TS_COLS, run_mask
+from utils_store import store_dir, write_bytes
+
+VERSIONS_DIR = store_dir("versions")
+CACHE_TTL_S = int(st.secrets.get("CACHE_TTL_S", 600))
+
+
+# =========================
+# Version des données
+# =========================
+def _version_path(user_id: Any) -> str:
+    return os.path.join(VERSIONS_DIR, str(user_id))
+
+def data_version(user_id: Any) -> int:
+    try:
+        with open(_version_path(user_id), encoding="utf-8") as fh:
+            return int(fh.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+_bump_lock = threading.Lock()
+
+def bump_data_version(user_id: Any) -> int:
+    """À appeler après une écriture réussie : invalide les lectures en cache de l'utilisateur.
+
+    La nouvelle version est l'horloge en nanosecondes (au moins l'ancienne + 1) : deux écritures
+    concurrentes, même dans deux processus, ne peuvent pas publier la même valeur et laisser
+    survivre une lecture en cache d'avant l'une d'elles."""
+    with _bump_lock:
+        version = max(time.time_ns(), data_version(user_id) + 1)
+        write_bytes(_version_path(user_id), str(version).encode("utf-8"))
+    return version
+
+
+# =========================
+# Lectures en cache
+# =========================
+# fonctions SQL absentes du projet (migration non appliquée) : mémorisé pour tout le processus,
+# pour ne pas refaire à chaque affichage un appel voué à l'échec (les erreurs ne sont pas en cache)
+RPC_NOT_FOUND = "PGRST202"
+
+@st.cache_resource(show_spinner=False)
+def _missing_rpcs() -> set:
+    return set()
+
+# `_sb` n'entre pas dans la clé de cache (préfixe _) ; user_id, version et paramètres, si.
+@st.cache_data(ttl=CACHE_TTL_S, show_spinner=False)
+def _weekly_summary_range(_sb, user_id: str, version: int, start: str, end: str, grain: str) -> pd.DataFrame:
+    res = _sb.rpc("weekly_summary_for_me", {"p_from": start, "p_to": end, "p_grain": grain}).execute()
+    return pd.DataFrame(res.data or [])
+
+def weekly_summary(sb, user_id: Any, start: Any, end: Any, grain: str = "week") -> Optional[pd.DataFrame]:
+    """Périodes de `grain` qui recoupent [start, end], filtrées côté serveur par weekly_summary_for_me
+    (supabase/migrations/20261019000100_weekly_summary_for_me_range.sql) ; en cache par
+    (utilisateur, version des données, période, granularité).
+    None si la fonction n'est pas déployée ; les autres erreurs remontent."""
+    if "weekly_summary_for_me" in _missing_rpcs():
+        return None
+    try:
+        return _weekly_summary_range(sb, str(user_id), data_version(user_id), pd.Timestamp(start).strftime("%Y-%m-%d"),
+                                     pd.Timestamp(end).strftime("%Y-%m-%d"), grain)
+    except APIError as e:
+        if getattr(e, "code", None) != RPC_NOT_FOUND:
+            raise
+        _missing_rpcs().add("weekly_summary_for_me")
+        return None
+
+
+# =========================
+# KPIs de l'accueil (un seul appel agrégé côté serveur)
+# =========================
+KPI_DAYS = 7
+DAILY_DAYS = 28
+KPI_METRICS = ["distance", "elevation_gain", "moving_time"]
+KPI_WINDOWS = ["current", "previous", "last_year"]
+DASHBOARD_COLS = ["window_name", "day", "activity_type"] + KPI_METRICS
+# Fonction SQL : supabase/migrations/20261019000000_dashboard_kpis_daily.sql. Sommes par
+# activity_type pour chaque fenêtre de KPI et pour chacun des DAILY_DAYS derniers jours
+# (window_name = "daily") ; le filtre « courses » (run_mask) est appliqué ici.
+# « last_year » = même fenêtre 52 semaines plus tôt (mêmes jours de la semaine).
+
+def kpi_windows(today: pd.Timestamp, n_days: int = KPI_DAYS) -> dict:
+    """Premier jour de chaque fenêtre de n_days jours (mêmes bornes que dashboard_kpis_for_me)."""
+    first = today - pd.Timedelta(days=n_days - 1)
+    return {"current": first, "previous": first - pd.Timedelta(days=n_days),
+            "last_year": first - pd.Timedelta(weeks=52)}
+
+# le jour fait partie de la clé : le cache change de fenêtre à minuit même sans import
+@st.cache_data(ttl=CACHE_TTL_S, show_spinner=False)
+def _dashboard_rows(_sb, user_id: str, version: int, day: str, n_days: int, n_daily: int) -> pd.DataFrame:
+    res = _sb.rpc("dashboard_kpis_for_me", {"p_today": day, "p_days": n_days, "p_daily_days": n_daily}).execute()
+    return pd.DataFrame(res.data or [], columns=DASHBOARD_COLS)
+
+@st.cache_data(ttl=CACHE_TTL_S, show_spinner=False)
+def _dashboard_rows_local(_sb, user_id: str, version: int, day: str, n_days: int, n_daily: int) -> pd.DataFrame:
+    """Mêmes lignes que dashboard_kpis_for_me quand la migration n'est pas appliquée : seules les
+    deux plages de dates concernées sont lues dans strava_import."""
+    today = pd.Timestamp(day)
+    windows = kpi_windows(today, n_days)
+    recent = min(windows["previous"], today - pd.Timedelta(days=n_daily - 1))
+    ranges = [(recent, today + pd.Timedelta(days=1)),
+              (windows["last_year"], windows["last_year"] + pd.Timedelta(days=n_days))]
+    acts = pd.concat([fetch_date_range(_sb, "strava_import", ["activity_type"] + KPI_METRICS, user_id, a, b)
+                      for a, b in ranges], ignore_index=True).drop_duplicates("id")
+    if acts.empty:
+        return pd.DataFrame(columns=DASHBOARD_COLS)
+    acts[KPI_METRICS] = acts[KPI_METRICS].apply(pd.to_numeric, errors="coerce")
+    acts["day"] = pd.to_datetime(acts["activity_date"], utc=True, errors="coerce",
+                                 format="ISO8601").dt.tz_convert(None).dt.floor("D")
+    parts = []
+    for w, first in windows.items():
+        sel = acts[(acts["day"] >= first) & (acts["day"] < first + pd.Timedelta(days=n_days))]
+        parts.append(sel.groupby("activity_type")[KPI_METRICS].sum().reset_index().assign(window_name=w, day=None))
+    sel = acts[acts["day"] > today - pd.Timedelta(days=n_daily)]
+    parts.append(sel.groupby(["day", "activity_type"])[KPI_METRICS].sum().reset_index().assign(window_name="daily"))
+    return pd.concat(parts, ignore_index=True)[DASHBOARD_COLS]
+
+def dashboard(sb, user_id: Any, today: pd.Timestamp, n_days: int = KPI_DAYS,
+              n_daily: int = DAILY_DAYS) -> Tuple[dict, pd.DataFrame]:
+    """KPIs et kilométrage quotidien des courses, en cache par (utilisateur, version des données, jour).
+
+    Retourne ({fenêtre: {métrique: somme}} pour current / previous / last_year, frame date / km
+    des n_daily derniers jours). Un seul appel à dashboard_kpis_for_me ; si elle n'est pas
+    déployée, mêmes lignes calculées sur les plages de dates utiles. Les autres erreurs remontent."""
+    args = (str(user_id), data_version(user_id), today.strftime("%Y-%m-%d"), n_days, n_daily)
+    rows = None
+    if "dashboard_kpis_for_me" not in _missing_rpcs():
+        try:
+            rows = _dashboard_rows(sb, *args)
+        except APIError as e:
+            if getattr(e, "code", None) != RPC_NOT_FOUND:
+                raise
+            _missing_rpcs().add("dashboard_kpis_for_me")
+    if rows is None:
+        rows = _dashboard_rows_local(sb, *args)
+    rows = rows[run_mask(rows["activity_type"])]  # courses seulement, comme les Stats
+    kpis = {w: {m: float(pd.to_numeric(rows.loc[rows["window_name"] == w, m], errors="coerce").sum())
+                for m in KPI_METRICS} for w in KPI_WINDOWS}
+    daily = rows[rows["window_name"] == "daily"]
+    km = (pd.to_numeric(daily["distance"], errors="coerce")
+            .groupby(pd.to_datetime(daily["day"]).to_numpy()).sum()
+            .reindex(pd.date_range(today - pd.Timedelta(days=n_daily - 1), today, freq="D"), fill_value=0.0))
+    return kpis, km.rename("km").rename_axis("date").reset_index()
+
+
+# =========================
+# Frame d'activités (page Questions) : colonnes projetées, synchro incrémentale
+# =========================
+# Une copie en mémoire par utilisateur, partagée entre sessions du même processus. Tant que la
+# version des données ne change pas, aucune requête. Sinon :
+#   - lignes dont updated_at dépasse le curseur (updated_at, id) de la dernière synchro, fusionnées
+#     par id (l'import renseigne updated_at à chaque écriture, voir do_upserts) ;
+#   - rapprochement sur la seule colonne id : les id disparus sont retirés, les id inconnus
+#     (updated_at NULL, écrits hors de l'application) sont lus par id.
+# Premier chargement : plages lues en parallèle, contrôlées contre le count exact du serveur.
+ACTIVITIES_TABLE = "strava_import"
+STAMP_COL = "updated_at"
+
+def schema_dtype(col: str) -> str:
+    """dtype pandas d'une colonne de strava_import, d'après le schéma d'import."""
+    if col in INT_COLS:   return "Int64"
+    if col in FLOAT_COLS: return "float64"
+    if col in BOOL_COLS:  return "boolean"
+    if col in TS_COLS:    return "datetime64[ns, UTC]"
+    return "string"
+
+def _typed(raw: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    out = pd.DataFrame({"id": raw["id"].astype("int64")}, index=raw.index)
+    for c in columns:
+        s = raw[c] if c in raw.columns else pd.Series(None, index=raw.index, dtype=object)
+        if c in TS_COLS:
+            out[c] = pd.to_datetime(s, utc=True, errors="coerce", format="ISO8601")
+        elif c in INT_COLS or c in FLOAT_COLS:
+            out[c] = pd.to_numeric(s, errors="coerce").astype(schema_dtype(c))
+        else:
+            out[c] = s.astype(schema_dtype(c))
+    return out
+
+@st.cache_resource(show_spinner=False)
+def _activity_store() -> Dict[str, Any]:
+    # "lock" ne protège que le dictionnaire des verrous ; chaque utilisateur a le sien, tenu
+    # pendant ses lectures réseau : le premier chargement d'un utilisateur ne bloque pas les autres
+    return {"lock": threading.Lock(), "user_locks": {}, "users": {}}
+
+def _user_lock(store: Dict[str, Any], key: str) -> threading.Lock:
+    with store["lock"]:
+        return store["user_locks"].setdefault(key, threading.Lock())
+
+def activity_frame(sb, user_id: Any, columns: List[str]) -> pd.DataFrame:
+    """Activités de l'utilisateur (id + `columns`, typées selon le schéma), à jour de la version
+    des données. Copie : l'appelant peut ajouter des colonnes."""
+    store, key = _activity_store(), str(user_id)
+    columns = list(dict.fromkeys(columns))
+    version = data_version(user_id)
+    with _user_lock(store, key):
+        entry = store["users"].get(key)
+        if entry is None or entry["columns"] != columns:
+            entry = {"columns": columns, "frame": _typed(pd.DataFrame(columns=["id"]), columns),
+                     "cursor": None, "version": None, "loaded": False}
+        if entry["version"] != version:
+            if not entry["loaded"]:
+                raw, expected = fetch_all_ranges(sb, ACTIVITIES_TABLE, columns + [STAMP_COL], user_id)
+                if len(raw) != expected:
+                    st.warning(f"Lecture incomplète de {ACTIVITIES_TABLE} : {len(raw)} lignes reçues, "
+                               f"{expected} annoncées par le serveur. Les réponses peuvent être faussées.")
+                stamped = raw.dropna(subset=[STAMP_COL])
+                if len(stamped):
+                    last = stamped.assign(_ts=pd.to_datetime(stamped[STAMP_COL], utc=True, format="ISO8601")) \
+                                  .sort_values(["_ts", "id"]).iloc[-1]
+                    entry["cursor"] = (last[STAMP_COL], int(last["id"]))
+                entry["frame"] = _typed(raw, columns)
+                entry["loaded"] = True
+            else:
+                raw, entry["cursor"] = fetch_changed_since(sb, ACTIVITIES_TABLE, columns, user_id,
+                                                           entry["cursor"], stamp_col=STAMP_COL)
+                frame = entry["frame"]
+                ids = set(fetch_ids(sb, ACTIVITIES_TABLE, user_id))
+                frame = frame[frame["id"].isin(ids)]
+                unknown = ids - set(frame["id"]) - set(raw["id"])
+                if unknown:
+                    extra = fetch_by_ids(sb, ACTIVITIES_TABLE, sorted(unknown), user_id,
+                                         columns=",".join(["id"] + columns))
+                    raw = pd.concat([raw, pd.DataFrame(list(extra.values()))], ignore_index=True)
+                if len(raw):
+                    fresh = _typed(raw, columns)
+                    kept = frame[~frame["id"].isin(fresh["id"])]
+                    frame = pd.concat([kept, fresh], ignore_index=True) if len(kept) else fresh
+                entry["frame"] = frame
+            entry["version"] = version
+            store["users"][key] = entry
+        return entry["frame"].copy()
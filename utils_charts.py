@@ -0,0 +1,105 @@
+# utils_charts.py — Séries temporelles longues : sous-échantillonnage LTTB avant Plotly
+#
+# Largest-Triangle-Three-Buckets (Steinarsson, 2013) : premier et dernier points conservés, le
+# reste découpé en n - 2 paquets ; dans chaque paquet on garde le point qui forme le plus grand
+# triangle avec le point retenu au paquet précédent et la moyenne du paquet suivant. La forme
+# (pics, creux) est préservée avec ~1 point par pixel au lieu de toute la série.
+# Pleine résolution au zoom : zoom_window() restreint la série à une fenêtre choisie, puis
+# le sous-échantillonnage s'applique à cette fenêtre seulement (tous les points si elle est courte).
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+CHART_WIDTH_PX = int(st.secrets.get("CHART_WIDTH_PX", 1100))  # largeur utile d'un graphe en layout "wide"
+POINTS_PER_PX = 1.0
+
+
+def target_points(width_px: Optional[int] = None) -> int:
+    return max(3, int((width_px or CHART_WIDTH_PX) * POINTS_PER_PX))
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices (triés) des n_out points retenus ; x croissant, y fini.
+
+    Le point retenu dans un paquet dépend de celui du paquet précédent : au lieu d'une boucle
+    Python par paquet, les paquets sont rangés dans une matrice (un paquet par ligne) et les
+    aires de tous les candidats sont calculées d'un coup, le point précédent étant d'abord la
+    moyenne du paquet précédent. On recalcule ensuite seulement les paquets dont le point
+    précédent a changé, jusqu'à stabilité : même résultat que l'algorithme séquentiel, en
+    quelques passes vectorisées."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x, y = np.asarray(x, dtype="float64"), np.asarray(y, dtype="float64")
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)  # n_out - 2 paquets sur [1, n-1[
+    sizes = np.diff(edges)
+    # moyennes de chaque paquet, + le dernier point comme « paquet suivant » final
+    sums_x, sums_y = np.add.reduceat(x[1:n - 1], edges[:-1] - 1), np.add.reduceat(y[1:n - 1], edges[:-1] - 1)
+    avg_x = np.append(sums_x / sizes, x[-1])
+    avg_y = np.append(sums_y / sizes, y[-1])
+
+    # paquets en lignes (complétées par le dernier point du paquet, jamais retenu)
+    cells = edges[:-1, None] + np.arange(sizes.max())[None, :]
+    cells = np.minimum(cells, edges[1:, None] - 1)
+    cx, cy = x[cells], y[cells]
+    nx, ny = avg_x[1:], avg_y[1:]                                  # moyenne du paquet suivant
+    px, py = np.append(x[0], avg_x[:-2]), np.append(y[0], avg_y[:-2])  # point précédent (estimé)
+
+    choice = np.full(n_out - 2, -1, dtype=np.int64)
+    rows = np.arange(n_out - 2)
+    while rows.size:
+        # aire (×2) des triangles (point précédent, candidat, moyenne du paquet suivant)
+        area = np.abs((px[rows] - nx[rows])[:, None] * (cy[rows] - py[rows][:, None])
+                      - (px[rows][:, None] - cx[rows]) * (ny[rows] - py[rows])[:, None])
+        picked = cells[rows, np.argmax(area, axis=1)]
+        moved = rows[picked != choice[rows]]
+        choice[rows] = picked
+        rows = moved[moved + 1 < n_out - 2] + 1  # paquets dont le point précédent vient de changer
+        px[rows], py[rows] = x[choice[rows - 1]], y[choice[rows - 1]]
+    return np.concatenate([[0], choice, [n - 1]])
+
+def _numeric_x(s: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.astype("int64").to_numpy(dtype="float64")
+    if pd.api.types.is_numeric_dtype(s):
+        return s.to_numpy(dtype="float64")
+    return np.arange(len(s), dtype="float64")  # catégories (ex. semaine « 2024-W07 ») : rang
+
+def downsample(df: pd.DataFrame, x: str, ys: Sequence[str], n_out: Optional[int] = None) -> pd.DataFrame:
+    """Lignes de df retenues par LTTB pour chaque colonne de `ys` (union des indices : un seul
+    frame pour un graphe à plusieurs traces). df doit être trié par x."""
+    n_out = n_out or target_points()
+    ys = [ys] if isinstance(ys, str) else list(ys)
+    if len(df) <= n_out:
+        return df
+    xs = _numeric_x(df[x])
+    keep = np.zeros(len(df), dtype=bool)
+    per_series = max(3, n_out // len(ys))
+    for col in ys:
+        yv = pd.to_numeric(df[col], errors="coerce").to_numpy(dtype="float64")
+        ok = np.flatnonzero(np.isfinite(yv))
+        keep[ok[lttb(xs[ok], yv[ok], per_series)]] = True
+    return df[keep]
+
+def zoom_window(df: pd.DataFrame, x: str, key: str, n_out: Optional[int] = None) -> pd.DataFrame:
+    """Curseur de plage sur x quand la série dépasse la résolution du graphe : réduire la plage
+    affiche plus de détail, jusqu'à tous les points."""
+    n_out = n_out or target_points()
+    if len(df) <= n_out:
+        return df
+    values = list(df[x])
+    labels = [v.strftime("%Y-%m-%d") if hasattr(v, "strftime") else str(v) for v in values]
+    lo, hi = st.select_slider("Zoom (plage affichée)", options=range(len(values)), value=(0, len(values) - 1),
+                              format_func=lambda i: labels[i], key=key)
+    return df.iloc[lo:hi + 1]
+
+def prepare_series(df: pd.DataFrame, x: str, ys: Sequence[str], key: str,
+                   width_px: Optional[int] = None) -> pd.DataFrame:
+    """Fenêtre de zoom + LTTB ; légende du nombre de points envoyés au navigateur."""
+    n_out = target_points(width_px)
+    window = zoom_window(df, x, key, n_out)
+    shown = downsample(window, x, ys, n_out)
+    if len(shown) < len(window):
+        st.caption(f"{len(shown)} points affichés sur {len(window)} (LTTB) — réduis la plage pour plus de détail.")
+    return shown
@@ -0,0 +1,221 @@
+# utils_db.py — Accès Supabase par lots (lectures groupées, écritures en masse)
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Sequence
+
+import pandas as pd
+
+# Taille de lot par défaut pour les écritures / lectures groupées
+WRITE_BATCH_SIZE = 500
+
+
+def chunked(seq: Sequence[Any], size: int) -> Iterator[Sequence[Any]]:
+    """Découpe une séquence en tranches de `size` éléments."""
+    size = max(1, int(size))
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def fetch_by_ids(sb, table: str, ids: Sequence[Any], user_id: Any, columns: str = "*",
+                 batch_size: int = WRITE_BATCH_SIZE, key: str = "id") -> Dict[Any, Dict[str, Any]]:
+    """Lignes de `table` dont la colonne `key` (id par défaut) est dans `ids`
+    (une requête in_ par lot) -> {clé: ligne}."""
+    out: Dict[Any, Dict[str, Any]] = {}
+    for part in chunked(list(dict.fromkeys(ids)), batch_size):
+        res = (sb.table(table)
+                 .select(columns)
+                 .eq("user_id", user_id)
+                 .in_(key, list(part))
+               ).execute()
+        for r in res.data or []:
+            out[r[key]] = r
+    return out
+
+
+def bulk_upsert(sb, table: str, rows: List[Dict[str, Any]], on_conflict: str, label: str,
+                batch_size: int = WRITE_BATCH_SIZE) -> List[Dict[str, Any]]:
+    """Upsert par lots. Un lot en échec n'interrompt pas les suivants.
+
+    Retourne un rapport par lot : {"action", "batch", "rows", "ok", "error"}.
+    """
+    report: List[Dict[str, Any]] = []
+    for i, part in enumerate(chunked(rows, batch_size), start=1):
+        entry = {"action": label, "batch": i, "rows": len(part), "ok": True, "error": None}
+        try:
+            sb.table(table).upsert(list(part), on_conflict=on_conflict).execute()
+        except Exception as e:
+            entry["ok"] = False
+            entry["error"] = str(e)
+        report.append(entry)
+    return report
+
+
+# =========================
+# Lecture paginée par plage de dates
+# =========================
+PAGE_SIZE = 1000      # ≤ max-rows PostgREST (1000 par défaut)
+FETCH_WORKERS = 4     # requêtes simultanées max
+
+
+def _fetch_slice(sb, table: str, columns: str, user_id: Any, start_iso: str, end_iso: str,
+                 date_col: str, page_size: int) -> List[Dict[str, Any]]:
+    """Une sous-plage [start, end[ paginée par clé (date_col, id) : pas d'OFFSET, pas de trou
+    même si plusieurs lignes partagent la même date."""
+    rows: List[Dict[str, Any]] = []
+    last = None
+    while True:
+        q = (sb.table(table)
+               .select(columns)
+               .eq("user_id", user_id)
+               .gte(date_col, start_iso)
+               .lt(date_col, end_iso))
+        if last is not None:
+            d, i = last
+            q = q.or_(f'{date_col}.gt."{d}",and({date_col}.eq."{d}",id.gt.{i})')
+        page = q.order(date_col).order("id").limit(page_size).execute().data or []
+        if not page:
+            break
+        rows.extend(page)
+        last = (page[-1][date_col], page[-1]["id"])
+    return rows
+
+
+def _utc(ts) -> pd.Timestamp:
+    """Borne de plage en Timestamp UTC (une date naïve est prise en UTC)."""
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+def fetch_date_range(sb, table: str, columns: List[str], user_id: Any, start, end,
+                     date_col: str = "activity_date", page_size: int = PAGE_SIZE,
+                     max_workers: int = FETCH_WORKERS) -> pd.DataFrame:
+    """Toutes les lignes de l'utilisateur avec start <= date_col < end, quel que soit leur nombre.
+
+    La plage est découpée en sous-plages lues en parallèle (pool borné), chacune paginée par
+    (date_col, id) ; le résultat est un seul DataFrame trié par (date_col, id).
+    """
+    cols = list(dict.fromkeys(["id", date_col] + list(columns)))
+    start, end = _utc(start), _utc(end)
+    days = max(1, (end - start).days)
+    n_slices = max(1, min(max_workers * 4, math.ceil(days / 30)))
+    bounds = list(pd.date_range(start, end, periods=n_slices + 1).floor("s"))
+    bounds[0], bounds[-1] = start, end
+    slices = [(a.isoformat(), b.isoformat()) for a, b in zip(bounds[:-1], bounds[1:])]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(slices)))) as pool:
+        parts = pool.map(lambda ab: _fetch_slice(sb, table, ",".join(cols), user_id, ab[0], ab[1],
+                                                 date_col, page_size), slices)
+        rows = [r for part in parts for r in part]
+    return pd.DataFrame.from_records(rows, columns=cols)
+
+
+def fetch_known_keys(sb, table: str, user_id: Any, key_col: str = "activity_id",
+                     date_col: str = "activity_date", page_size: int = PAGE_SIZE):
+    """Toutes les valeurs non nulles de `key_col` de l'utilisateur + la `date_col` la plus récente.
+
+    Deux colonnes seulement, paginées par clé sur `key_col` : coût proportionnel au nombre de
+    lignes, sans jamais relire le reste de la table.
+    """
+    keys: List[Any] = []
+    last = None
+    while True:
+        q = (sb.table(table)
+               .select(f"{key_col},{date_col}")
+               .eq("user_id", user_id)
+               .not_.is_(key_col, "null"))
+        if last is not None:
+            q = q.gt(key_col, last)
+        page = q.order(key_col).limit(page_size).execute().data or []
+        if not page:
+            break
+        keys.extend(r[key_col] for r in page)
+        last = page[-1][key_col]
+
+    res = (sb.table(table)
+             .select(date_col)
+             .eq("user_id", user_id)
+             .not_.is_(date_col, "null")
+             .order(date_col, desc=True)
+             .limit(1)
+           ).execute()
+    latest = res.data[0][date_col] if res.data else None
+    return keys, latest
+
+
+def count_rows(sb, table: str, user_id: Any) -> int:
+    """Nombre exact de lignes de l'utilisateur (en-tête Content-Range de count=exact)."""
+    res = (sb.table(table)
+             .select("id", count="exact")
+             .eq("user_id", user_id)
+             .limit(1)
+           ).execute()
+    return int(res.count or 0)
+
+
+def fetch_ids(sb, table: str, user_id: Any, page_size: int = PAGE_SIZE) -> List[Any]:
+    """Tous les id de l'utilisateur, une seule colonne paginée par clé sur id."""
+    ids: List[Any] = []
+    last = None
+    while True:
+        q = sb.table(table).select("id").eq("user_id", user_id)
+        if last is not None:
+            q = q.gt("id", last)
+        page = q.order("id").limit(page_size).execute().data or []
+        if not page:
+            break
+        ids.extend(r["id"] for r in page)
+        last = page[-1]["id"]
+    return ids
+
+
+def fetch_all_ranges(sb, table: str, columns: List[str], user_id: Any,
+                     page_size: int = PAGE_SIZE, max_workers: int = FETCH_WORKERS):
+    """Chargement complet : nombre exact d'abord, puis les plages [k*page_size, (k+1)*page_size[
+    triées par id, lues en parallèle (pool borné) et assemblées en un seul concat.
+
+    Retourne (DataFrame trié, nombre annoncé par le serveur). Un écart entre les deux signale
+    une table modifiée pendant la lecture ou un plafond max-rows inférieur à page_size.
+    """
+    cols = list(dict.fromkeys(["id"] + list(columns)))
+    expected = count_rows(sb, table, user_id)
+
+    def page(k: int) -> pd.DataFrame:
+        data = (sb.table(table)
+                  .select(",".join(cols))
+                  .eq("user_id", user_id)
+                  .order("id")
+                  .range(k * page_size, (k + 1) * page_size - 1)
+                ).execute().data or []
+        return pd.DataFrame.from_records(data, columns=cols)
+
+    n_pages = max(1, math.ceil(expected / page_size))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, n_pages))) as pool:
+        parts = list(pool.map(page, range(n_pages)))
+    df = pd.concat(parts, ignore_index=True)
+    # une ligne insérée pendant la lecture décale les plages suivantes : doublons possibles
+    return df.drop_duplicates("id", keep="last", ignore_index=True), expected
+
+
+def fetch_changed_since(sb, table: str, columns: List[str], user_id: Any, cursor=None,
+                        stamp_col: str = "updated_at", page_size: int = PAGE_SIZE):
+    """Lignes de l'utilisateur dont stamp_col dépasse `cursor` = (stamp, id), paginées par clé
+    (stamp_col, id). cursor=None : toutes les lignes horodatées (les NULL ne sont jamais
+    « modifiées depuis » : à rattraper par fetch_ids).
+
+    Retourne (DataFrame, nouveau curseur) ; le curseur est inchangé si rien n'a bougé.
+    """
+    cols = list(dict.fromkeys(["id", stamp_col] + list(columns)))
+    rows: List[Dict[str, Any]] = []
+    last = cursor
+    while True:
+        q = sb.table(table).select(",".join(cols)).eq("user_id", user_id)
+        if last is None:
+            q = q.not_.is_(stamp_col, "null")
+        else:
+            d, i = last
+            q = q.or_(f'{stamp_col}.gt."{d}",and({stamp_col}.eq."{d}",id.gt.{i})')
+        page = q.order(stamp_col).order("id").limit(page_size).execute().data or []
+        if not page:
+            break
+        rows.extend(page)
+        last = (page[-1][stamp_col], page[-1]["id"])
+    return pd.DataFrame.from_records(rows, columns=cols), last
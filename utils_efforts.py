@@ -0,0 +1,143 @@
+# utils_efforts.py — Meilleurs efforts (1 km, 5 km, 10 km, semi) calculés depuis les streams
+#
+# Pour chaque activité : distance cumulée (canal dist, sinon haversine sur lat/lon), puis pour
+# chaque distance cible D le segment le plus rapide [début, fin] tel que cum[fin] - cum[début] = D.
+# Fenêtre glissante à deux pointeurs, vectorisée : pour toutes les fins à la fois, le début est
+# retrouvé par interpolation sur la distance cumulée (monotone) -> O(n log n), jamais O(n²).
+#
+# Index par utilisateur : un CSV (data/efforts/<user_id>.csv), une ligne par (activité, effort),
+# mis à jour de façon incrémentale à chaque import de traces.
+import os
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils_store import store_dir, user_file, write_frame
+
+Streams = Dict[str, np.ndarray]
+
+EFFORT_DISTANCES: Dict[str, float] = {"1k": 1000.0, "5k": 5000.0, "10k": 10000.0, "half": 21097.5}
+EFFORT_LABELS: Dict[str, str] = {"1k": "1 km", "5k": "5 km", "10k": "10 km", "half": "Semi-marathon"}
+EFFORTS_DIR = store_dir("efforts")
+INDEX_COLS = ["activity_id", "activity_date", "effort", "meters", "seconds", "start_offset_s"]
+
+_EARTH_RADIUS_M = 6371008.8
+
+
+# =========================
+# Calcul
+# =========================
+def haversine_steps(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    """Distance (m) entre points consécutifs ; 0 pour le premier point et autour des trous GPS."""
+    la, lo = np.radians(lat), np.radians(lon)
+    dla, dlo = np.diff(la), np.diff(lo)
+    a = np.sin(dla / 2) ** 2 + np.cos(la[:-1]) * np.cos(la[1:]) * np.sin(dlo / 2) ** 2
+    d = 2 * _EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return np.concatenate([[0.0], np.nan_to_num(d, nan=0.0)])
+
+def cumulative_distance(streams: Streams) -> Optional[np.ndarray]:
+    """Distance cumulée (m, croissante) : canal 'dist' s'il est exploitable, sinon lat/lon."""
+    dist = streams.get("dist")
+    if dist is not None and np.isfinite(dist).sum() > 1:
+        cum = np.fmax.accumulate(np.asarray(dist, dtype="float64"))  # NaN -> dernière valeur
+        return np.nan_to_num(cum - np.nanmin(cum), nan=0.0)
+    if "lat" in streams and "lon" in streams:
+        return np.cumsum(haversine_steps(np.asarray(streams["lat"], dtype="float64"),
+                                         np.asarray(streams["lon"], dtype="float64")))
+    return None
+
+def best_efforts(streams: Streams, distances: Dict[str, float] = EFFORT_DISTANCES) -> Dict[str, Dict[str, float]]:
+    """{effort: {"seconds", "start_offset_s"}} pour chaque distance couverte par l'activité."""
+    t = streams.get("time")
+    cum = cumulative_distance(streams)
+    if t is None or cum is None:
+        return {}
+    t = np.asarray(t, dtype="float64")
+    ok = np.isfinite(t)
+    t, cum = t[ok], cum[ok]
+    if len(t) < 2:
+        return {}
+    # distance strictement croissante (pauses : même distance) pour l'interpolation
+    cum = cum + np.arange(len(cum)) * 1e-9
+
+    out: Dict[str, Dict[str, float]] = {}
+    for key, d in distances.items():
+        ends = np.flatnonzero(cum >= cum[0] + d)
+        if not len(ends):
+            continue
+        starts = np.interp(cum[ends] - d, cum, t)  # instant exact où le segment de longueur d commence
+        dt = t[ends] - starts
+        k = int(np.argmin(dt))
+        out[key] = {"seconds": float(dt[k]), "start_offset_s": float(starts[k] - t[0])}
+    return out
+
+
+# =========================
+# Index par utilisateur
+# =========================
+_cache: Dict[str, tuple] = {}
+
+def _index_path(user_id: Any) -> str:
+    return user_file(EFFORTS_DIR, user_id)
+
+def load_index(user_id: Any) -> pd.DataFrame:
+    """Index des meilleurs efforts de l'utilisateur (relu seulement si le fichier a changé)."""
+    path = _index_path(user_id)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return pd.DataFrame(columns=INDEX_COLS)
+    hit = _cache.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    idx = pd.read_csv(path, dtype={"effort": str})
+    idx["activity_date"] = pd.to_datetime(idx["activity_date"], utc=True, errors="coerce", format="ISO8601")
+    _cache[path] = (mtime, idx)
+    return idx
+
+def update_index(user_id: Any, tracks: Dict[Any, Streams], dates: Dict[Any, Any]) -> int:
+    """Calcule les efforts des activités de `tracks` et remplace leurs lignes dans l'index.
+
+    `dates` : {activity_id: activity_date ISO}. Les autres activités ne sont pas recalculées.
+    Retourne le nombre d'activités indexées.
+    """
+    if not tracks:
+        return 0
+    rows = []
+    for aid, streams in tracks.items():
+        for key, eff in best_efforts(streams).items():
+            rows.append({"activity_id": aid, "activity_date": dates.get(aid), "effort": key,
+                         "meters": EFFORT_DISTANCES[key], **eff})
+    new = pd.DataFrame.from_records(rows, columns=INDEX_COLS)
+    new["activity_date"] = pd.to_datetime(new["activity_date"], utc=True, errors="coerce", format="ISO8601")
+
+    idx = load_index(user_id)
+    keep = idx[~idx["activity_id"].isin(list(tracks))]
+    out = pd.concat([keep, new], ignore_index=True) if len(keep) else new
+    write_frame(_index_path(user_id), out, date_format="%Y-%m-%dT%H:%M:%S%z")
+    return len(tracks)
+
+def best_by_effort(idx: pd.DataFrame, year: Optional[int] = None,
+                   activity_ids: Optional[Iterable[Any]] = None) -> pd.DataFrame:
+    """Record par distance (optionnellement sur une année / un sous-ensemble d'activités)."""
+    sel = idx
+    if year is not None:
+        sel = sel[sel["activity_date"].dt.year == int(year)]
+    if activity_ids is not None:
+        sel = sel[sel["activity_id"].isin(list(activity_ids))]
+    if sel.empty:
+        return pd.DataFrame(columns=INDEX_COLS + ["pace_min_km"])
+    best = sel.loc[sel.groupby("effort")["seconds"].idxmin()].copy()
+    best["pace_min_km"] = best["seconds"] / 60.0 / (best["meters"] / 1000.0)
+    order = {k: i for i, k in enumerate(EFFORT_DISTANCES)}
+    return best.sort_values("effort", key=lambda s: s.map(order)).reset_index(drop=True)
+
+def efforts_wide(idx: pd.DataFrame) -> pd.DataFrame:
+    """Une ligne par activité, une colonne best_<effort>_s par distance (secondes)."""
+    if idx.empty:
+        return pd.DataFrame(columns=["activity_id"] + [f"best_{k}_s" for k in EFFORT_DISTANCES])
+    wide = idx.pivot_table(index="activity_id", columns="effort", values="seconds", aggfunc="min")
+    wide = wide.reindex(columns=list(EFFORT_DISTANCES))
+    wide.columns = [f"best_{k}_s" for k in wide.columns]
+    return wide.reset_index()
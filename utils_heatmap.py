@@ -0,0 +1,261 @@
+# utils_heatmap.py — Carte de chaleur personnelle : tuiles raster mises en cache
+#
+# Tous les points GPS de l'utilisateur sont stockés une seule fois, en coordonnées Web Mercator
+# entières (x, y sur 32 bits), sous forme de codes de Morton (bits de x et y entrelacés) triés :
+# une tuile z/x/y, à n'importe quel zoom, est alors une plage contiguë du tableau (searchsorted),
+# lue en memmap sans parcourir les autres points.
+# Une tuile = np.histogram2d des points de la plage sur 256 × 256 pixels, colorisée (échelle log)
+# et encodée en PNG (zlib + struct). Les PNG sont mis en cache sur disque par utilisateur, avec
+# pour chaque tuile le numéro de version des données qui l'a modifiée en dernier : un import ne
+# change la version que des tuiles touchées par ses nouveaux points.
+#
+# Fichiers par utilisateur (data/heatmap/<user_id>/) : points.npy, manifest.json, tiles/z/x/y_v<n>.png
+import base64
+import os
+import struct
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from utils_store import store_dir, atomic_path, read_json, write_json, write_bytes
+
+Streams = Dict[str, np.ndarray]
+
+TILE_PX = 256
+MIN_ZOOM, MAX_ZOOM = 5, 16
+REF_ZOOM = 14          # zoom où un pixel sature à SATURATION points
+SATURATION = 12.0
+VIEW_TILES = 4         # la vue de la page assemble VIEW_TILES × VIEW_TILES tuiles
+HEATMAP_DIR = store_dir("heatmap")
+
+_MAX_LAT = 85.05112878
+# dégradé transparent -> rouge -> orange -> jaune -> blanc (R, G, B, A) aux positions 0 … 1
+_STOPS = np.array([0.0, 0.25, 0.55, 0.8, 1.0])
+_COLORS = np.array([[120, 0, 0, 0], [200, 20, 0, 170], [255, 110, 0, 220], [255, 220, 40, 240], [255, 255, 255, 255]])
+_LUT = np.stack([np.interp(np.linspace(0, 1, 256), _STOPS, _COLORS[:, c]) for c in range(4)], axis=1).astype(np.uint8)
+
+
+# =========================
+# Coordonnées / codes de Morton
+# =========================
+def _spread(v: np.ndarray) -> np.ndarray:
+    v = v.astype(np.uint64)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+def _compact(v: np.ndarray) -> np.ndarray:
+    v = v & np.uint64(0x5555555555555555)
+    for shift, mask in ((1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                        (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)):
+        v = (v | (v >> np.uint64(shift))) & np.uint64(mask)
+    return v
+
+def morton(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Code de Morton uint64 : bits de y (poids forts de chaque paire) et de x entrelacés."""
+    return (_spread(y) << np.uint64(1)) | _spread(x)
+
+def lonlat_to_xy(lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Web Mercator -> coordonnées entières (uint32) dans un monde de 2^32 × 2^32."""
+    lat = np.radians(np.clip(lat, -_MAX_LAT, _MAX_LAT))
+    fx = (np.asarray(lon, dtype="float64") + 180.0) / 360.0
+    fy = (1.0 - np.log(np.tan(lat) + 1.0 / np.cos(lat)) / np.pi) / 2.0
+    scale = float(2**32 - 1)
+    return (np.clip(fx, 0, 1) * scale).astype(np.uint32), (np.clip(fy, 0, 1) * scale).astype(np.uint32)
+
+def tile_to_lonlat(z: int, tx: float, ty: float) -> Tuple[float, float]:
+    """Coin nord-ouest de la tuile (tx, ty) au zoom z (coordonnées fractionnaires acceptées)."""
+    n = 2.0**z
+    lon = tx / n * 360.0 - 180.0
+    lat = float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * ty / n)))))
+    return lon, lat
+
+def codes_from_streams(streams: Optional[Streams]) -> np.ndarray:
+    lat, lon = (streams.get("lat"), streams.get("lon")) if streams else (None, None)
+    if lat is None or lon is None:
+        return np.empty(0, dtype=np.uint64)
+    lat, lon = np.asarray(lat, dtype="float64"), np.asarray(lon, dtype="float64")
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    return morton(*lonlat_to_xy(lon[ok], lat[ok]))
+
+def _tile_range(z: int, tx: int, ty: int) -> Tuple[np.uint64, np.uint64]:
+    shift = np.uint64(64 - 2 * z)
+    lo = morton(np.array([tx]), np.array([ty]))[0] << shift
+    return lo, lo + (np.uint64(1) << shift) - np.uint64(1)
+
+
+# =========================
+# PNG (RGBA, sans dépendance)
+# =========================
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    h, w = rgba.shape[:2]
+    raw = np.concatenate([np.zeros((h, 1), dtype=np.uint8), rgba.reshape(h, w * 4)], axis=1)  # filtre 0 par ligne
+    return (b"\x89PNG\r\n\x1a\n"
+            + _chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 6, 0, 0, 0))
+            + _chunk(b"IDAT", zlib.compress(raw.tobytes(), 6))
+            + _chunk(b"IEND", b""))
+
+def decode_png(data: bytes) -> np.ndarray:
+    """Relit un PNG produit par encode_png (RGBA 8 bits, filtre 0) — pas un décodeur général."""
+    w, h = struct.unpack(">II", data[16:24])
+    pos, idat = 8, b""
+    while pos < len(data):
+        (n,) = struct.unpack(">I", data[pos:pos + 4])
+        if data[pos + 4:pos + 8] == b"IDAT":
+            idat += data[pos + 8:pos + 8 + n]
+        pos += n + 12
+    raw = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(h, w * 4 + 1)
+    return raw[:, 1:].reshape(h, w, 4)
+
+
+# =========================
+# Store par utilisateur
+# =========================
+class HeatmapStore:
+    """Points (codes de Morton triés) + tuiles PNG en cache pour un utilisateur."""
+
+    def __init__(self, user_id: Any, root: str = HEATMAP_DIR):
+        self.dir = os.path.join(root, str(user_id))
+        self._points: Optional[np.ndarray] = None
+
+    # -- état
+    def _manifest_path(self) -> str:
+        return os.path.join(self.dir, "manifest.json")
+
+    def manifest(self) -> Dict[str, Any]:
+        return read_json(self._manifest_path(), {"version": 0, "activities": [], "stamps": {}, "bbox": None})
+
+    def _write_manifest(self, man: Dict[str, Any]) -> None:
+        write_json(self._manifest_path(), man)
+
+    def points(self) -> np.ndarray:
+        if self._points is None:
+            try:
+                self._points = np.load(os.path.join(self.dir, "points.npy"), mmap_mode="r")
+            except OSError:
+                self._points = np.empty(0, dtype=np.uint64)
+        return self._points
+
+    # -- ajout incrémental
+    def add_tracks(self, tracks: Dict[Any, Streams]) -> Dict[str, int]:
+        """Ajoute les points des activités pas encore présentes ; invalide les seules tuiles
+        qu'ils touchent (à tous les zooms). Retourne {"activities", "points", "tiles"}."""
+        man = self.manifest()
+        known = set(map(str, man["activities"]))
+        new_ids = [aid for aid in tracks if str(aid) not in known]
+        parts = [codes_from_streams(tracks[aid]) for aid in new_ids]
+        new = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.uint64)
+        if not len(new):
+            return {"activities": 0, "points": 0, "tiles": 0}
+
+        old = np.asarray(self.points())
+        merged = np.insert(old, np.searchsorted(old, new), new) if len(old) else new
+        self._points = None
+        with atomic_path(os.path.join(self.dir, "points.npy")) as tmp, open(tmp, "wb") as fh:
+            np.save(fh, merged)
+
+        version = int(man["version"]) + 1
+        n_tiles = 0
+        for z in range(MIN_ZOOM, MAX_ZOOM + 1):
+            tiles = np.unique(new >> np.uint64(64 - 2 * z))
+            tx, ty = _compact(tiles), _compact(tiles >> np.uint64(1))
+            for x, y in zip(tx.tolist(), ty.tolist()):
+                key = f"{z}/{x}/{y}"
+                self._drop_tile(key, man["stamps"].get(key, 0))
+                man["stamps"][key] = version
+            n_tiles += len(tiles)
+        xs, ys = _compact(new), _compact(new >> np.uint64(1))
+        box = [int(xs.min()), int(ys.min()), int(xs.max()), int(ys.max())]
+        if man.get("bbox"):
+            b = man["bbox"]
+            box = [min(b[0], box[0]), min(b[1], box[1]), max(b[2], box[2]), max(b[3], box[3])]
+        man.update(version=version, bbox=box, activities=sorted(known | set(map(str, new_ids))))
+        self._write_manifest(man)
+        return {"activities": len(new_ids), "points": int(len(new)), "tiles": n_tiles}
+
+    def reset(self) -> None:
+        """Oublie points et tuiles (reconstruction complète)."""
+        man = self.manifest()
+        for key, stamp in man["stamps"].items():
+            self._drop_tile(key, stamp)
+        for name in ("points.npy", "manifest.json"):
+            try:
+                os.remove(os.path.join(self.dir, name))
+            except OSError:
+                pass
+        self._points = None
+
+    # -- tuiles
+    def _tile_path(self, key: str, stamp: int) -> str:
+        return os.path.join(self.dir, "tiles", f"{key}_v{stamp}.png")
+
+    def _drop_tile(self, key: str, stamp: int) -> None:
+        try:
+            os.remove(self._tile_path(key, stamp))
+        except OSError:
+            pass
+
+    def tile_rgba(self, z: int, tx: int, ty: int) -> np.ndarray:
+        """Raster RGBA 256 × 256 de la tuile (sans cache)."""
+        pts = self.points()
+        lo, hi = _tile_range(z, tx, ty)
+        codes = np.asarray(pts[np.searchsorted(pts, lo, "left"):np.searchsorted(pts, hi, "right")])
+        if not len(codes):
+            return np.zeros((TILE_PX, TILE_PX, 4), dtype=np.uint8)
+        sub = np.uint64(32 - z - 8)  # bits de pixel dans la tuile
+        px = (_compact(codes) >> sub) & np.uint64(TILE_PX - 1)
+        py = (_compact(codes >> np.uint64(1)) >> sub) & np.uint64(TILE_PX - 1)
+        counts, _, _ = np.histogram2d(py.astype(np.float64), px.astype(np.float64),
+                                      bins=TILE_PX, range=[[0, TILE_PX], [0, TILE_PX]])
+        sat = max(1.0, SATURATION * 2.0 ** (REF_ZOOM - z))
+        level = np.clip(np.log1p(counts) / np.log1p(sat), 0.0, 1.0)
+        rgba = _LUT[(level * 255).astype(np.uint8)]
+        rgba[counts == 0] = 0
+        return rgba
+
+    def tile_png(self, z: int, tx: int, ty: int) -> bytes:
+        """PNG de la tuile, relu du cache s'il correspond à la version de la tuile."""
+        key = f"{z}/{tx}/{ty}"
+        path = self._tile_path(key, self.manifest()["stamps"].get(key, 0))
+        try:
+            with open(path, "rb") as fh:
+                return fh.read()
+        except OSError:
+            pass
+        data = encode_png(self.tile_rgba(z, tx, ty))
+        write_bytes(path, data)
+        return data
+
+    # -- vue assemblée pour la page
+    def hot_spots(self, z: int = 10, limit: int = 10) -> List[Tuple[int, int, int]]:
+        """Tuiles du zoom z les plus denses : [(tx, ty, points)]."""
+        pts = np.asarray(self.points())
+        if not len(pts):
+            return []
+        tiles, counts = np.unique(pts >> np.uint64(64 - 2 * z), return_counts=True)
+        top = np.argsort(counts)[::-1][:limit]
+        return [(int(_compact(tiles[i:i + 1])[0]), int(_compact(tiles[i:i + 1] >> np.uint64(1))[0]), int(counts[i]))
+                for i in top]
+
+    def view(self, z: int, center_lon: float, center_lat: float,
+             n_tiles: int = VIEW_TILES) -> Tuple[bytes, List[List[float]]]:
+        """Mosaïque n × n tuiles centrée sur (lon, lat) : (PNG, coins [lon, lat] NO, NE, SE, SO)."""
+        x, y = lonlat_to_xy(np.array([center_lon]), np.array([center_lat]))
+        cx, cy = int(x[0]) >> (32 - z), int(y[0]) >> (32 - z)
+        x0, y0 = max(0, cx - n_tiles // 2), max(0, cy - n_tiles // 2)
+        mosaic = np.zeros((n_tiles * TILE_PX, n_tiles * TILE_PX, 4), dtype=np.uint8)
+        for j in range(n_tiles):
+            for i in range(n_tiles):
+                mosaic[j * TILE_PX:(j + 1) * TILE_PX, i * TILE_PX:(i + 1) * TILE_PX] = \
+                    decode_png(self.tile_png(z, x0 + i, y0 + j))
+        w, n = tile_to_lonlat(z, x0, y0)
+        e, s = tile_to_lonlat(z, x0 + n_tiles, y0 + n_tiles)
+        return encode_png(mosaic), [[w, n], [e, n], [e, s], [w, s]]
+
+def png_data_uri(data: bytes) -> str:
+    return "data:image/png;base64," + base64.b64encode(data).decode("ascii")
@@ -0,0 +1,887 @@
+# utils_import.py — Schéma, conversions et moteur colonnaire de l'import Strava
+import csv
+import hashlib
+import re
+import sys
+import math
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Sequence, Iterator, Tuple, BinaryIO
+
+import numpy as np
+import pandas as pd
+
+# =========================
+# Helpers
+# =========================
+_NUMERIC_STR_RE = re.compile(r'^[+-]?\d+(?:[.,]\d+)?$')  # ← gère , et .
+
+def _looks_numeric_str(s: Any) -> bool:
+    return isinstance(s, str) and _NUMERIC_STR_RE.match(s.strip() or "") is not None
+
+def _coerce_numeric_str_any(s: Any):
+    """'7'/'7.0'/'7,0'/'-3,50' -> int ou float ; sinon inchangé."""
+    if s is None:
+        return s
+    # si c'est déjà un nombre
+    if isinstance(s, (int, float)):
+        try:
+            if isinstance(s, float) and not math.isfinite(s):
+                return None
+            return s
+        except Exception:
+            return None
+    if not isinstance(s, str):
+        return s
+    raw = s.strip()
+    if raw == "":
+        return None
+    if _looks_numeric_str(raw):
+        # virgule décimale -> point si pas déjà de point
+        if "," in raw and "." not in raw:
+            raw = raw.replace(",", ".")
+        try:
+            f = float(raw)
+        except Exception:
+            return s
+        if math.isfinite(f) and float(f).is_integer():
+            return int(f)
+        return f if math.isfinite(f) else None
+    return s
+
+def _snake(s: str) -> str:
+    if s is None:
+        return s
+    s = unicodedata.normalize("NFKD", s).encode("ascii", "ignore").decode("ascii")
+    s = s.strip().lower()
+    s = s.replace(".", "_").replace("-", "_").replace("/", "_").replace(" ", "_").replace("’", "_").replace("'", "_")
+    while "__" in s:
+        s = s.replace("__", "_")
+    return s
+
+def _to_bool(x):
+    if x is None or (isinstance(x, float) and pd.isna(x)): return None
+    if isinstance(x, bool): return x
+    s = str(x).strip().lower()
+    if s in ("true","1","yes","y","vrai","oui"):  return True
+    if s in ("false","0","no","n","faux","non"):  return False
+    return None
+
+def _to_int(x):
+    if x is None or (isinstance(x, float) and pd.isna(x)) or str(x).strip()=="":
+        return None
+    x = _coerce_numeric_str_any(x)
+    try:
+        return int(x)
+    except Exception:
+        try:
+            return int(float(str(x).strip()))
+        except Exception:
+            return None
+
+def _to_float(x):
+    if x is None or (isinstance(x, float) and pd.isna(x)) or str(x).strip()=="":
+        return None
+    x = _coerce_numeric_str_any(x)
+    try:
+        v = float(x)
+        return v if math.isfinite(v) else None
+    except Exception:
+        return None
+
+# Formats essayés par _to_time / _to_timestamptz (dans cet ordre)
+TIME_FORMATS = ("%H:%M:%S", "%H:%M")
+TS_FORMATS   = ("%Y-%m-%d %H:%M:%S%z", "%Y-%m-%d %H:%M:%S", "%d/%m/%Y %H:%M:%S", "%Y-%m-%d", "%d/%m/%Y")
+# Formats d'export que _to_timestamptz ne lit que via pd.to_datetime (même résultat, UTC)
+TS_EXTRA_FORMATS = ("%b %d, %Y, %I:%M:%S %p",)  # export Strava anglais : "Mar 7, 2021, 6:33:58 PM"
+
+def _to_time(s):
+    """Renvoie 'HH:MM:SS' ou None (JSON-safe)."""
+    if s is None or (isinstance(s, float) and pd.isna(s)) or str(s).strip()=="":
+        return None
+    txt = str(s).strip()
+    for fmt in TIME_FORMATS:
+        try:
+            t = datetime.strptime(txt, fmt).time()
+            return t.strftime("%H:%M:%S")
+        except Exception:
+            continue
+    return None
+
+def _to_timestamptz(s):
+    """Renvoie ISO 8601 (UTC si pas de tz) ou None."""
+    if s is None or (isinstance(s, float) and pd.isna(s)) or str(s).strip()=="":
+        return None
+    txt = str(s).strip()
+    for fmt in TS_FORMATS:
+        try:
+            dt = datetime.strptime(txt, fmt)
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return dt.isoformat()
+        except Exception:
+            continue
+    try:
+        dt = pd.to_datetime(txt, utc=True)
+        return dt.isoformat()
+    except Exception:
+        # fallback contrôlé
+        return None
+
+# =========================
+# Conversions spécifiques
+# =========================
+def _sec_to_min_int(x):
+    """secondes -> minutes (entier, arrondi)."""
+    v = _to_float(x)
+    if v is None: return None
+    return int(round(v / 60.0))
+
+def _sec_to_min_float(x):
+    """secondes -> minutes (float)."""
+    v = _to_float(x)
+    if v is None: return None
+    return v / 60.0
+
+def _ms_to_min_per_km(x):
+    """m/s -> min/km."""
+    v = _to_float(x)
+    if v is None or v == 0: return None
+    return 1000.0 / (v * 60.0)  # = 16.6666667 / v
+
+# =========================
+# Schéma / Types (identiques à ta version)
+# =========================
+TABLE_COLS = [
+    "activity_id","activity_date","activity_name","activity_type","activity_description",
+    "elapsed_time","distance","max_heart_rate","relative_effort","commute","activity_private_note",
+    "activity_gear","filename","athlete_weight",
+    # "bike_weight" SUPPRIMÉ
+    # "elapsed_time_1" SUPPRIMÉ
+    "moving_time",
+    # "distance_1" SUPPRIMÉ
+    "max_speed","average_speed","elevation_gain","elevation_loss","elevation_low",
+    "elevation_high","max_grade","average_grade","average_positive_grade","average_negative_grade",
+    "max_cadence","average_cadence","max_heart_rate_1","average_heart_rate",
+    # "max_watts","average_watts" SUPPRIMÉS
+    "calories","max_temperature","average_temperature","relative_effort_1",
+    "total_work","number_of_runs","uphill_time","downhill_time","other_time","perceived_exertion",
+    "type_text","start_time","weighted_average_power","power_count","prefer_perceived_exertion",
+    "perceived_relative_effort","commute_1","total_weight_lifted","from_upload","grade_adjusted_distance",
+    "weather_observation_time","weather_condition","weather_temperature","apparent_temperature",
+    "dewpoint","humidity","weather_pressure","wind_speed","wind_gust","wind_bearing",
+    "precipitation_intensity",
+    # "sunrise_time","sunset_time" SUPPRIMÉS
+    "moon_phase",
+    # "bike_text","gear_text" SUPPRIMÉS
+    "precipitation_probability","precipitation_type","cloud_cover","weather_visibility","uv_index",
+    "weather_ozone","jump_count","total_grit","average_flow","flagged","average_elapsed_speed",
+    "dirt_distance","newly_explored_distance","newly_explored_dirt_distance","activity_count",
+    "total_steps",
+    # "carbon_saved" SUPPRIMÉ
+    "pool_length","training_load","intensity",
+    "average_grade_adjusted_pace","timer_time","total_cycles","recovery","with_pet","competition",
+    "long_run","for_a_cause","media_text",
+]
+
+# En-têtes anglais spéciaux déjà gérés
+SPECIAL_HEADER_MAP = {"type":"type_text","media":"media_text","bike":"bike_text","gear":"gear_text"}
+
+# === Mapping des en-têtes FR normalisés -> colonnes cibles ===
+FR_HEADER_MAP = {
+    "id_de_l_activite": "activity_id",
+    "date_de_l_activite": "activity_date",
+    "nom_de_l_activite": "activity_name",
+    "type_d_activite": "activity_type",
+    "description_de_l_activite": "activity_description",
+    "temps_ecoule": "elapsed_time",
+    "distance": "distance",
+    "frequence_cardiaque_max": "max_heart_rate",
+    "effort_relatif": "relative_effort",
+    "deplacement_transport": "commute",
+    "note_privee_sur_les_activites": "activity_private_note",
+    "materiel_utilise_pour_l_activite": "activity_gear",
+    "nom_du_fichier": "filename",
+    "poids_de_l_athlete": "athlete_weight",
+    "poids_du_velo": "bike_weight",
+    "temps_ecoule_1": "elapsed_time_1",
+    "temps_en_mouvement": "moving_time",
+    "distance_1": "distance_1",
+    "vitesse_max": "max_speed",
+    "vitesse_moyenne": "average_speed",
+    "denivele_positif": "elevation_gain",
+    "denivele_negatif": "elevation_loss",
+    "altitude_min": "elevation_low",
+    "altitude_max": "elevation_high",
+    "pente_max": "max_grade",
+    "pente_moyenne": "average_grade",
+    "pente_positive_moyenne": "average_positive_grade",
+    "pente_negative_moyenne": "average_negative_grade",
+    "cadence_max": "max_cadence",
+    "cadence_moyenne": "average_cadence",
+    "frequence_cardiaque_max_1": "max_heart_rate_1",
+    "frequence_cardiaque_moyenne": "average_heart_rate",
+    "calories": "calories",
+    "temperature_max": "max_temperature",
+    "temperature_moyenne": "average_temperature",
+    "effort_relatif_1": "relative_effort_1",
+    "effort_total": "total_work",
+    "nombre_de_sorties_course_a_pied": "number_of_runs",
+    "temps_de_montee": "uphill_time",
+    "temps_de_descente": "downhill_time",
+    "autres_temps": "other_time",
+    "effort_ressenti": "perceived_exertion",
+    "type": "type_text",
+    "heure_de_debut": "start_time",
+    "puissance_moyenne_ponderee": "weighted_average_power",
+    "nombre_d_echantillons_de_puissance": "power_count",
+    "utiliser_l_effort_ressenti": "prefer_perceived_exertion",
+    "effort_relatif_ressenti": "perceived_relative_effort",
+    "deplacement_transport_1": "commute_1",
+    "poids_total_souleve": "total_weight_lifted",
+    "depuis_un_import": "from_upload",
+    "importe": "from_upload",
+    "distance_ajustee_selon_la_pente": "grade_adjusted_distance",
+    "heure_d_observation_meteo": "weather_observation_time",
+    "conditions_meteo": "weather_condition",
+    "temperature": "weather_temperature",
+    "temperature_ressentie": "apparent_temperature",
+    "point_de_rosee": "dewpoint",
+    "humidite": "humidity",
+    "pression_meteo": "weather_pressure",
+    "vitesse_du_vent": "wind_speed",
+    "rafale_de_vent": "wind_gust",
+    "direction_du_vent": "wind_bearing",
+    "intensite_des_precipitations": "precipitation_intensity",
+    "phase_lunaire": "moon_phase",
+    "probabilite_de_precipitations": "precipitation_probability",
+    "type_de_precipitations": "precipitation_type",
+    "nebulosite": "cloud_cover",
+    "visibilite_meteo": "weather_visibility",
+    "indice_uv": "uv_index",
+    "ozone_meteo": "weather_ozone",
+    "sauts": "jump_count",
+    "grit_total": "total_grit",
+    "flow_moyen": "average_flow",
+    "signale": "flagged",
+    "vitesse_moyenne_ecoulee": "average_elapsed_speed",
+    "distance_sur_route_non_goudronnee": "dirt_distance",
+    "distance_nouvellement_exploree": "newly_explored_distance",
+    "distance_nouvellement_exploree_sur_route_non_goudronnee": "newly_explored_dirt_distance",
+    "nombre_d_activites": "activity_count",
+    "nombre_total_de_pas": "total_steps",
+    # "co2_economise": "carbon_saved",
+    "longueur_de_piscine": "pool_length",
+    "charge_d_entrainement": "training_load",
+    "intensite": "intensity",
+    "vitesse_moyenne_ajustee_selon_la_pente": "average_grade_adjusted_pace",
+    "temps_enregistre_par_le_chronometre": "timer_time",
+    "nombre_total_de_cycles": "total_cycles",
+    "recuperation": "recovery",
+    "avec_mon_animal_de_compagnie": "with_pet",
+    "competition": "competition",
+    "sortie_longue": "long_run",
+    "pour_la_bonne_cause": "for_a_cause",
+    "support": "media_text",
+}
+
+# Types par colonne
+BOOL_COLS  = {"commute","prefer_perceived_exertion","commute_1","from_upload","flagged","with_pet","competition","long_run","for_a_cause"}
+INT_COLS   = {"elapsed_time","activity_id","uphill_time","downhill_time","other_time","power_count","perceived_relative_effort","relative_effort_1","number_of_runs","jump_count","total_cycles","timer_time","max_heart_rate_1","average_heart_rate","total_steps"}
+TIME_COLS  = {"start_time"}
+TS_COLS    = {"activity_date","weather_observation_time"}
+
+FLOAT_COLS = set(TABLE_COLS) - BOOL_COLS - INT_COLS - TIME_COLS - TS_COLS - {
+    "type_text","activity_name","activity_type","activity_description","activity_private_note",
+    "activity_gear","filename","weather_condition","precipitation_type","media_text"
+}
+TEXT_COLS  = set(TABLE_COLS) - (BOOL_COLS | INT_COLS | TIME_COLS | TS_COLS | FLOAT_COLS)
+
+def _text_conv(x):
+    if x is None or (isinstance(x, float) and pd.isna(x)) or str(x).strip()=="":
+        return None
+    return str(x)
+
+CONVERTER_BY_COL: Dict[str, Any] = {}
+for c in BOOL_COLS:  CONVERTER_BY_COL[c] = _to_bool
+for c in INT_COLS:   CONVERTER_BY_COL[c] = _to_int
+for c in FLOAT_COLS: CONVERTER_BY_COL[c] = _to_float
+for c in TIME_COLS:  CONVERTER_BY_COL[c] = _to_time
+for c in TS_COLS:    CONVERTER_BY_COL[c] = _to_timestamptz
+for c in TEXT_COLS:  CONVERTER_BY_COL[c] = _text_conv
+
+# Distances Strava : déjà en km
+DIST_M_COLS = set()  # (désactivé)
+
+# Doublons: tolérances (sur km / mètres)
+D_TOL_KM, DPLUS_TOL, DMOINS_TOL = 0.2, 50.0, 50.0
+
+# =========================
+# Normalisation JSON — Garde-fou universel
+# =========================
+def _json_safe_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    safe: Dict[str, Any] = {}
+    for k, v in row.items():
+        try:
+            if pd.isna(v): v = None
+        except Exception:
+            pass
+        if isinstance(v, str) and _looks_numeric_str(v):
+            v = _coerce_numeric_str_any(v)
+        if isinstance(v, float) and math.isfinite(v) and float(v).is_integer():
+            v = int(v)
+        if isinstance(v, float) and not math.isfinite(v):
+            v = None
+        if isinstance(v, (pd.Timestamp, datetime)):
+            v = v.isoformat()
+        safe[k] = v
+    return safe
+
+# =========================
+# Filtre RUN
+# =========================
+# Normalisation des valeurs de Type activité (FR/EN)
+RUN_TYPES_CANON = {"run", "trail_run", "virtual_run"}
+RUN_TYPES_FR_MAP = {
+    "course_a_pied": "run",
+    "course": "run",
+    "course_sur_sentier": "trail_run",
+    "course_a_pied_virtuelle": "virtual_run",
+}
+
+def _normalize_activity_type_value(v: Any) -> str:
+    if v is None:
+        return ""
+    s = _snake(str(v))
+    return RUN_TYPES_FR_MAP.get(s, s)  # garde l'anglais si déjà présent
+
+def run_mask(activity_type: pd.Series) -> pd.Series:
+    """Masque des lignes 'run' (normalisation calculée une fois par valeur distincte)."""
+    norm = {v: _normalize_activity_type_value(v) for v in activity_type.dropna().unique()}
+    return activity_type.map(norm).isin(RUN_TYPES_CANON)
+
+
+# =========================
+# Fusion 'combine'
+# =========================
+def fill_missing(current: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Colonnes vides en base que le CSV peut compléter -> {colonne: valeur CSV}."""
+    to_set = {}
+    for k, v in payload.items():
+        if k in ("id","user_id","created_at","updated_at"): continue
+        if k not in TABLE_COLS: continue
+        if (current.get(k) is None) and (v is not None and v != ""):
+            to_set[k] = v
+    return to_set
+
+# =========================
+# Décisions de revue
+# =========================
+DECISIONS = ["combine", "replace", "ignore", "insert"]
+
+def collect_actions(rows_to_show: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]],
+                    decisions: Dict[int, str]):
+    """(payload, doublon) + décisions par index -> (inserts, [(id, payload)] à remplacer, [(id, payload)] à combiner).
+    Sans décision : 'replace' si doublon, sinon 'insert'."""
+    insert_payloads: List[Dict[str, Any]] = []
+    replace_payloads: List[Tuple[int, Dict[str, Any]]] = []
+    combine_payloads: List[Tuple[int, Dict[str, Any]]] = []
+    for i, (new_row, existing_row) in enumerate(rows_to_show):
+        choice = decisions.get(i) or ("replace" if existing_row else "insert")
+        if choice == "insert" and not existing_row:
+            insert_payloads.append(new_row)
+        elif choice == "replace" and existing_row:
+            replace_payloads.append((existing_row["id"], new_row.copy()))
+        elif choice == "combine" and existing_row:
+            combine_payloads.append((existing_row["id"], new_row))
+    return insert_payloads, replace_payloads, combine_payloads
+
+# Colonnes comparées (CSV vs base) dans la revue en tableau
+REVIEW_COMPARE_COLS = ["activity_date", "activity_name", "activity_type", "distance",
+                       "elevation_gain", "elevation_loss", "moving_time"]
+
+def review_frame(rows_to_show: List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]],
+                 decisions: Dict[int, str]) -> pd.DataFrame:
+    """Une ligne par import AVEC doublon : n° de ligne, id en base, décision,
+    puis chaque colonne comparée en version CSV et en version base (suffixe « (base) »)."""
+    records = []
+    for i, (new_row, existing_row) in enumerate(rows_to_show):
+        if not existing_row:
+            continue
+        rec: Dict[str, Any] = {"ligne": i, "id_base": existing_row.get("id"),
+                               "decision": decisions.get(i) or "replace"}
+        for c in REVIEW_COMPARE_COLS:
+            rec[c] = new_row.get(c)
+            rec[f"{c} (base)"] = existing_row.get(c)
+        records.append(rec)
+    cols = ["ligne", "id_base", "decision"] + [x for c in REVIEW_COMPARE_COLS for x in (c, f"{c} (base)")]
+    return pd.DataFrame.from_records(records, columns=cols)
+
+# =========================
+# Chemin de référence (cellule par cellule)
+# =========================
+def finalize_row(row_dict: Dict[str, Any], user_id: Any) -> Dict[str, Any]:
+    """Typage final d'une ligne via CONVERTER_BY_COL (lent, sert de référence)."""
+    payload = {}
+    for k in TABLE_COLS:
+        conv = CONVERTER_BY_COL.get(k, lambda x: x)
+        payload[k] = conv(row_dict.get(k, None))
+    payload["user_id"] = user_id
+    return _json_safe_row(payload)
+
+def convert_frame_rowwise(df: pd.DataFrame, user_id: Any) -> List[Dict[str, Any]]:
+    """Ancien pipeline de l'Importer : transformations .map puis finalize_row par ligne."""
+    df = df.copy()
+    if "elapsed_time" in df.columns:
+        df["elapsed_time"] = df["elapsed_time"].map(_sec_to_min_int)
+    if "moving_time" in df.columns:
+        df["moving_time"] = df["moving_time"].map(_sec_to_min_float)
+    for c in ("max_speed", "average_speed", "average_grade_adjusted_pace"):
+        if c in df.columns:
+            df[c] = df[c].map(_ms_to_min_per_km)
+    for c in ("max_cadence", "average_cadence"):
+        if c in df.columns:
+            df[c] = df[c].map(lambda v: _to_float(v)*2 if _to_float(v) is not None else None)
+    for c in df.columns:
+        df[c] = df[c].map(_coerce_numeric_str_any)
+    df = df.where(pd.notna(df), None)
+    return [finalize_row(r, user_id) for r in df.to_dict("records")]
+
+# =========================
+# Moteur colonnaire (une passe vectorisée par colonne)
+# =========================
+_BOOL_TOKENS = {
+    "true": True, "1": True, "yes": True, "y": True, "vrai": True, "oui": True,
+    "false": False, "0": False, "no": False, "n": False, "faux": False, "non": False,
+}
+
+def _numeric_strings(s: pd.Series):
+    """Colonne texte -> (valeurs float64, masque 'chaîne numérique' au sens de _NUMERIC_STR_RE).
+    La virgule décimale FR n'est remplacée que sur les chaînes reconnues comme numériques."""
+    txt = s.astype(object).where(s.notna(), None).astype("string").str.strip()
+    is_num = txt.str.match(_NUMERIC_STR_RE.pattern).fillna(False).astype(bool)
+    txt = txt.mask(is_num, txt.str.replace(",", ".", regex=False))
+    vals = pd.to_numeric(txt.astype(object), errors="coerce")
+    return vals.to_numpy(dtype="float64", copy=True), is_num.to_numpy(), txt
+
+def _to_float_vec(s: pd.Series) -> np.ndarray:
+    """Équivalent colonne de _to_float : float64, NaN si vide / non convertible / non fini."""
+    if pd.api.types.is_bool_dtype(s) or pd.api.types.is_numeric_dtype(s):
+        vals = s.astype("float64").to_numpy(copy=True)
+    else:
+        vals, _, _ = _numeric_strings(s)
+    vals[~np.isfinite(vals)] = np.nan
+    return vals
+
+def _number_objects(vals: np.ndarray, as_int: bool = False) -> np.ndarray:
+    """float64 -> tableau d'objets JSON-safe (int si valeur entière, float sinon, None si NaN).
+    as_int=True tronque comme int() (colonnes INT)."""
+    out = np.full(len(vals), None, dtype=object)
+    valid = np.isfinite(vals)
+    if as_int:
+        vals = np.trunc(vals)
+    whole = valid & (vals == np.floor(vals))
+    small = whole & (np.abs(vals) < 2**53)
+    out[small] = vals[small].astype(np.int64).tolist()
+    big = whole & ~small
+    if big.any():
+        out[big] = [int(v) for v in vals[big]]
+    frac = valid & ~whole
+    out[frac] = vals[frac].tolist()
+    return out
+
+def _ms_to_min_per_km_vec(v: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(v == 0, np.nan, 1000.0 / (v * 60.0))
+
+# Transformations d'unités (appliquées sur les valeurs numériques, avant typage final)
+UNIT_TRANSFORMS = {
+    "elapsed_time": lambda v: np.round(v / 60.0),   # s -> min (entier arrondi)
+    "moving_time": lambda v: v / 60.0,              # s -> min
+    "max_speed": _ms_to_min_per_km_vec,             # m/s -> min/km
+    "average_speed": _ms_to_min_per_km_vec,
+    "average_grade_adjusted_pace": _ms_to_min_per_km_vec,
+    "max_cadence": lambda v: v * 2,                 # rpm -> ppm
+    "average_cadence": lambda v: v * 2,
+}
+
+def _convert_bool(s: pd.Series) -> np.ndarray:
+    if pd.api.types.is_bool_dtype(s):
+        return s.to_numpy(dtype=object, copy=True)
+    key = s.astype(object).where(s.notna(), None).astype("string").str.strip().str.lower()
+    out = key.map(_BOOL_TOKENS).to_numpy(dtype=object, copy=True)
+    out[pd.isna(out)] = None
+    if not pd.api.types.is_numeric_dtype(s):
+        vals, is_num, _ = _numeric_strings(s)
+        out[is_num] = None
+        out[is_num & (vals == 1)] = True
+        out[is_num & (vals == 0)] = False
+    return out
+
+def _convert_number(s: pd.Series, col: str, as_int: bool) -> np.ndarray:
+    if as_int and col not in UNIT_TRANSFORMS and pd.api.types.is_integer_dtype(s) \
+            and not pd.api.types.is_bool_dtype(s):
+        return s.to_numpy(dtype=object, copy=True)
+    vals = _to_float_vec(s)
+    tf = UNIT_TRANSFORMS.get(col)
+    if tf is not None:
+        with np.errstate(invalid="ignore", over="ignore"):
+            vals = tf(vals)
+    return _number_objects(vals, as_int=as_int)
+
+def _convert_text(s: pd.Series) -> np.ndarray:
+    if pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s):
+        return _number_objects(s.astype("float64").to_numpy())
+    vals, is_num, txt = _numeric_strings(s)
+    out = s.astype(object).where(s.notna(), None).to_numpy(copy=True)
+    out[(txt.fillna("") == "").to_numpy()] = None
+    out[is_num] = _number_objects(vals[is_num])
+    return out
+
+_TZ_SUFFIX_RE = r'^(.*?)(Z|[+-]\d{2}:?\d{2})$'
+
+def infer_datetime_format(values: pd.Series, formats: Sequence[str], sample_size: int = 200) -> Optional[str]:
+    """Format majoritaire d'une colonne, estimé sur un échantillon de valeurs non vides.
+    Chaque valeur compte pour le premier format (ordre de `formats`) qui la lit."""
+    values = values.dropna()
+    if len(values) > sample_size:
+        values = values.iloc[np.linspace(0, len(values) - 1, sample_size).astype(int)]
+    counts: Dict[str, int] = {}
+    for v in values:
+        for fmt in formats:
+            try:
+                datetime.strptime(v, fmt)
+            except ValueError:
+                continue
+            counts[fmt] = counts.get(fmt, 0) + 1
+            break
+    return max(counts, key=counts.get) if counts else None
+
+def _parse_with_format(txt: pd.Series, fmt: str, as_time: bool) -> pd.Series:
+    """Parse vectorisé avec un format fixe -> chaînes au format de _to_time/_to_timestamptz (NaN si échec)."""
+    if as_time:
+        return pd.to_datetime(txt, format=fmt, errors="coerce").dt.strftime("%H:%M:%S")
+    if "%z" not in fmt:
+        dt = pd.to_datetime(txt, format=fmt, errors="coerce")
+        return dt.dt.strftime("%Y-%m-%dT%H:%M:%S") + "+00:00"
+    # Fuseau explicite : isoformat() conserve le décalage d'origine
+    parts = txt.str.extract(_TZ_SUFFIX_RE)
+    local = pd.to_datetime(parts[0], format=fmt.replace("%z", ""), errors="coerce")
+    off = parts[1].str.replace(":", "", regex=False).replace("Z", "+0000")
+    return local.dt.strftime("%Y-%m-%dT%H:%M:%S") + off.str[:3] + ":" + off.str[3:]
+
+def _convert_datetime(s: pd.Series, col: str, report: Optional[Dict[str, Dict[str, Any]]]) -> np.ndarray:
+    """Colonne date/heure : format inféré une fois, parse vectorisé, lignes en échec -> chemin lent."""
+    as_time = col in TIME_COLS
+    formats = TIME_FORMATS if as_time else TS_FORMATS + TS_EXTRA_FORMATS
+    raw = s.to_numpy(dtype=object, copy=True)
+    txt = pd.Series(raw, index=s.index, dtype=object).where(s.notna(), None) \
+            .astype("string").str.strip().astype(object)
+    blank = (txt.isna() | (txt == "")).to_numpy()
+
+    out = np.full(len(s), None, dtype=object)
+    fmt = infer_datetime_format(txt[~blank], formats)
+    ok = np.zeros(len(s), dtype=bool)
+    if fmt is not None:
+        parsed = _parse_with_format(txt.where(~blank, None), fmt, as_time)
+        ok = parsed.notna().to_numpy() & ~blank
+        out[ok] = parsed[ok].tolist()
+
+    slow = ~ok & ~blank
+    if slow.any():
+        conv = CONVERTER_BY_COL[col]
+        out[slow] = [conv(_coerce_numeric_str_any(v)) for v in raw[slow]]
+    if report is not None:
+        # cumulatif : un même rapport peut servir pour plusieurs blocs (lecture streaming)
+        rep = report.setdefault(col, {"format": None, "vectorized": 0, "fallback": 0, "failed": 0})
+        rep["format"] = rep["format"] or fmt
+        rep["vectorized"] += int(ok.sum())
+        rep["fallback"] += int(slow.sum())
+        rep["failed"] += int(sum(v is None or v == "NaT" for v in out[slow]))
+    return out
+
+def convert_frame(df: pd.DataFrame,
+                  report: Optional[Dict[str, Dict[str, Any]]] = None) -> pd.DataFrame:
+    """Typage final de toutes les colonnes TABLE_COLS, une passe vectorisée par colonne.
+
+    Produit les mêmes valeurs JSON-safe que convert_frame_rowwise (colonnes object :
+    int/float/bool/str/None), transformations d'unités comprises.
+    Si `report` est fourni, il reçoit par colonne date/heure le format détecté et le
+    nombre de lignes parsées en vectorisé, passées par le chemin lent, et illisibles.
+    """
+    n = len(df)
+    data: Dict[str, Any] = {}
+    for c in TABLE_COLS:
+        if c not in df.columns:
+            data[c] = np.full(n, None, dtype=object)
+            continue
+        s = df[c]
+        if c in BOOL_COLS:
+            data[c] = _convert_bool(s)
+        elif c in INT_COLS:
+            data[c] = _convert_number(s, c, as_int=True)
+        elif c in FLOAT_COLS:
+            data[c] = _convert_number(s, c, as_int=False)
+        elif c in TEXT_COLS:
+            data[c] = _convert_text(s)
+        else:
+            data[c] = _convert_datetime(s, c, report)
+    return pd.DataFrame(data, index=df.index, columns=TABLE_COLS, dtype=object)
+
+def frame_to_payloads(conv: pd.DataFrame, user_id: Any) -> List[Dict[str, Any]]:
+    """Frame issue de convert_frame -> liste de payloads prêts pour strava_import."""
+    rows = conv.to_dict("records")
+    for r in rows:
+        r["user_id"] = user_id
+    return rows
+
+# =========================
+# Lecture streaming (gros activities.csv)
+# =========================
+STREAM_CHUNK_ROWS = 5000
+STREAM_THRESHOLD_BYTES = 20 * 1024 * 1024  # au-delà, la lecture par blocs est proposée par défaut
+
+def read_header(f: BinaryIO) -> List[str]:
+    """Première ligne du CSV (le curseur est remis à sa position)."""
+    pos = f.tell()
+    line = f.readline().decode("utf-8-sig")
+    f.seek(pos)
+    return next(csv.reader([line]), [])
+
+def resolve_header_map(header: List[str]) -> Dict[int, str]:
+    """Position de colonne -> colonne cible, pour les seules colonnes de TABLE_COLS.
+
+    Reproduit le renommage de pd.read_csv pour les en-têtes en double
+    ('Distance', 'Distance.1' -> distance, distance_1) puis _snake + FR/SPECIAL_HEADER_MAP.
+    """
+    seen: Dict[str, int] = {}
+    wanted = set(TABLE_COLS)
+    mapping: Dict[int, str] = {}
+    for i, name in enumerate(header):
+        n = seen.get(name, 0)
+        seen[name] = n + 1
+        c = _snake(f"{name}.{n}" if n else name)
+        target = FR_HEADER_MAP.get(c) or SPECIAL_HEADER_MAP.get(c, c)
+        if target in wanted and target not in mapping.values():
+            mapping[i] = target
+    return mapping
+
+def iter_run_chunks(f: BinaryIO, header_map: Dict[int, str],
+                    chunksize: int = STREAM_CHUNK_ROWS) -> Iterator[Tuple[pd.DataFrame, int]]:
+    """Lit le CSV par blocs de `chunksize` lignes, colonnes utiles uniquement (en texte),
+    et ne garde que les 'run'. Produit (bloc filtré, nb de lignes lues dans le bloc)."""
+    positions = sorted(header_map)
+    reader = pd.read_csv(f, usecols=positions, dtype=str, chunksize=chunksize)
+    for chunk in reader:
+        chunk.columns = [header_map[i] for i in positions]
+        yield chunk[run_mask(chunk["activity_type"])], len(chunk)
+
+def read_runs_streaming(f: BinaryIO, chunksize: int = STREAM_CHUNK_ROWS,
+                        report: Optional[Dict[str, Dict[str, Any]]] = None,
+                        mark: Optional["HighWaterMark"] = None,
+                        skipped: Optional[Dict[str, int]] = None) -> Tuple[pd.DataFrame, int]:
+    """Import par blocs : en-têtes résolus sur la 1re ligne, filtre 'run' et convert_frame
+    appliqués bloc par bloc -> la mémoire crête dépend de la taille du bloc, pas du fichier.
+
+    Avec `mark` (import incrémental), les lignes déjà connues sont écartées avant conversion ;
+    `skipped` reçoit les compteurs (voir drop_known).
+    Retourne (runs convertis, nb total de lignes lues). Lève ValueError si la colonne
+    activity_type est absente.
+    """
+    header_map = resolve_header_map(read_header(f))
+    if "activity_type" not in header_map.values():
+        raise ValueError("activity_type")
+    parts: List[pd.DataFrame] = []
+    total = 0
+    for chunk, n_read in iter_run_chunks(f, header_map, chunksize):
+        total += n_read
+        if mark is not None:
+            chunk = drop_known(chunk, mark, skipped)
+        if len(chunk):
+            parts.append(convert_frame(chunk, report=report))
+    if not parts:
+        return convert_frame(pd.DataFrame(columns=TABLE_COLS)), total
+    return pd.concat(parts, ignore_index=True), total
+
+# =========================
+# Import incrémental (high-water mark)
+# =========================
+class HighWaterMark:
+    """Ce que la base connaît déjà pour un utilisateur : ses activity_id et sa date la plus récente."""
+
+    def __init__(self, known_ids=(), latest: Optional[str] = None):
+        self.known_ids = np.unique(np.asarray([int(i) for i in known_ids], dtype=np.int64))
+        self.latest = pd.to_datetime(latest, utc=True, errors="coerce", format="ISO8601") if latest else None
+        if self.latest is not None and pd.isna(self.latest):
+            self.latest = None
+
+    def __len__(self) -> int:
+        return len(self.known_ids)
+
+def drop_known(chunk: pd.DataFrame, mark: HighWaterMark,
+               skipped: Optional[Dict[str, int]] = None) -> pd.DataFrame:
+    """Écarte, AVANT tout typage, les lignes brutes dont l'activity_id est déjà en base ("known").
+
+    La date la plus récente en base n'écarte rien : une activité plus ancienne mais inconnue
+    (rattrapage, ligne ignorée lors d'un import précédent) est conservée et comptée dans
+    "backfill". Seule activity_date des lignes restantes est parsée pour ce compteur.
+    `skipped` reçoit les compteurs cumulés."""
+    keep = np.ones(len(chunk), dtype=bool)
+    n_known = n_backfill = 0
+    if len(mark) and "activity_id" in chunk.columns:
+        ids = _to_float_vec(chunk["activity_id"])
+        known = np.isfinite(ids) & np.isin(np.where(np.isfinite(ids), ids, -1).astype(np.int64), mark.known_ids)
+        keep &= ~known
+        n_known = int(known.sum())
+    if skipped is not None and mark.latest is not None and "activity_date" in chunk.columns and keep.any():
+        rest = chunk["activity_date"][keep]
+        dates = pd.to_datetime(pd.Series(_convert_datetime(rest, "activity_date", None), index=rest.index),
+                               utc=True, errors="coerce", format="ISO8601")
+        n_backfill = int((dates <= mark.latest).fillna(False).sum())
+    if skipped is not None:
+        skipped["known"] = skipped.get("known", 0) + n_known
+        skipped["backfill"] = skipped.get("backfill", 0) + n_backfill
+    return chunk[keep]
+
+# =========================
+# Détection des doublons (indexée)
+# =========================
+_NO_DAY = -10**6  # jour sentinelle des dates illisibles (elles ne matchent qu'entre elles)
+_DAY_STRIDE = 1e5  # clé composite jour * stride + distance (km), triable par searchsorted
+
+def _day_numbers(values: pd.Series) -> np.ndarray:
+    """Dates ISO -> numéro de jour UTC (int64), _NO_DAY si illisible."""
+    ts = pd.to_datetime(values.astype(object), utc=True, errors="coerce", format="ISO8601")
+    days = ts.dt.tz_convert(None).to_numpy().astype("datetime64[D]")
+    out = days.astype(np.int64)
+    out[np.isnat(days)] = _NO_DAY
+    return out
+
+def _metric(df: pd.DataFrame, col: str) -> np.ndarray:
+    if col not in df.columns:
+        return np.zeros(len(df))
+    v = pd.to_numeric(df[col].astype(object), errors="coerce").to_numpy(dtype="float64", copy=True)
+    v[~np.isfinite(v)] = 0.0
+    return v
+
+def match_duplicates(new_rows: pd.DataFrame, existing: Any, day_window: int = 0) -> List[Optional[Dict[str, Any]]]:
+    """Meilleur doublon existant pour chaque ligne importée (None si aucun), en une passe.
+
+    Candidats : même jour (±`day_window` jours si demandé, ex. décalage de fuseau) et
+    écarts distance / D+ / D- dans D_TOL_KM / DPLUS_TOL / DMOINS_TOL. Les existants sont
+    triés par (jour, distance) et chaque ligne ne regarde que sa fenêtre searchsorted.
+    Entre plusieurs candidats : le même jour d'abord, puis l'écart normalisé le plus faible.
+    """
+    ex = existing if isinstance(existing, pd.DataFrame) else pd.DataFrame(list(existing or []))
+    n = len(new_rows)
+    if n == 0 or ex.empty:
+        return [None] * n
+
+    ex_day = _day_numbers(ex["activity_date"])
+    ex_dist, ex_dp, ex_dm = _metric(ex, "distance"), _metric(ex, "elevation_gain"), _metric(ex, "elevation_loss")
+    order = np.lexsort((ex_dist, ex_day))
+    keys = ex_day[order] * _DAY_STRIDE + ex_dist[order]
+
+    new_day = _day_numbers(new_rows["activity_date"])
+    new_dist = _metric(new_rows, "distance")
+    new_dp, new_dm = _metric(new_rows, "elevation_gain"), _metric(new_rows, "elevation_loss")
+
+    pairs_new, pairs_ex, pairs_day, pairs_shift = [], [], [], []
+    shifts = [0] + [s for k in range(1, day_window + 1) for s in (-k, k)]
+    for shift in shifts:
+        day = np.where(new_day == _NO_DAY, _NO_DAY, new_day + shift)
+        center = day * _DAY_STRIDE + new_dist
+        lo = np.searchsorted(keys, center - D_TOL_KM - 1e-6, side="left")
+        hi = np.searchsorted(keys, center + D_TOL_KM + 1e-6, side="right")
+        counts = hi - lo
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        starts = np.repeat(lo - (np.cumsum(counts) - counts), counts)
+        pairs_new.append(np.repeat(np.arange(n), counts))
+        pairs_ex.append(order[np.arange(total) + starts])
+        pairs_day.append(np.repeat(day, counts))
+        pairs_shift.append(np.full(total, abs(shift)))
+    if not pairs_new:
+        return [None] * n
+
+    pn, pe = np.concatenate(pairs_new), np.concatenate(pairs_ex)
+    pday, ps = np.concatenate(pairs_day), np.concatenate(pairs_shift)
+    d_dist = np.abs(new_dist[pn] - ex_dist[pe])
+    d_dp, d_dm = np.abs(new_dp[pn] - ex_dp[pe]), np.abs(new_dm[pn] - ex_dm[pe])
+    ok = (ex_day[pe] == pday) & (d_dist <= D_TOL_KM) & (d_dp <= DPLUS_TOL) & (d_dm <= DMOINS_TOL)
+    pn, pe, ps = pn[ok], pe[ok], ps[ok]
+    score = d_dist[ok] / D_TOL_KM + d_dp[ok] / DPLUS_TOL + d_dm[ok] / DMOINS_TOL
+
+    best = np.lexsort((pe, score, ps, pn))
+    first = best[np.unique(pn[best], return_index=True)[1]]
+    records = ex.to_dict("records")
+    out: List[Optional[Dict[str, Any]]] = [None] * n
+    for i, j in zip(pn[first], pe[first]):
+        out[i] = records[j]
+    return out
+
+# =========================
+# Cache d'import (session)
+# =========================
+def upload_digest(buf) -> str:
+    """Empreinte SHA-256 du contenu déposé (bytes / memoryview)."""
+    return hashlib.sha256(buf).hexdigest()
+
+def _approx_bytes(obj: Any) -> int:
+    """Taille mémoire approximative d'une entrée de cache (frames, listes de lignes, dicts)."""
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, np.ndarray):
+        return int(obj.nbytes)
+    if isinstance(obj, dict):
+        return sum(_approx_bytes(v) for v in obj.values())
+    if isinstance(obj, list):
+        if not obj:
+            return 64
+        sample = obj[:50]
+        per_item = sum(_approx_bytes(x) if isinstance(x, (pd.DataFrame, list)) else
+                       sys.getsizeof(x) + (sum(sys.getsizeof(v) for v in x.values()) if isinstance(x, dict) else 0)
+                       for x in sample) / len(sample)
+        return int(per_item * len(obj))
+    return sys.getsizeof(obj)
+
+class ImportCache:
+    """Cache LRU des imports d'une session, borné en nombre d'entrées et en mémoire.
+
+    Clé : "<user_id>:<empreinte du fichier>:<mode>". Une entrée contient le frame converti,
+    les payloads, le rapport de parsing et, par fenêtre de jours, le snapshot des lignes
+    existantes + les doublons trouvés ('dedupe'), qui dépendent de l'état de la base.
+    """
+
+    def __init__(self, max_entries: int = 4, max_bytes: int = 256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """Ajoute / met à jour une entrée puis évince les plus anciennes au-delà des bornes."""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._sizes[key] = _approx_bytes(entry)
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                          or sum(self._sizes.values()) > self.max_bytes):
+            old, _ = self._entries.popitem(last=False)
+            self._sizes.pop(old, None)
+
+    def invalidate(self, user_id: Any) -> None:
+        """La base a changé (écritures) : oublie snapshots et doublons de l'utilisateur.
+        Les frames parsés restent valables (ils ne dépendent que du fichier)."""
+        prefix = f"{user_id}:"
+        for key, entry in self._entries.items():
+            if key.startswith(prefix):
+                entry["dedupe"] = {}
+                self._sizes[key] = _approx_bytes(entry)
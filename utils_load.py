@@ -0,0 +1,111 @@
+# utils_load.py — Charge d'entraînement : ATL / CTL / TSB et ratio aigu:chronique (ACWR)
+#
+# Charge d'une activité : relative_effort (Strava), sinon training_load, sinon durée en mouvement
+# (min) × LOAD_PER_MIN. Charge quotidienne = somme des activités du jour, 0 les jours sans course.
+#   ATL (fatigue)  = moyenne exponentielle, constante ATL_DAYS jours
+#   CTL (forme de fond) = moyenne exponentielle, constante CTL_DAYS jours
+#   TSB (fraîcheur) = CTL - ATL de la veille ; ACWR = ATL / CTL
+# Les moyennes sont calculées par pandas ewm(adjust=False), amorcées avec l'état de la veille du
+# premier jour recalculé : la série stockée (data/load/<user_id>.csv, un jour par ligne) n'est
+# prolongée / corrigée qu'à partir du premier jour touché par un import, jamais recalculée en entier.
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils_db import fetch_date_range
+from utils_store import store_dir, user_file, read_frame, write_frame
+
+ATL_DAYS = 7.0
+CTL_DAYS = 42.0
+LOAD_PER_MIN = 1.0   # charge par minute quand ni relative_effort ni training_load ne sont connus
+LOAD_SOURCE_COLS = ["relative_effort", "training_load", "moving_time"]
+LOAD_DIR = store_dir("load")
+SERIES_COLS = ["date", "load", "atl", "ctl", "tsb", "acwr"]
+
+# zones usuelles de l'ACWR (Gabbett, 2016)
+ACWR_SWEET_SPOT = (0.8, 1.3)
+ACWR_DANGER = 1.5
+
+
+# =========================
+# Calcul
+# =========================
+def activity_load(df: pd.DataFrame) -> pd.Series:
+    """Charge de chaque activité (première source disponible parmi LOAD_SOURCE_COLS)."""
+    def col(c):
+        return pd.to_numeric(df[c], errors="coerce") if c in df.columns else pd.Series(np.nan, index=df.index)
+    load = col("relative_effort")
+    load = load.where(load > 0, col("training_load"))
+    return load.where(load > 0, col("moving_time") * LOAD_PER_MIN).fillna(0.0).clip(lower=0.0)
+
+def daily_loads(df: pd.DataFrame, start: pd.Timestamp, end: pd.Timestamp) -> pd.Series:
+    """Charge par jour UTC sur [start, end] (jours inclus, 0 sans activité)."""
+    days = pd.date_range(start, end, freq="D")
+    if df.empty:
+        return pd.Series(0.0, index=days)
+    when = pd.to_datetime(df["activity_date"], utc=True, errors="coerce", format="ISO8601")
+    per_day = activity_load(df).groupby(when.dt.tz_convert(None).dt.floor("D")).sum()
+    return per_day.reindex(days, fill_value=0.0)
+
+def extend_series(loads: pd.Series, atl0: float = 0.0, ctl0: float = 0.0) -> pd.DataFrame:
+    """ATL / CTL / TSB / ACWR pour des charges quotidiennes consécutives, à partir de l'état
+    (atl0, ctl0) de la veille du premier jour."""
+    def ewm(days, seed):
+        alpha = 1.0 - np.exp(-1.0 / days)
+        x = pd.concat([pd.Series([seed]), pd.Series(loads.to_numpy(dtype="float64"))], ignore_index=True)
+        return x.ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    atl, ctl = ewm(ATL_DAYS, atl0), ewm(CTL_DAYS, ctl0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        acwr = np.where(ctl[1:] > 0, atl[1:] / ctl[1:], np.nan)
+    return pd.DataFrame({
+        "date": loads.index.strftime("%Y-%m-%d"), "load": loads.to_numpy(dtype="float64"),
+        "atl": atl[1:], "ctl": ctl[1:], "tsb": ctl[:-1] - atl[:-1], "acwr": acwr,
+    })
+
+
+# =========================
+# Série par utilisateur (incrémentale)
+# =========================
+def _series_path(user_id: Any) -> str:
+    return user_file(LOAD_DIR, user_id)
+
+def load_series(user_id: Any) -> pd.DataFrame:
+    return read_frame(_series_path(user_id), SERIES_COLS, dtype={"date": str})
+
+def update_training_load(sb, user_id: Any, since: Optional[Any] = None,
+                         today: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    """Prolonge la série jusqu'à aujourd'hui et la recalcule à partir de `since` (premier jour
+    touché par une écriture) si ce jour est plus ancien que le dernier jour stocké.
+
+    Seules les activités depuis ce jour sont relues ; l'état de la veille sert d'amorce.
+    Retourne la série complète.
+    """
+    series = load_series(user_id)
+    now = pd.Timestamp.now(tz="UTC") if today is None else pd.Timestamp(today)
+    today = (now.tz_convert(None) if now.tzinfo else now).floor("D")
+    if series.empty:
+        start = None
+    else:
+        start = pd.Timestamp(series["date"].iloc[-1])  # le dernier jour a pu recevoir d'autres activités
+        if since is not None:
+            s = pd.to_datetime(since, utc=True, errors="coerce")
+            if pd.notna(s):
+                start = min(start, s.tz_convert(None).floor("D"))
+    end = today + pd.Timedelta(days=1)
+
+    rows = fetch_date_range(sb, "strava_import", LOAD_SOURCE_COLS, user_id,
+                            start if start is not None else "1970-01-01", end)
+    if start is None:
+        if rows.empty:
+            return series
+        start = pd.to_datetime(rows["activity_date"], utc=True, format="ISO8601").min().tz_convert(None).floor("D")
+
+    keep = series[series["date"] < start.strftime("%Y-%m-%d")]
+    seed = keep.iloc[-1] if len(keep) else None
+    fresh = extend_series(daily_loads(rows, start, today),
+                          atl0=float(seed["atl"]) if seed is not None else 0.0,
+                          ctl0=float(seed["ctl"]) if seed is not None else 0.0)
+    out = pd.concat([keep, fresh], ignore_index=True) if len(keep) else fresh
+    write_frame(_series_path(user_id), out, float_format="%.6g")
+    return out
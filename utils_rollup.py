@@ -0,0 +1,293 @@
+# utils_rollup.py — Cube d'agrégats par utilisateur : jour / semaine ISO / mois / année
+#
+# Une ligne par (granularité, période, activity_type) avec, pour chaque métrique de ROLLUP_METRICS :
+# somme, nombre de valeurs, min et max (moyenne = somme / nombre). Les saisies du journal sont
+# rangées sous activity_type = "journal" (exclues par défaut des requêtes, pour ne pas compter
+# deux fois une course importée et saisie).
+#
+# Mise à jour incrémentale : seuls les jours touchés par une écriture sont relus en base et
+# recalculés ; les semaines / mois / années qui les contiennent sont ensuite recomposés depuis les
+# lignes jour du cube (sommes, min, max composables), sans relire les activités.
+# Seuls les jours passés à refresh_days sont corrigés : une activité supprimée en base, ou
+# redatée hors de l'import, reste comptée à son ancien jour jusqu'à rebuild_cube (bouton
+# « Reconstruire les agrégats » de l'Importer, qui relit tout l'historique).
+# Stockage : data/rollups/<user_id>.csv.
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils_db import fetch_date_range
+from utils_import import run_mask
+from utils_store import store_dir, user_file, write_frame
+
+GRAINS = ("day", "week", "month", "year")
+JOURNAL_TYPE = "journal"
+# métrique du cube -> (colonne strava_import, colonne journal ou None)
+ROLLUP_METRICS: Dict[str, Tuple[str, Optional[str]]] = {
+    "distance": ("distance", "distance_course_km"),
+    "moving_time": ("moving_time", "temps_course_min"),
+    "elevation_gain": ("elevation_gain", "dplus_course_m"),
+    "elevation_loss": ("elevation_loss", "dmoins_course_m"),
+    "average_heart_rate": ("average_heart_rate", "fc_moyenne_course"),
+    "relative_effort": ("relative_effort", None),
+    "calories": ("calories", "calories_course"),
+    "total_steps": ("total_steps", "nombre_de_pas"),
+    "average_speed": ("average_speed", "allure_course_min_km"),                       # allure (min/km)
+    "average_grade_adjusted_pace": ("average_grade_adjusted_pace", "vap_course_min_km"),  # VAP (min/km)
+}
+STATS = ("sum", "cnt", "min", "max")
+CUBE_COLS = (["grain", "period", "period_start", "activity_type", "n"]
+             + [f"{m}_{s}" for m in ROLLUP_METRICS for s in STATS])
+ROLLUP_DIR = store_dir("rollups", env="ROLLUP_DIR")
+MAX_FETCH_GAP_DAYS = 30  # jours touchés plus proches que ça : relus en une seule plage
+
+
+# =========================
+# Périodes
+# =========================
+def period_keys(days: pd.Series, grain: str) -> Tuple[pd.Series, pd.Series]:
+    """(clé texte, premier jour) de la période contenant chaque jour (datetime64 naïf, minuit)."""
+    if grain == "day":
+        return days.dt.strftime("%Y-%m-%d"), days
+    if grain == "week":
+        iso = days.dt.isocalendar()
+        key = iso["year"].astype(str) + "-W" + iso["week"].astype(str).str.zfill(2)
+        return key, days - pd.to_timedelta(days.dt.weekday, unit="D")
+    if grain == "month":
+        return days.dt.strftime("%Y-%m"), days.dt.to_period("M").dt.start_time
+    if grain == "year":
+        return days.dt.strftime("%Y"), days.dt.to_period("Y").dt.start_time
+    raise ValueError(f"granularité inconnue : {grain}")
+
+
+# =========================
+# Calcul
+# =========================
+def _activity_frame(rows: pd.DataFrame, journal: bool) -> pd.DataFrame:
+    """Lignes brutes -> jour, activity_type et métriques du cube (une ligne par activité / saisie)."""
+    date_col = "date" if journal else "activity_date"
+    when = pd.to_datetime(rows[date_col], utc=True, errors="coerce", format="ISO8601")
+    out = pd.DataFrame({"day": when.dt.tz_convert(None).dt.floor("D"),
+                        "activity_type": JOURNAL_TYPE if journal else rows.get("activity_type", "inconnu")})
+    for metric, (strava_col, journal_col) in ROLLUP_METRICS.items():
+        col = journal_col if journal else strava_col
+        out[metric] = pd.to_numeric(rows[col], errors="coerce") if col and col in rows.columns else np.nan
+    out["activity_type"] = out["activity_type"].fillna("inconnu").astype(str)
+    return out.dropna(subset=["day"])
+
+def day_rollup(acts: pd.DataFrame) -> pd.DataFrame:
+    """Activités -> lignes jour du cube."""
+    if acts.empty:
+        return pd.DataFrame(columns=CUBE_COLS)
+    g = acts.groupby(["day", "activity_type"])
+    parts = [g.size().rename("n")]
+    for m in ROLLUP_METRICS:
+        parts += [g[m].sum(min_count=1).rename(f"{m}_sum"), g[m].count().rename(f"{m}_cnt"),
+                  g[m].min().rename(f"{m}_min"), g[m].max().rename(f"{m}_max")]
+    out = pd.concat(parts, axis=1).reset_index()
+    out["grain"] = "day"
+    out["period"], out["period_start"] = period_keys(out["day"], "day")
+    return out[CUBE_COLS]
+
+def roll_up(day_rows: pd.DataFrame, grain: str) -> pd.DataFrame:
+    """Lignes jour -> lignes de la granularité `grain` (composition des sommes / min / max)."""
+    if day_rows.empty:
+        return pd.DataFrame(columns=CUBE_COLS)
+    days = pd.to_datetime(day_rows["period_start"])
+    key, start = period_keys(days, grain)
+    frame = day_rows.assign(period=key.to_numpy(), period_start=start.to_numpy())
+    agg = {"n": "sum", "period_start": "min"}
+    for m in ROLLUP_METRICS:
+        agg.update({f"{m}_sum": lambda s: s.sum(min_count=1), f"{m}_cnt": "sum", f"{m}_min": "min", f"{m}_max": "max"})
+    out = frame.groupby(["period", "activity_type"]).agg(agg).reset_index()
+    out["grain"] = grain
+    return out[CUBE_COLS]
+
+
+# =========================
+# Stockage + mise à jour incrémentale
+# =========================
+_cache: Dict[str, tuple] = {}
+
+def _cube_path(user_id: Any) -> str:
+    return user_file(ROLLUP_DIR, user_id)
+
+def _has_cube(user_id: Any) -> bool:
+    """Fichier présent et aux colonnes actuelles (un cube d'avant l'ajout d'une métrique est à reconstruire)."""
+    try:
+        return list(pd.read_csv(_cube_path(user_id), nrows=0).columns) == CUBE_COLS
+    except (OSError, pd.errors.EmptyDataError):
+        return False
+
+def load_cube(user_id: Any) -> pd.DataFrame:
+    """Cube de l'utilisateur (relu seulement si le fichier a changé) ; vide s'il manque ou est périmé."""
+    path = _cube_path(user_id)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return pd.DataFrame(columns=CUBE_COLS)
+    hit = _cache.get(path)
+    if hit and hit[0] == mtime:
+        return hit[1]
+    if not _has_cube(user_id):
+        return pd.DataFrame(columns=CUBE_COLS)
+    cube = pd.read_csv(path, dtype={"period": str, "activity_type": str})
+    cube["period_start"] = pd.to_datetime(cube["period_start"])
+    _cache[path] = (mtime, cube)
+    return cube
+
+def _save_cube(user_id: Any, cube: pd.DataFrame) -> None:
+    write_frame(_cube_path(user_id), cube, float_format="%.10g", date_format="%Y-%m-%d")
+
+def _day_ranges(days: Sequence[pd.Timestamp]) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    """Jours triés -> plages [début, fin[ à relire, fusionnées si l'écart est court."""
+    out: List[List[pd.Timestamp]] = []
+    for d in sorted(set(days)):
+        if out and (d - out[-1][1]).days <= MAX_FETCH_GAP_DAYS:
+            out[-1][1] = d + pd.Timedelta(days=1)
+        else:
+            out.append([d, d + pd.Timedelta(days=1)])
+    return [(a, b) for a, b in out]
+
+def _normalize_days(dates: Iterable[Any]) -> List[pd.Timestamp]:
+    ts = pd.to_datetime(pd.Series(list(dates), dtype=object), utc=True, errors="coerce", format="ISO8601")
+    return list(ts.dropna().dt.tz_convert(None).dt.floor("D").unique())
+
+def _fetch_acts(sb, user_id: Any, ranges, journal: bool) -> pd.DataFrame:
+    table, date_col = ("journal", "date") if journal else ("strava_import", "activity_date")
+    cols = [c for c in (j if journal else s for s, j in ROLLUP_METRICS.values()) if c]
+    if not journal:
+        cols.append("activity_type")
+    frames = [fetch_date_range(sb, table, cols, user_id, a, b, date_col=date_col) for a, b in ranges]
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame(columns=["day", "activity_type"] + list(ROLLUP_METRICS))
+    return _activity_frame(pd.concat(frames, ignore_index=True), journal)
+
+def refresh_days(sb, user_id: Any, dates: Iterable[Any], journal: bool = False) -> int:
+    """Recalcule le cube pour les jours de `dates` (une source : strava_import ou journal).
+    Retourne le nombre de jours recalculés. Sans cube à jour, rien à corriger (0) : c'est à
+    l'appelant de le construire en entier (ensure_cube)."""
+    days = _normalize_days(dates)
+    if not days or not _has_cube(user_id):
+        return 0
+    ranges = _day_ranges(days)
+    acts = _fetch_acts(sb, user_id, ranges, journal)
+    acts = acts[acts["day"].isin(days)]  # les plages fusionnées peuvent déborder des jours touchés
+    fresh_days = day_rollup(acts)
+
+    cube = load_cube(user_id)
+    day_keys = {d.strftime("%Y-%m-%d") for d in days}
+    is_source = (cube["activity_type"] == JOURNAL_TYPE) if journal else (cube["activity_type"] != JOURNAL_TYPE)
+    day_rows = cube[cube["grain"] == "day"]
+    day_rows = pd.concat([day_rows[~(day_rows["period"].isin(day_keys) & is_source.loc[day_rows.index])],
+                          fresh_days], ignore_index=True)
+
+    parts = [day_rows]
+    touched_days = pd.Series(days)
+    for grain in GRAINS[1:]:
+        keys = set(period_keys(touched_days, grain)[0])
+        old = cube[cube["grain"] == grain]
+        in_periods = period_keys(pd.to_datetime(day_rows["period_start"]), grain)[0].isin(keys)
+        parts += [old[~old["period"].isin(keys)], roll_up(day_rows[in_periods.to_numpy()], grain)]
+    out = pd.concat([p for p in parts if len(p)], ignore_index=True)[CUBE_COLS]
+    out["period_start"] = pd.to_datetime(out["period_start"])
+    _save_cube(user_id, out.sort_values(["grain", "period_start", "activity_type"]).reset_index(drop=True))
+    return len(days)
+
+def rebuild_cube(sb, user_id: Any) -> pd.DataFrame:
+    """Reconstruit tout le cube (strava_import + journal)."""
+    end = pd.Timestamp.now(tz="UTC") + pd.Timedelta(days=1)
+    acts = pd.concat([_fetch_acts(sb, user_id, [("1970-01-01", end)], journal) for journal in (False, True)],
+                     ignore_index=True)
+    day_rows = day_rollup(acts)
+    out = pd.concat([day_rows] + [roll_up(day_rows, g) for g in GRAINS[1:]], ignore_index=True)
+    out["period_start"] = pd.to_datetime(out["period_start"])
+    _save_cube(user_id, out.sort_values(["grain", "period_start", "activity_type"]).reset_index(drop=True))
+    return load_cube(user_id)
+
+
+def ensure_cube(sb, user_id: Any) -> pd.DataFrame:
+    """Cube de l'utilisateur, construit au premier accès s'il n'existe pas encore (ou s'il date
+    d'un schéma antérieur)."""
+    cube = load_cube(user_id)
+    return cube if len(cube) or _has_cube(user_id) else rebuild_cube(sb, user_id)
+
+
+# =========================
+# Lecture
+# =========================
+def run_types(cube: pd.DataFrame) -> List[str]:
+    """Valeurs d'activity_type du cube qui sont des courses (Run, Course à pied, Trail Run…)."""
+    types = pd.Series(cube["activity_type"].unique(), dtype=object)
+    types = types[types != JOURNAL_TYPE]
+    return sorted(types[run_mask(types)].tolist())
+
+def query_cube(cube: pd.DataFrame, grain: str, start: Any = None, end: Any = None,
+               types: Optional[Sequence[str]] = None, journal: bool = False) -> pd.DataFrame:
+    """Une ligne par période de `grain` (types d'activité fusionnés), triée ; colonnes <m>_sum /
+    _cnt / _min / _max / _avg + n. `start` / `end` bornent period_start ([start, end[)."""
+    sel = cube[cube["grain"] == grain]
+    if start is not None:
+        sel = sel[sel["period_start"] >= pd.Timestamp(start)]
+    if end is not None:
+        sel = sel[sel["period_start"] < pd.Timestamp(end)]
+    if types is not None:
+        sel = sel[sel["activity_type"].isin(list(types))]
+    else:
+        sel = sel[(sel["activity_type"] == JOURNAL_TYPE) == journal]
+    if sel.empty:
+        return pd.DataFrame(columns=CUBE_COLS + [f"{m}_avg" for m in ROLLUP_METRICS]).drop(columns=["activity_type"])
+    agg = {"n": "sum", "period_start": "min"}
+    for m in ROLLUP_METRICS:
+        agg.update({f"{m}_sum": lambda s: s.sum(min_count=1), f"{m}_cnt": "sum", f"{m}_min": "min", f"{m}_max": "max"})
+    out = sel.groupby(["grain", "period"]).agg(agg).reset_index().sort_values("period_start")
+    for m in ROLLUP_METRICS:
+        out[f"{m}_avg"] = out[f"{m}_sum"] / out[f"{m}_cnt"].where(out[f"{m}_cnt"] > 0)
+    return out.reset_index(drop=True)
+
+def aggregate_days(cube: pd.DataFrame, metric: str, op: str, group_by: str = "none",
+                   year: Optional[int] = None, month: Optional[int] = None,
+                   weeks: Optional[Tuple[int, int]] = None, types: Optional[Sequence[str]] = None):
+    """Agrégat par activité (sum / avg / min / max / count) recomposé depuis les lignes jour.
+
+    Mêmes filtres et regroupements que l'agrégation sur la table brute (iso_year, month,
+    iso_week, date_only). Retourne un float (group_by "none") ou un DataFrame group / value.
+    """
+    sel = cube[cube["grain"] == "day"]
+    sel = sel[sel["activity_type"].isin(list(types))] if types is not None else sel[sel["activity_type"] != JOURNAL_TYPE]
+    days = pd.to_datetime(sel["period_start"])
+    iso = days.dt.isocalendar()
+    keep = pd.Series(True, index=sel.index)
+    if year is not None:
+        keep &= iso["year"] == int(year)
+    if month is not None:
+        keep &= days.dt.month == int(month)
+    if weeks is not None:
+        keep &= (iso["week"] >= int(weeks[0])) & (iso["week"] <= int(weeks[1]))
+    sel, days, iso = sel[keep], days[keep], iso[keep]
+
+    if group_by == "week":
+        key = iso["week"].astype(int)
+    elif group_by == "month":
+        key = days.dt.month
+    elif group_by == "day":
+        key = days.dt.strftime("%Y-%m-%d")
+    else:
+        key = pd.Series("all", index=sel.index)
+    g = sel.groupby(key.to_numpy())
+    if op == "sum":
+        val = g[f"{metric}_sum"].sum()
+    elif op == "avg":
+        val = g[f"{metric}_sum"].sum() / g[f"{metric}_cnt"].sum().where(lambda c: c > 0)
+    elif op == "min":
+        val = g[f"{metric}_min"].min()
+    elif op == "max":
+        val = g[f"{metric}_max"].max()
+    else:
+        val = g[f"{metric}_cnt"].sum()
+    if group_by not in ("week", "month", "day"):
+        return float(val.iloc[0]) if len(val) else None
+    return val.rename("value").rename_axis("group").reset_index()
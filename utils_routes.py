@@ -0,0 +1,263 @@
+# utils_routes.py — Empreintes de parcours GPS : doublons et parcours répétés
+#
+# Une trace est simplifiée (un point tous les SAMPLE_M mètres le long de la distance cumulée),
+# projetée sur une grille fixe de cellules de CELL_M mètres, puis résumée par une MinHash de
+# l'ensemble des cellules traversées : la proportion de valeurs égales entre deux MinHash estime
+# la similarité de Jaccard des deux parcours, indépendamment du sens et de l'échantillonnage.
+# Recherche sous-linéaire par LSH : la MinHash est découpée en bandes, chaque bande hachée sert
+# de clé de seau ; seules les activités partageant au moins un seau sont comparées.
+#
+# Index par utilisateur : data/routes/<user_id>.csv, une ligne par activité.
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils_efforts import cumulative_distance
+from utils_store import store_dir, user_file, write_frame
+
+Streams = Dict[str, np.ndarray]
+
+SAMPLE_M = 50.0        # pas de la trace simplifiée (m)
+CELL_M = 200.0         # côté d'une cellule de la grille (m)
+N_HASHES = 64          # longueur de la MinHash
+N_BANDS = 16           # bandes LSH (N_HASHES / N_BANDS valeurs par bande)
+DUP_JACCARD = 0.85     # même parcours, même distance / durée -> même activité (doublon)
+DUP_REL_TOL = 0.03     # écart relatif max sur distance et durée pour un doublon
+SAME_ROUTE_JACCARD = 0.6   # au-delà : même parcours (parcours répétés)
+OTHER_ROUTE_JACCARD = 0.3  # en deçà : parcours différents (un doublon date / distance est écarté)
+ROUTES_DIR = store_dir("routes")
+INDEX_COLS = ["activity_id", "activity_date", "length_m", "duration_s", "n_cells",
+              "start_lat", "start_lon", "digest", "minhash"]
+
+_M_PER_DEG = 111320.0
+_rng = np.random.default_rng(20240611)  # graine fixe : les MinHash doivent rester comparables
+_HASH_A = _rng.integers(0, 2**63, size=N_HASHES, dtype=np.uint64) | np.uint64(1)  # impairs
+_HASH_B = _rng.integers(0, 2**63, size=N_HASHES, dtype=np.uint64)
+
+
+# =========================
+# Empreinte d'une trace
+# =========================
+def simplify(streams: Streams, step_m: float = SAMPLE_M) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """(lat, lon) rééchantillonnés tous les `step_m` mètres ; None sans GPS exploitable."""
+    lat, lon = streams.get("lat"), streams.get("lon")
+    if lat is None or lon is None:
+        return None
+    lat, lon = np.asarray(lat, dtype="float64"), np.asarray(lon, dtype="float64")
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    if ok.sum() < 2:
+        return None
+    lat, lon = lat[ok], lon[ok]
+    cum = cumulative_distance({"lat": lat, "lon": lon})
+    if cum[-1] < step_m:
+        return None
+    cum = cum + np.arange(len(cum)) * 1e-9  # strictement croissante (pauses) pour l'interpolation
+    grid = np.arange(0.0, cum[-1], step_m)
+    return np.interp(grid, cum, lat), np.interp(grid, cum, lon)
+
+def grid_cells(lat: np.ndarray, lon: np.ndarray, cell_m: float = CELL_M) -> np.ndarray:
+    """Identifiants (int64, triés, uniques) des cellules traversées.
+
+    Rangée = latitude / cell_m ; la largeur en longitude dépend de la rangée seule (cos de sa
+    latitude), la grille est donc la même pour toutes les traces."""
+    row = np.floor(lat * _M_PER_DEG / cell_m).astype(np.int64)
+    scale = np.cos(np.radians((row + 0.5) * cell_m / _M_PER_DEG)) * _M_PER_DEG / cell_m
+    col = np.floor(lon * scale).astype(np.int64)
+    return np.unique((row << 32) ^ (col & 0xFFFFFFFF))
+
+def minhash(cells: np.ndarray) -> np.ndarray:
+    """MinHash (uint32 × N_HASHES) d'un ensemble de cellules, hachage multiply-shift :
+    h_i(x) = ((a_i·x + b_i) mod 2^64) >> 32."""
+    x = cells.astype(np.uint64)[None, :]
+    h = (_HASH_A[:, None] * x + _HASH_B[:, None]) >> np.uint64(32)
+    return h.min(axis=1).astype(np.uint32)
+
+def geo_digest(streams: Streams) -> str:
+    """Empreinte exacte des coordonnées (au mètre près) : identique pour un même fichier
+    réimporté, même si sa date a été décalée."""
+    lat = np.round(np.asarray(streams["lat"], dtype="float64") * 1e5)
+    lon = np.round(np.asarray(streams["lon"], dtype="float64") * 1e5)
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    pts = np.stack([lat[ok], lon[ok]], axis=1).astype(np.int64)
+    return hashlib.sha1(pts.tobytes()).hexdigest()[:16]
+
+def fingerprint(streams: Streams) -> Optional[Dict[str, Any]]:
+    """Empreinte de parcours d'une activité, None sans trace GPS."""
+    simple = simplify(streams)
+    if simple is None:
+        return None
+    lat, lon = simple
+    cells = grid_cells(lat, lon)
+    t = streams.get("time")
+    duration = float(np.nanmax(t) - np.nanmin(t)) if t is not None and np.isfinite(t).any() else np.nan
+    return {"length_m": float(len(lat) * SAMPLE_M), "duration_s": duration, "n_cells": int(len(cells)),
+            "start_lat": float(lat[0]), "start_lon": float(lon[0]),
+            "digest": geo_digest(streams), "minhash": minhash(cells)}
+
+def jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    """Similarité de Jaccard estimée entre deux parcours (part des MinHash égales)."""
+    return float(np.mean(a == b))
+
+def fingerprint_many(tracks: Dict[Any, Streams]) -> Dict[Any, Dict[str, Any]]:
+    out = {}
+    for aid, streams in tracks.items():
+        fp = fingerprint(streams) if streams else None
+        if fp is not None:
+            out[aid] = fp
+    return out
+
+
+# =========================
+# Index LSH
+# =========================
+def _band_keys(mh: np.ndarray) -> List[Tuple[int, bytes]]:
+    rows = N_HASHES // N_BANDS
+    return [(b, mh[b * rows:(b + 1) * rows].tobytes()) for b in range(N_BANDS)]
+
+class RouteIndex:
+    """Empreintes des activités d'un utilisateur + seaux LSH en mémoire.
+
+    `query` ne compare une empreinte qu'aux activités qui partagent un seau avec elle, et les
+    lignes sont retrouvées par clé (activity_id, digest) : le coût dépend du nombre de parcours
+    proches, pas de la taille de l'historique."""
+
+    def __init__(self, frame: Optional[pd.DataFrame] = None):
+        self.frame = frame if frame is not None else pd.DataFrame(columns=INDEX_COLS)
+        self.hashes: Dict[Any, np.ndarray] = {}
+        self.buckets: Dict[Tuple[int, bytes], List[Any]] = {}
+        self.rows: Dict[Any, Dict[str, Any]] = {}
+        self.by_digest: Dict[str, Any] = {}
+        for rec in self.frame.to_dict("records"):
+            self._add(rec["activity_id"], np.array([int(x) for x in str(rec["minhash"]).split()], dtype=np.uint32))
+            self.rows[rec["activity_id"]] = rec
+            if isinstance(rec.get("digest"), str):
+                self.by_digest.setdefault(rec["digest"], rec["activity_id"])
+
+    def _add(self, aid: Any, mh: np.ndarray) -> None:
+        self.hashes[aid] = mh
+        for key in _band_keys(mh):
+            self.buckets.setdefault(key, []).append(aid)
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def candidates(self, mh: np.ndarray) -> set:
+        found = set()
+        for key in _band_keys(mh):
+            found.update(self.buckets.get(key, ()))
+        return found
+
+    def query(self, fp: Dict[str, Any], min_jaccard: float = SAME_ROUTE_JACCARD,
+              exclude: Any = None) -> List[Tuple[Any, float]]:
+        """[(activity_id, jaccard)] des parcours similaires, du plus proche au moins proche."""
+        out = [(aid, jaccard(fp["minhash"], self.hashes[aid])) for aid in self.candidates(fp["minhash"])
+               if aid != exclude]
+        return sorted([x for x in out if x[1] >= min_jaccard], key=lambda x: -x[1])
+
+    def row(self, aid: Any) -> Optional[Dict[str, Any]]:
+        return self.rows.get(aid)
+
+    def find_duplicate(self, fp: Dict[str, Any]) -> Optional[Any]:
+        """activity_id d'une activité existante identique (même fichier, ou même parcours avec
+        distance et durée dans DUP_REL_TOL), quelle que soit sa date."""
+        same = self.by_digest.get(fp["digest"])
+        if same is not None:
+            return same
+        for aid, _ in self.query(fp, DUP_JACCARD):
+            r = self.row(aid)
+            if (_close(r["length_m"], fp["length_m"]) and _close(r["duration_s"], fp["duration_s"])):
+                return aid
+        return None
+
+    def groups(self, min_jaccard: float = SAME_ROUTE_JACCARD) -> List[List[Any]]:
+        """Parcours répétés : composantes connexes (union-find) des paires similaires, ≥ 2 activités."""
+        parent = {aid: aid for aid in self.hashes}
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+        # toutes les paires candidates d'un seau ; une paire déjà reliée (même composante) n'a
+        # pas besoin d'être comparée
+        for ids in self.buckets.values():
+            for i, a in enumerate(ids):
+                for b in ids[i + 1:]:
+                    ra, rb = find(a), find(b)
+                    if ra != rb and jaccard(self.hashes[a], self.hashes[b]) >= min_jaccard:
+                        parent[rb] = ra
+        comps: Dict[Any, List[Any]] = {}
+        for aid in self.hashes:
+            comps.setdefault(find(aid), []).append(aid)
+        return sorted([c for c in comps.values() if len(c) > 1], key=len, reverse=True)
+
+def _close(a: float, b: float, tol: float = DUP_REL_TOL) -> bool:
+    if not np.isfinite(a) or not np.isfinite(b):
+        return True  # inconnue d'un côté : le parcours seul tranche
+    return abs(a - b) <= tol * max(abs(a), abs(b), 1.0)
+
+
+# =========================
+# Index par utilisateur
+# =========================
+def _index_path(user_id: Any) -> str:
+    return user_file(ROUTES_DIR, user_id)
+
+def load_route_index(user_id: Any) -> RouteIndex:
+    try:
+        frame = pd.read_csv(_index_path(user_id), dtype={"digest": str, "minhash": str})
+    except (OSError, pd.errors.EmptyDataError):
+        frame = None
+    return RouteIndex(frame)
+
+def update_route_index(user_id: Any, fingerprints: Dict[Any, Dict[str, Any]], dates: Dict[Any, Any]) -> RouteIndex:
+    """Remplace les lignes des activités recalculées ; retourne l'index complet."""
+    new = pd.DataFrame([{"activity_id": aid, "activity_date": dates.get(aid),
+                         **{k: v for k, v in fp.items() if k != "minhash"},
+                         "minhash": " ".join(map(str, fp["minhash"].tolist()))}
+                        for aid, fp in fingerprints.items()], columns=INDEX_COLS)
+    old = load_route_index(user_id).frame
+    out = pd.concat([old[~old["activity_id"].isin(list(fingerprints))], new], ignore_index=True) if len(old) else new
+    write_frame(_index_path(user_id), out, float_format="%.7g")
+    return RouteIndex(out)
+
+def route_groups_frame(index: RouteIndex, min_jaccard: float = SAME_ROUTE_JACCARD) -> pd.DataFrame:
+    """Une ligne par activité des parcours répétés : route (numéro de groupe), date, distance, durée."""
+    recs = [{"route": g, "activity_id": aid} for g, ids in enumerate(index.groups(min_jaccard), start=1) for aid in ids]
+    if not recs:
+        return pd.DataFrame(columns=["route", "activity_id", "activity_date", "length_m", "duration_s"])
+    out = pd.DataFrame(recs).merge(index.frame[["activity_id", "activity_date", "length_m", "duration_s"]],
+                                   on="activity_id", how="left")
+    out["activity_date"] = pd.to_datetime(out["activity_date"], utc=True, errors="coerce", format="ISO8601")
+    return out.sort_values(["route", "activity_date"]).reset_index(drop=True)
+
+
+# =========================
+# Signal doublon pour l'import
+# =========================
+def route_check(new_ids: Sequence[Any], matches: List[Optional[Dict[str, Any]]],
+                fingerprints: Dict[Any, Dict[str, Any]], index: RouteIndex) -> Tuple[List[Optional[Dict[str, Any]]], Dict[int, Any]]:
+    """Confronte les doublons date / distance aux parcours.
+
+    Retourne (matches corrigés, {ligne: activity_id existant}) :
+      - un doublon dont le parcours diffère nettement (Jaccard < OTHER_ROUTE_JACCARD) est écarté ;
+      - une ligne sans doublon dont la trace est identique à une activité existante est signalée
+        (activity_id à rattacher par l'appelant, la ligne existante pouvant être hors fenêtre de dates).
+    """
+    out = list(matches)
+    found: Dict[int, Any] = {}
+    for i, aid in enumerate(new_ids):
+        fp = fingerprints.get(aid)
+        if fp is None:
+            continue
+        m = out[i]
+        if m is not None:
+            other = index.hashes.get(m.get("activity_id"))
+            if other is not None and jaccard(fp["minhash"], other) < OTHER_ROUTE_JACCARD:
+                out[i] = None
+            continue
+        dup = index.find_duplicate(fp)
+        if dup is not None:
+            found[i] = dup
+    return out, found
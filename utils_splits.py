@@ -0,0 +1,189 @@
+# utils_splits.py — Splits au km, dénivelé lissé et allure ajustée à la pente (GAP) depuis les streams
+#
+# Tout est vectorisé sur les tableaux distance / altitude :
+#   - altitude rééchantillonnée sur une grille régulière en distance (GRID_M), lissée par moyenne
+#     glissante (SMOOTH_M) -> D+ / D- sans le bruit GPS / baro qui gonfle les totaux du CSV ;
+#   - pente sur la grille lissée, coût énergétique de Minetti (2002) -> distance « à plat »
+#     équivalente, d'où la GAP ;
+#   - splits : instants de passage à chaque km par interpolation, agrégats par km via bincount.
+# Résultats par utilisateur dans data/splits : <user_id>_splits.csv (un km par ligne) et
+# <user_id>_summary.csv (une ligne par activité).
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils_efforts import cumulative_distance
+from utils_store import store_dir, user_file, read_frame, write_frame
+from utils_streams import load_file
+
+Streams = Dict[str, np.ndarray]
+
+GRID_M = 10.0          # pas de la grille en distance (m)
+SMOOTH_M = 100.0       # largeur de la moyenne glissante sur l'altitude (m)
+MAX_GRADE = 0.45       # pente bornée pour le modèle de coût
+SPLIT_M = 1000.0
+SPLIT_WORKERS = max(1, os.cpu_count() or 1)
+SPLITS_DIR = store_dir("splits")
+
+SPLIT_COLS = ["activity_id", "km", "distance_m", "seconds", "pace_min_km", "gap_min_km",
+              "elev_gain_m", "elev_loss_m", "avg_hr"]
+SUMMARY_COLS = ["activity_id", "distance_m", "seconds", "pace_min_km", "gap_min_km",
+                "elev_gain_m", "elev_loss_m"]
+
+
+# =========================
+# Calcul (une activité)
+# =========================
+def minetti_factor(grade: np.ndarray) -> np.ndarray:
+    """Coût énergétique de la course à la pente `grade` rapporté au plat (Minetti et al., 2002)."""
+    i = np.clip(grade, -MAX_GRADE, MAX_GRADE)
+    cost = 155.4 * i**5 - 30.4 * i**4 - 43.3 * i**3 + 46.3 * i**2 + 19.5 * i + 3.6
+    return cost / 3.6
+
+def smoothed_elevation(cum: np.ndarray, ele: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(grille de distance, altitude lissée sur la grille)."""
+    ok = np.isfinite(ele)
+    grid = np.arange(0.0, cum[-1] + GRID_M, GRID_M)
+    z = np.interp(grid, cum[ok], ele[ok])
+    w = max(1, int(round(SMOOTH_M / GRID_M)))
+    if len(z) > w:
+        pad = np.pad(z, (w // 2, w - 1 - w // 2), mode="edge")
+        z = np.convolve(pad, np.ones(w) / w, mode="valid")
+    return grid, z
+
+def analyse_streams(streams: Streams) -> Optional[Tuple[pd.DataFrame, Dict[str, float]]]:
+    """(splits au km, résumé de l'activité), None si le temps ou la distance manquent."""
+    t = streams.get("time")
+    cum = cumulative_distance(streams)
+    if t is None or cum is None:
+        return None
+    t = np.asarray(t, dtype="float64")
+    ok = np.isfinite(t)
+    t, cum = t[ok], cum[ok]
+    if len(t) < 2 or cum[-1] < GRID_M:
+        return None
+    step = np.diff(cum, prepend=cum[0])
+    dt = np.diff(t, prepend=t[0])
+
+    # -- altitude lissée, D+/D-, pente par échantillon
+    ele = streams.get("ele")
+    ele = np.asarray(ele, dtype="float64")[ok] if ele is not None else None
+    if ele is not None and np.isfinite(ele).sum() > 1:
+        grid, z = smoothed_elevation(cum, ele)
+        dz = np.diff(z, prepend=z[0])
+        grade = np.interp(cum, grid, np.gradient(z, GRID_M)) if len(z) > 1 else np.zeros_like(cum)
+    else:
+        grid, dz, grade = np.array([0.0]), np.array([0.0]), np.zeros_like(cum)
+    flat = step * minetti_factor(grade)  # distance à plat équivalente de chaque pas
+
+    # -- km de rattachement de chaque échantillon / point de grille
+    n_km = int(np.ceil(cum[-1] / SPLIT_M))
+    km_idx = np.minimum((cum // SPLIT_M).astype(np.int64), n_km - 1)
+    km_grid = np.minimum((grid // SPLIT_M).astype(np.int64), n_km - 1)
+    marks = np.minimum(np.arange(n_km + 1) * SPLIT_M, cum[-1])
+    t_marks = np.interp(marks, cum + np.arange(len(cum)) * 1e-9, t)
+
+    seconds = np.diff(t_marks)
+    dist = np.diff(marks)
+    flat_km = np.bincount(km_idx, weights=flat, minlength=n_km)
+    step_km = np.bincount(km_idx, weights=step, minlength=n_km)
+    gain = np.bincount(km_grid, weights=np.clip(dz, 0, None), minlength=n_km)
+    loss = np.bincount(km_grid, weights=np.clip(-dz, 0, None), minlength=n_km)
+
+    hr = streams.get("hr")
+    avg_hr = np.full(n_km, np.nan)
+    if hr is not None:
+        hr = np.asarray(hr, dtype="float64")[ok]
+        good = np.isfinite(hr)
+        w = np.bincount(km_idx[good], weights=dt[good], minlength=n_km)
+        s = np.bincount(km_idx[good], weights=hr[good] * dt[good], minlength=n_km)
+        avg_hr = np.divide(s, w, out=np.full(n_km, np.nan), where=w > 0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pace = seconds / 60.0 / (dist / 1000.0)
+        # distance à plat du km (mise à l'échelle si la distance des pas diffère un peu du km)
+        flat_dist = np.where(step_km > 0, flat_km / step_km * dist, dist)
+        gap = seconds / 60.0 / (flat_dist / 1000.0)
+
+    splits = pd.DataFrame({
+        "km": np.arange(1, n_km + 1), "distance_m": dist.round(1), "seconds": seconds.round(1),
+        "pace_min_km": pace, "gap_min_km": gap, "elev_gain_m": gain.round(1),
+        "elev_loss_m": loss.round(1), "avg_hr": np.round(avg_hr, 1),
+    })
+    total_s = float(t[-1] - t[0])
+    summary = {
+        "distance_m": float(cum[-1]), "seconds": total_s,
+        "pace_min_km": total_s / 60.0 / (float(cum[-1]) / 1000.0),
+        "gap_min_km": total_s / 60.0 / (max(float(flat.sum()), 1e-9) / 1000.0),
+        "elev_gain_m": float(np.clip(dz, 0, None).sum()), "elev_loss_m": float(np.clip(-dz, 0, None).sum()),
+    }
+    return splits, summary
+
+
+# =========================
+# Traitement par lots (tous les cœurs)
+# =========================
+def _analyse_task(args: Tuple[Any, Any]):
+    """Tâche du pool : (activity_id, streams | chemin .strm) -> (activity_id, résultat | None, erreur | None).
+    Résultat None sans erreur : trace sans distance / temps exploitables."""
+    aid, src = args
+    try:
+        streams = load_file(src, ["time", "lat", "lon", "dist", "ele", "hr"]) if isinstance(src, str) else src
+        return aid, analyse_streams(streams), None
+    except Exception as e:
+        return aid, None, f"{type(e).__name__}: {e}"
+
+def analyse_batch(sources: Dict[Any, Any], max_workers: int = SPLIT_WORKERS
+                  ) -> Tuple[Dict[Any, Tuple[pd.DataFrame, Dict[str, float]]], Dict[Any, str]]:
+    """{activity_id: streams ou chemin .strm du cache local} -> ({activity_id: (splits, résumé)},
+    {activity_id: erreur}), réparti sur un pool de processus (les chemins évitent de copier les
+    streams entre processus)."""
+    if not sources:
+        return {}, {}
+    items = list(sources.items())
+    if max_workers <= 1 or len(items) == 1:
+        results = list(map(_analyse_task, items))
+    else:
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+            results = list(pool.map(_analyse_task, items, chunksize=max(1, len(items) // (max_workers * 4))))
+    return ({aid: res for aid, res, _ in results if res is not None},
+            {aid: err for aid, _, err in results if err is not None})
+
+
+# =========================
+# Tables par utilisateur
+# =========================
+def _paths(user_id: Any) -> Tuple[str, str]:
+    return user_file(SPLITS_DIR, user_id, "_splits.csv"), user_file(SPLITS_DIR, user_id, "_summary.csv")
+
+def load_splits(user_id: Any, activity_id: Any = None) -> pd.DataFrame:
+    df = read_frame(_paths(user_id)[0], SPLIT_COLS)
+    return df if activity_id is None else df[df["activity_id"] == activity_id].reset_index(drop=True)
+
+def load_summary(user_id: Any) -> pd.DataFrame:
+    return read_frame(_paths(user_id)[1], SUMMARY_COLS)
+
+def summary_columns(summary: pd.DataFrame) -> pd.DataFrame:
+    """Résumé renommé pour être joint aux lignes strava_import (activity_id + colonnes recalculées)."""
+    return summary.rename(columns={
+        "elev_gain_m": "elevation_gain_smoothed", "elev_loss_m": "elevation_loss_smoothed",
+        "gap_min_km": "gap_stream_min_km", "pace_min_km": "pace_stream_min_km",
+    })[["activity_id", "elevation_gain_smoothed", "elevation_loss_smoothed",
+        "gap_stream_min_km", "pace_stream_min_km"]]
+
+def save_results(user_id: Any, results: Dict[Any, Tuple[pd.DataFrame, Dict[str, float]]]) -> int:
+    """Remplace les splits / résumés des activités de `results`. Retourne le nombre d'activités."""
+    if not results:
+        return 0
+    ids = list(results)
+    new_splits = pd.concat([sp.assign(activity_id=aid) for aid, (sp, _) in results.items()], ignore_index=True)
+    new_summary = pd.DataFrame([{"activity_id": aid, **summ} for aid, (_, summ) in results.items()])
+    splits_path, summary_path = _paths(user_id)
+    for path, cols, new in ((splits_path, SPLIT_COLS, new_splits), (summary_path, SUMMARY_COLS, new_summary)):
+        old = read_frame(path, cols)
+        out = pd.concat([old[~old["activity_id"].isin(ids)], new[cols]], ignore_index=True)
+        write_frame(path, out, float_format="%.7g")
+    return len(ids)
@@ -0,0 +1,86 @@
+# utils_store.py — Index locaux par utilisateur : emplacement et écriture atomique des fichiers
+#
+# Tout ce qui est rangé sous data/ est DÉRIVÉ : la vérité reste dans Supabase (tables
+# strava_import / journal, traces dans le bucket STREAMS_BUCKET). Ces fichiers vivent sur le
+# disque du serveur Streamlit : perdus à un redéploiement, propres à chaque instance s'il y en a
+# plusieurs. Chacun se reconstruit depuis Supabase :
+#
+#   dossier      module          reconstruction
+#   streams/     utils_streams   cache local relu du bucket à la demande (StreamStore.load)
+#   efforts/     utils_efforts   Importer › Traitements des traces › Recalculer les meilleurs efforts
+#   zones/       utils_zones     Importer › Zones cardiaques › Recalculer les zones de tout l'historique
+#   splits/      utils_splits    Importer › Traitements des traces › Recalculer splits, D+ lissé et GAP
+#   routes/      utils_routes    Importer › Traitements des traces › Reconstruire l'index des parcours
+#   heatmap/     utils_heatmap   Importer › Traitements des traces › Reconstruire la carte de chaleur
+#   rollups/     utils_rollup    automatique au prochain import (ensure_cube) ; Importer › Reconstruire les agrégats
+#                                (en attendant, Stats lit weekly_summary_for_me filtrée côté serveur)
+#   load/        utils_load      automatique : update_training_load repart de zéro sans fichier
+#   versions/    utils_cache     sans fichier, version 0 : les caches se remplissent à nouveau
+#
+# Sans STREAMS_BUCKET, les traces elles-mêmes ne sont que locales : il faut alors réimporter
+# l'export ZIP après un redéploiement.
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Optional
+
+import pandas as pd
+
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+
+def store_dir(kind: str, env: Optional[str] = None) -> str:
+    """Dossier d'un type d'index : variable d'environnement `env` (par défaut <KIND>_DIR),
+    sinon DATA_DIR/<kind>."""
+    return os.environ.get(env or f"{kind.upper()}_DIR", os.path.join(DATA_DIR, kind))
+
+def user_file(directory: str, user_id: Any, suffix: str = ".csv") -> str:
+    return os.path.join(directory, f"{user_id}{suffix}")
+
+@contextmanager
+def atomic_path(path: str) -> Iterator[str]:
+    """Chemin temporaire à remplir ; remplace `path` d'un coup (os.replace) si le bloc réussit.
+    Un lecteur concurrent voit l'ancien fichier ou le nouveau, jamais un fichier à moitié écrit.
+    Le temporaire est unique (mkstemp) : les sessions Streamlit sont des threads d'un même
+    processus et peuvent écrire le même fichier en même temps."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+# =========================
+# Lecture / écriture
+# =========================
+def read_frame(path: str, columns: List[str], **read_csv_kw) -> pd.DataFrame:
+    """CSV -> DataFrame ; frame vide avec `columns` si le fichier est absent ou vide."""
+    try:
+        return pd.read_csv(path, **read_csv_kw)
+    except (OSError, pd.errors.EmptyDataError):
+        return pd.DataFrame(columns=columns)
+
+def write_frame(path: str, frame: pd.DataFrame, **to_csv_kw) -> None:
+    with atomic_path(path) as tmp:
+        frame.to_csv(tmp, index=False, **to_csv_kw)
+
+def read_json(path: str, default: Any) -> Any:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return default
+
+def write_json(path: str, obj: Any) -> None:
+    with atomic_path(path) as tmp, open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(obj, fh)
+
+def write_bytes(path: str, data: bytes) -> None:
+    with atomic_path(path) as tmp, open(tmp, "wb") as fh:
+        fh.write(data)
@@ -0,0 +1,262 @@
+# utils_streams.py — Stockage colonnaire compact des streams d'activité (GPS, FC, altitude, cadence)
+#
+# Un fichier .strm par activité : en-tête JSON + un bloc binaire aligné par canal.
+#   time     : t0 (en-tête) + écarts en ms (uint16, ou uint32 si une pause dépasse 65 s)
+#   lat/lon  : int32, 1e-7 degré (~1 cm)
+#   hr/cad   : int16, -1 = absent
+#   ele/dist : float32
+# Copie « froide » : le fichier compressé (zlib) dans un BlobStore (dossier local ou Supabase
+# Storage). Copie « chaude » : le fichier brut dans un cache disque local, lu par mmap —
+# les canaux float32 sont renvoyés sans copie, les autres décodés en une opération vectorisée.
+import json
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from utils_store import store_dir, write_bytes
+
+Streams = Dict[str, np.ndarray]
+
+_MAGIC = b"STRM1\n"
+_ALIGN = 8
+STREAMS_DIR = store_dir("streams")
+SAVE_WORKERS = 4
+
+# canal -> (dtype stocké, échelle, valeur "absent")
+CHANNEL_SPECS: Dict[str, tuple] = {
+    "lat":  ("<i4", 1e-7, np.iinfo(np.int32).min),
+    "lon":  ("<i4", 1e-7, np.iinfo(np.int32).min),
+    "hr":   ("<i2", None, -1),
+    "cad":  ("<i2", None, -1),
+    "ele":  ("<f4", None, None),
+    "dist": ("<f4", None, None),
+}
+CHANNELS = ("time",) + tuple(CHANNEL_SPECS)
+
+
+# =========================
+# Encodage / décodage
+# =========================
+def _encode_time(t: np.ndarray):
+    """Secondes epoch (float64) -> (t0, écarts en ms). Les instants illisibles (NaN) reprennent
+    l'instant précédent ; les écarts négatifs sont ramenés à 0."""
+    t = np.asarray(t, dtype="float64")
+    ok = np.isfinite(t)
+    if not ok.any():
+        return 0.0, np.zeros(len(t), dtype="<u2")
+    idx = np.where(ok, np.arange(len(t)), 0)
+    np.maximum.accumulate(idx, out=idx)
+    t = t[idx]
+    first = int(np.argmax(ok))
+    t[:first] = t[first]
+    ms = np.round((t - t[0]) * 1000.0).astype(np.int64)
+    deltas = np.diff(ms, prepend=ms[0]).clip(min=0)
+    dtype = "<u2" if deltas.max(initial=0) < 2 ** 16 else "<u4"
+    return float(t[0]), deltas.astype(dtype)
+
+def _encode_channel(name: str, v: np.ndarray) -> np.ndarray:
+    dtype, scale, missing = CHANNEL_SPECS[name]
+    v = np.asarray(v, dtype="float64")
+    if scale is None and missing is None:
+        return v.astype(dtype)
+    info = np.iinfo(np.dtype(dtype))
+    q = np.round(v / scale) if scale else np.round(v)
+    bad = ~np.isfinite(q)
+    q = np.clip(np.where(bad, 0, q), info.min + 1, info.max)
+    out = q.astype(dtype)
+    out[bad] = missing
+    return out
+
+def encode_streams(activity_id: Any, streams: Streams) -> bytes:
+    """Streams (dict de tableaux alignés) -> contenu .strm brut (non compressé)."""
+    n = len(streams.get("time", next(iter(streams.values()), [])))
+    blocks: Dict[str, np.ndarray] = {}
+    t0 = 0.0
+    if "time" in streams:
+        t0, blocks["time"] = _encode_time(streams["time"])
+    for name in CHANNEL_SPECS:
+        if name in streams and len(streams[name]) == n:
+            blocks[name] = _encode_channel(name, streams[name])
+
+    header: Dict[str, Any] = {"activity_id": activity_id, "n": n, "t0": t0, "channels": {}}
+    offset = 0
+    for name, arr in blocks.items():
+        header["channels"][name] = {"dtype": arr.dtype.str, "offset": offset}
+        offset += -(-arr.nbytes // _ALIGN) * _ALIGN
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    head += b" " * (-(len(_MAGIC) + 4 + len(head)) % _ALIGN)
+
+    out = bytearray(_MAGIC + struct.pack("<I", len(head)) + head)
+    for arr in blocks.values():
+        out += arr.tobytes()
+        out += b"\0" * (-arr.nbytes % _ALIGN)
+    return bytes(out)
+
+def _read_header(buf) -> tuple:
+    if bytes(buf[:len(_MAGIC)]) != _MAGIC:
+        raise ValueError("fichier de streams invalide")
+    (hlen,) = struct.unpack_from("<I", buf, len(_MAGIC))
+    start = len(_MAGIC) + 4
+    return json.loads(bytes(buf[start:start + hlen])), start + hlen
+
+def decode_streams(buf, channels: Optional[Sequence[str]] = None) -> Streams:
+    """Contenu .strm (bytes, memoryview ou memmap) -> streams demandés (tous par défaut).
+
+    Les canaux float32 sont des vues sur `buf` (aucune copie si `buf` est un memmap)."""
+    header, base = _read_header(buf)
+    n = header["n"]
+    wanted = list(header["channels"]) if channels is None else [c for c in channels if c in header["channels"]]
+    out: Streams = {}
+    for name in wanted:
+        spec = header["channels"][name]
+        raw = np.frombuffer(buf, dtype=np.dtype(spec["dtype"]), count=n, offset=base + spec["offset"])
+        if name == "time":
+            out[name] = header["t0"] + np.cumsum(raw, dtype=np.int64) / 1000.0
+            continue
+        _, scale, missing = CHANNEL_SPECS[name]
+        if scale is None and missing is None:
+            out[name] = raw
+            continue
+        vals = raw.astype("float32") if scale is None else raw * scale
+        if missing is not None:
+            vals[raw == missing] = np.nan
+        out[name] = vals
+    return out
+
+
+# =========================
+# Stockage (froid : blobs compressés ; chaud : cache local mmap)
+# =========================
+class LocalBlobStore:
+    """Stand-in local de Supabase Storage : un fichier par clé sous `root`."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def put(self, key: str, data: bytes) -> None:
+        write_bytes(self._path(key), data)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def list(self, prefix: str) -> List[str]:
+        """Noms des fichiers sous le dossier `prefix`."""
+        try:
+            return sorted(n for n in os.listdir(self._path(prefix)) if not n.endswith(".tmp"))
+        except FileNotFoundError:
+            return []
+
+class SupabaseBlobStore:
+    """Bucket Supabase Storage (même interface que LocalBlobStore)."""
+
+    def __init__(self, sb, bucket: str):
+        self.bucket = sb.storage.from_(bucket)
+
+    def put(self, key: str, data: bytes) -> None:
+        self.bucket.upload(key, data, {"content-type": "application/octet-stream", "upsert": "true"})
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.bucket.download(key)
+        except Exception:
+            return None
+
+    def list(self, prefix: str, page_size: int = 1000) -> List[str]:
+        names: List[str] = []
+        while True:
+            page = self.bucket.list(prefix, {"limit": page_size, "offset": len(names)}) or []
+            names.extend(o["name"] for o in page)
+            if len(page) < page_size:
+                return sorted(names)
+
+class StreamStore:
+    """Streams par (utilisateur, activity_id) : blobs compressés + cache local décompressé lu en mmap."""
+
+    def __init__(self, blobs=None, cache_dir: Optional[str] = None):
+        self.blobs = blobs if blobs is not None else LocalBlobStore(os.path.join(STREAMS_DIR, "blobs"))
+        self.cache_dir = cache_dir or os.path.join(STREAMS_DIR, "cache")
+
+    @staticmethod
+    def key(user_id: Any, activity_id: Any) -> str:
+        return f"{user_id}/{activity_id}.strm.z"
+
+    def _cache_path(self, user_id: Any, activity_id: Any) -> str:
+        return os.path.join(self.cache_dir, str(user_id), f"{activity_id}.strm")
+
+    def _write_cache(self, path: str, raw: bytes) -> None:
+        write_bytes(path, raw)
+
+    def save(self, user_id: Any, activity_id: Any, streams: Streams) -> int:
+        """Enregistre (écrase) les streams d'une activité. Retourne la taille compressée."""
+        raw = encode_streams(activity_id, streams)
+        blob = zlib.compress(raw, 6)
+        self.blobs.put(self.key(user_id, activity_id), blob)
+        self._write_cache(self._cache_path(user_id, activity_id), raw)
+        return len(blob)
+
+    def save_many(self, user_id: Any, tracks: Dict[Any, Streams], max_workers: int = SAVE_WORKERS) -> int:
+        """Enregistre plusieurs activités (envois en parallèle). Retourne le nombre enregistré."""
+        if not tracks:
+            return 0
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tracks)))) as pool:
+            return sum(1 for _ in pool.map(lambda kv: self.save(user_id, kv[0], kv[1]), tracks.items()))
+
+    def activity_ids(self, user_id: Any) -> List[str]:
+        """activity_id de toutes les activités enregistrées pour l'utilisateur."""
+        suffix = ".strm.z"
+        ids = [n[:-len(suffix)] for n in self.blobs.list(str(user_id)) if n.endswith(suffix)]
+        return [int(i) if i.isdigit() else i for i in ids]
+
+    def has(self, user_id: Any, activity_id: Any) -> bool:
+        return (os.path.exists(self._cache_path(user_id, activity_id))
+                or self.blobs.get(self.key(user_id, activity_id)) is not None)
+
+    def local_path(self, user_id: Any, activity_id: Any) -> Optional[str]:
+        """Chemin du fichier brut dans le cache local (téléchargé au besoin), None si inconnue."""
+        path = self._cache_path(user_id, activity_id)
+        if not os.path.exists(path):
+            blob = self.blobs.get(self.key(user_id, activity_id))
+            if blob is None:
+                return None
+            self._write_cache(path, zlib.decompress(blob))
+        return path
+
+    def load(self, user_id: Any, activity_id: Any, channels: Optional[Sequence[str]] = None) -> Optional[Streams]:
+        """Streams d'une activité (None si inconnue). Le cache local est rempli au premier accès."""
+        path = self.local_path(user_id, activity_id)
+        return load_file(path, channels) if path else None
+
+def load_file(path: str, channels: Optional[Sequence[str]] = None) -> Streams:
+    """Lit un fichier .strm du cache local par mmap (utilisable dans un processus de calcul)."""
+    return decode_streams(np.memmap(path, dtype=np.uint8, mode="r"), channels)
+
+_default_store: Optional[StreamStore] = None
+
+def default_store() -> StreamStore:
+    """Store local (STREAMS_DIR), partagé par le process."""
+    global _default_store
+    if _default_store is None:
+        _default_store = StreamStore()
+    return _default_store
+
+def open_store(sb=None, bucket: Optional[str] = None) -> StreamStore:
+    """Store Supabase Storage si un bucket est configuré, sinon le store local."""
+    if sb is not None and bucket:
+        return StreamStore(SupabaseBlobStore(sb, bucket))
+    return default_store()
+
+def load_streams(activity_id: Any, channels: Optional[Sequence[str]] = None, *,
+                 user_id: Any, store: Optional[StreamStore] = None) -> Optional[Streams]:
+    """Streams d'une activité, limités à `channels` si précisé (ex. ["time", "hr"])."""
+    return (store or default_store()).load(user_id, activity_id, channels)
@@ -0,0 +1,276 @@
+# utils_tracks.py — Fichiers d'activité (GPX / TCX / FIT, .gz compris) et export ZIP Strava
+#
+# Un fichier d'activité est lu en « streams » : un dict de tableaux numpy alignés, un point par
+# échantillon. Canaux possibles (absents si le fichier ne les contient pas) :
+#   time (s, epoch UTC, float64) · lat / lon (degrés) · ele (m) · hr (bpm) · cad (pas/min) · dist (m)
+#
+# La lecture FIT utilise `fitparse` (requirements.txt) ; si elle manque malgré tout, les .fit
+# sont signalés en échec et le reste de l'import continue.
+import gzip
+import io
+import os
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fitparse
+except ImportError:  # installation incomplète : .fit en échec
+    fitparse = None
+
+Streams = Dict[str, np.ndarray]
+
+TRACK_EXTS = (".gpx", ".tcx", ".fit")
+TRACK_WORKERS = max(1, min(8, (os.cpu_count() or 2) - 1))  # processus de parsing
+_INFLIGHT_PER_WORKER = 4  # fichiers décompressés en mémoire par processus, au plus
+
+_SEMICIRCLE = 180.0 / 2 ** 31  # FIT : semicircles -> degrés
+
+
+# =========================
+# Parsing par format
+# =========================
+@lru_cache(maxsize=256)
+def _local(tag: str) -> str:
+    """'{namespace}Trackpoint' -> 'Trackpoint' (GPX/TCX : namespaces variables selon l'appareil)."""
+    return tag.rsplit("}", 1)[-1]
+
+def _num(text: Optional[str]) -> float:
+    try:
+        return float(text) if text not in (None, "") else np.nan
+    except ValueError:
+        return np.nan
+
+def _epoch_seconds(times: List[Optional[str]]) -> np.ndarray:
+    """Horodatages ISO 8601 -> secondes epoch UTC (NaN si illisible), en une passe vectorisée."""
+    ts = pd.to_datetime(pd.Series(times, dtype=object), utc=True, errors="coerce", format="ISO8601")
+    out = ts.dt.tz_convert(None).to_numpy().astype("datetime64[ns]").astype(np.int64) / 1e9
+    out[ts.isna().to_numpy()] = np.nan
+    return out
+
+def _finish(cols: Dict[str, List[float]], times: List[Optional[str]]) -> Streams:
+    """Listes collectées -> tableaux ; un canal entièrement vide est omis."""
+    streams: Streams = {"time": _epoch_seconds(times)}
+    for k, v in cols.items():
+        arr = np.asarray(v, dtype="float64")
+        if len(arr) and not np.isnan(arr).all():
+            streams[k] = arr
+    return streams
+
+def parse_gpx(data: bytes) -> Streams:
+    """GPX 1.0/1.1, extensions Garmin TrackPointExtension (hr, cad) comprises."""
+    times: List[Optional[str]] = []
+    cols: Dict[str, List[float]] = {"lat": [], "lon": [], "ele": [], "hr": [], "cad": []}
+    for _, el in ET.iterparse(io.BytesIO(data), events=("end",)):
+        if _local(el.tag) != "trkpt":
+            continue
+        t = ele = hr = cad = None
+        for child in el.iter():
+            name = _local(child.tag)
+            if name == "time":
+                t = child.text
+            elif name == "ele":
+                ele = child.text
+            elif name == "hr":
+                hr = child.text
+            elif name == "cad":
+                cad = child.text
+        times.append(t)
+        cols["lat"].append(_num(el.get("lat")))
+        cols["lon"].append(_num(el.get("lon")))
+        cols["ele"].append(_num(ele))
+        cols["hr"].append(_num(hr))
+        cols["cad"].append(_num(cad))
+        el.clear()
+    return _finish(cols, times)
+
+def parse_tcx(data: bytes) -> Streams:
+    """TCX (Garmin Training Center) : Trackpoint avec Position, Altitude, Distance, HR, cadence."""
+    times: List[Optional[str]] = []
+    cols: Dict[str, List[float]] = {"lat": [], "lon": [], "ele": [], "hr": [], "cad": [], "dist": []}
+    # certains exports ont des espaces avant le prologue XML
+    for _, el in ET.iterparse(io.BytesIO(data.lstrip()), events=("end",)):
+        if _local(el.tag) != "Trackpoint":
+            continue
+        vals: Dict[str, Optional[str]] = {}
+        for child in el.iter():
+            name = _local(child.tag)
+            if name == "Time":
+                vals["time"] = child.text
+            elif name == "LatitudeDegrees":
+                vals["lat"] = child.text
+            elif name == "LongitudeDegrees":
+                vals["lon"] = child.text
+            elif name == "AltitudeMeters":
+                vals["ele"] = child.text
+            elif name == "DistanceMeters":
+                vals["dist"] = child.text
+            elif name == "Value" and "hr" not in vals:  # HeartRateBpm/Value
+                vals["hr"] = child.text
+            elif name in ("Cadence", "RunCadence"):
+                vals["cad"] = child.text
+        times.append(vals.get("time"))
+        for k in cols:
+            cols[k].append(_num(vals.get(k)))
+        el.clear()
+    return _finish(cols, times)
+
+def parse_fit(data: bytes) -> Streams:
+    """FIT (messages 'record'), via fitparse. Lève RuntimeError si fitparse n'est pas installé."""
+    if fitparse is None:
+        raise RuntimeError("lecture FIT indisponible (installer fitparse)")
+    fields = {"position_lat": "lat", "position_long": "lon", "enhanced_altitude": "ele",
+              "altitude": "ele", "heart_rate": "hr", "cadence": "cad", "distance": "dist"}
+    times: List[Optional[str]] = []
+    cols: Dict[str, List[float]] = {"lat": [], "lon": [], "ele": [], "hr": [], "cad": [], "dist": []}
+    for msg in fitparse.FitFile(io.BytesIO(data)).get_messages("record"):
+        vals = {}
+        for f in msg:
+            target = fields.get(f.name)
+            if target and f.value is not None and target not in vals:
+                vals[target] = f.value
+            elif f.name == "timestamp" and f.value is not None:
+                vals["time"] = f.value
+        if "time" not in vals:
+            continue
+        times.append(pd.Timestamp(vals["time"]).tz_localize("UTC").isoformat())
+        for k in cols:
+            v = vals.get(k)
+            cols[k].append(float(v) * _SEMICIRCLE if v is not None and k in ("lat", "lon") else _num(v))
+    return _finish(cols, times)
+
+_PARSERS = {".gpx": parse_gpx, ".tcx": parse_tcx, ".fit": parse_fit}
+
+def track_ext(name: str) -> Optional[str]:
+    """Extension utile d'un fichier d'activité ('.gpx' pour 'x.gpx.gz'), None sinon."""
+    base = name.lower()
+    if base.endswith(".gz"):
+        base = base[:-3]
+    ext = os.path.splitext(base)[1]
+    return ext if ext in TRACK_EXTS else None
+
+def parse_activity_file(name: str, data: bytes) -> Streams:
+    """Contenu brut (éventuellement gzip) -> streams, selon l'extension du nom."""
+    ext = track_ext(name)
+    if ext is None:
+        raise ValueError(f"format non pris en charge : {name}")
+    if name.lower().endswith(".gz"):
+        data = gzip.decompress(data)
+    return _PARSERS[ext](data)
+
+def _parse_entry(args: Tuple[str, bytes]) -> Tuple[str, Optional[Streams], Optional[str]]:
+    """Tâche du pool de processus : (nom, contenu) -> (nom, streams | None, erreur | None)."""
+    name, data = args
+    try:
+        return name, parse_activity_file(name, data), None
+    except Exception as e:
+        return name, None, f"{type(e).__name__}: {e}"
+
+
+# =========================
+# Export ZIP Strava
+# =========================
+def find_activities_csv(zf: zipfile.ZipFile) -> Optional[str]:
+    """Nom de l'entrée activities.csv de l'export (à la racine ou dans un sous-dossier)."""
+    names = [n for n in zf.namelist() if os.path.basename(n).lower() == "activities.csv"]
+    return min(names, key=len) if names else None
+
+def _norm_name(name: Any) -> str:
+    return str(name).strip().replace("\\", "/").lstrip("./").lower()
+
+_ID_RE = re.compile(r"^(\d+)")
+
+def link_entries(zf: zipfile.ZipFile, rows: pd.DataFrame) -> Dict[str, Any]:
+    """Entrées fichier d'activité de l'archive -> activity_id de `rows`.
+
+    Rattachement par la colonne `filename` (chemin exact, puis nom de base), sinon par
+    l'identifiant numérique en tête du nom de fichier (ex. 'activities/1234567.gpx.gz').
+    Les entrées sans ligne correspondante ne sont pas retenues (elles ne seront pas lues).
+    """
+    by_path: Dict[str, Any] = {}
+    by_base: Dict[str, Any] = {}
+    ids = set()
+    for aid, fname in zip(rows.get("activity_id", pd.Series(dtype=object)),
+                          rows.get("filename", pd.Series([None] * len(rows), dtype=object))):
+        if aid is None:
+            continue
+        ids.add(aid)
+        if fname:
+            by_path[_norm_name(fname)] = aid
+            by_base[os.path.basename(_norm_name(fname))] = aid
+
+    links: Dict[str, Any] = {}
+    for info in zf.infolist():
+        if info.is_dir() or track_ext(info.filename) is None:
+            continue
+        norm = _norm_name(info.filename)
+        aid = by_path.get(norm, by_base.get(os.path.basename(norm)))
+        if aid is None:
+            m = _ID_RE.match(os.path.basename(norm))
+            if m and int(m.group(1)) in ids:
+                aid = int(m.group(1))
+        if aid is not None:
+            links[info.filename] = aid
+    return links
+
+def iter_entries(zf: zipfile.ZipFile, names: List[str]) -> Iterator[Tuple[str, bytes]]:
+    """Contenu brut des entrées, lu une à une depuis l'archive (rien n'est écrit sur disque)."""
+    for name in names:
+        with zf.open(name) as fh:
+            yield name, fh.read()
+
+def parse_zip_tracks(f: BinaryIO, links: Dict[str, Any], max_workers: int = TRACK_WORKERS,
+                     progress=None) -> Tuple[Dict[Any, Streams], Dict[str, str]]:
+    """Lit et parse en parallèle (pool de processus) les entrées de `links`.
+
+    Les entrées sont lues séquentiellement depuis l'archive et soumises au pool au fil de
+    l'eau ; au plus max_workers * 4 contenus bruts sont en mémoire à la fois.
+    `progress(done, total)` est appelé après chaque fichier.
+    Retourne ({activity_id: streams}, {entrée: erreur}).
+    """
+    names = sorted(links)
+    tracks: Dict[Any, Streams] = {}
+    errors: Dict[str, str] = {}
+    if not names:
+        return tracks, errors
+
+    def collect(futs):
+        for fut in futs:
+            name, streams, err = fut.result()
+            if err is None:
+                tracks[links[name]] = streams
+            else:
+                errors[name] = err
+            if progress is not None:
+                progress(len(tracks) + len(errors), len(names))
+
+    with zipfile.ZipFile(f) as zf, ProcessPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        pending = set()
+        limit = max(1, max_workers) * _INFLIGHT_PER_WORKER
+        for item in iter_entries(zf, names):
+            if len(pending) >= limit:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(_parse_entry, item))
+        collect(pending)
+    return tracks, errors
+
+def track_summary(tracks: Dict[Any, Streams]) -> pd.DataFrame:
+    """Une ligne par activité : nb de points, durée, canaux disponibles."""
+    recs = []
+    for aid, s in tracks.items():
+        t = s.get("time", np.array([]))
+        ok = t[np.isfinite(t)] if len(t) else t
+        recs.append({
+            "activity_id": aid,
+            "points": len(t),
+            "duree_min": round(float(ok[-1] - ok[0]) / 60.0, 1) if len(ok) > 1 else None,
+            "canaux": ", ".join(k for k in s if k != "time"),
+        })
+    return pd.DataFrame.from_records(recs, columns=["activity_id", "points", "duree_min", "canaux"])
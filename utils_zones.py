@@ -0,0 +1,171 @@
+# utils_zones.py — Temps passé par zone cardiaque, calculé depuis les streams de FC
+#
+# Une activité = une passe NumPy : np.digitize (FC -> zone) puis np.bincount pondéré par la durée
+# de chaque échantillon. Les pourcentages sont agrégés par jour (pondérés par la durée) et
+# écrits dans les colonnes du journal : pct_zone1_course … pct_zone5_course (jours déjà saisis).
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from utils_db import chunked
+from utils_store import store_dir, user_file, read_frame, write_frame, read_json, write_json
+
+Streams = Dict[str, np.ndarray]
+
+N_ZONES = 5
+ZONE_COLS = [f"pct_zone{i}_course" for i in range(1, N_ZONES + 1)]
+# Bornes par défaut en fraction de la FC max : Z1 < 60 % ≤ Z2 < 70 % ≤ Z3 < 80 % ≤ Z4 < 90 % ≤ Z5
+DEFAULT_FRACTIONS = (0.60, 0.70, 0.80, 0.90)
+MAX_SAMPLE_GAP_S = 30.0   # un écart plus long est une pause : compté pour cette durée au plus
+ZONE_WORKERS = max(1, min(8, os.cpu_count() or 2))
+ZONES_DIR = store_dir("zones")
+INDEX_COLS = ["activity_id", "activity_date"] + [f"z{i}_s" for i in range(1, N_ZONES + 1)]
+
+
+def zone_bounds(hr_max: Optional[float] = None, bounds: Optional[Sequence[float]] = None) -> np.ndarray:
+    """Seuils (bpm) entre zones : `bounds` si fourni (4 valeurs croissantes), sinon fractions de hr_max."""
+    if bounds:
+        b = np.asarray(sorted(float(x) for x in bounds), dtype="float64")
+        if len(b) != N_ZONES - 1:
+            raise ValueError(f"{N_ZONES - 1} seuils attendus, {len(b)} reçus")
+        return b
+    if not hr_max or hr_max <= 0:
+        raise ValueError("FC max inconnue")
+    return np.asarray(DEFAULT_FRACTIONS, dtype="float64") * float(hr_max)
+
+def time_in_zones(streams: Streams, bounds: np.ndarray) -> Optional[np.ndarray]:
+    """Secondes passées dans chaque zone (tableau de 5), None sans FC exploitable."""
+    hr, t = streams.get("hr"), streams.get("time")
+    if hr is None or t is None or len(hr) < 2:
+        return None
+    hr = np.asarray(hr, dtype="float64")
+    dt = np.diff(np.asarray(t, dtype="float64"), append=np.nan)
+    dt = np.clip(np.nan_to_num(dt, nan=0.0), 0.0, MAX_SAMPLE_GAP_S)
+    ok = np.isfinite(hr) & (hr > 0)
+    if not ok.any():
+        return None
+    zone = np.digitize(hr[ok], bounds)  # 0..4
+    return np.bincount(zone, weights=dt[ok], minlength=N_ZONES)[:N_ZONES]
+
+def zone_percentages(seconds: np.ndarray) -> Optional[List[float]]:
+    total = float(np.sum(seconds))
+    if total <= 0:
+        return None
+    return [round(100.0 * float(s) / total, 1) for s in seconds]
+
+
+# =========================
+# Traitement par lots
+# =========================
+def compute_zones(tracks: Dict[Any, Streams], bounds: np.ndarray,
+                  max_workers: int = ZONE_WORKERS) -> Dict[Any, np.ndarray]:
+    """{activity_id: secondes par zone} pour toutes les activités avec FC, en parallèle
+    (threads : digitize / bincount relâchent le GIL, pas de copie des streams entre processus)."""
+    if not tracks:
+        return {}
+    items = list(tracks.items())
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as pool:
+        res = pool.map(lambda kv: (kv[0], time_in_zones(kv[1], bounds)), items)
+        return {aid: sec for aid, sec in res if sec is not None}
+
+def zones_from_store(store, user_id: Any, activity_ids: Sequence[Any], bounds: np.ndarray,
+                     max_workers: int = ZONE_WORKERS) -> Dict[Any, np.ndarray]:
+    """Comme compute_zones, mais chaque tâche lit elle-même ses canaux time/hr dans le StreamStore
+    (historique complet sans tout charger en mémoire)."""
+    def one(aid):
+        streams = store.load(user_id, aid, channels=["time", "hr"])
+        return aid, (time_in_zones(streams, bounds) if streams else None)
+    if not activity_ids:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(activity_ids)))) as pool:
+        return {aid: sec for aid, sec in pool.map(one, list(activity_ids)) if sec is not None}
+
+def daily_zone_percentages(zone_seconds: Dict[Any, np.ndarray], dates: Dict[Any, Any]) -> pd.DataFrame:
+    """Une ligne par jour : pct_zone1_course … pct_zone5_course (durées cumulées sur les activités du jour)."""
+    recs = []
+    for aid, sec in zone_seconds.items():
+        d = pd.to_datetime(dates.get(aid), utc=True, errors="coerce", format="ISO8601")
+        if pd.isna(d):
+            continue
+        recs.append([d.date().isoformat()] + list(sec))
+    if not recs:
+        return pd.DataFrame(columns=["date"] + ZONE_COLS)
+    per_day = pd.DataFrame(recs, columns=["date"] + list(range(N_ZONES))).groupby("date").sum()
+    pct = per_day.div(per_day.sum(axis=1), axis=0).mul(100.0).round(1)
+    pct.columns = ZONE_COLS
+    return pct.reset_index()
+
+
+# =========================
+# Index local (par activité) + écriture dans le journal
+# =========================
+def _index_path(user_id: Any) -> str:
+    return user_file(ZONES_DIR, user_id)
+
+def load_zone_index(user_id: Any) -> pd.DataFrame:
+    return read_frame(_index_path(user_id), INDEX_COLS)
+
+def update_zone_index(user_id: Any, zone_seconds: Dict[Any, np.ndarray], dates: Dict[Any, Any]) -> pd.DataFrame:
+    """Remplace les lignes des activités recalculées ; retourne l'index complet."""
+    new = pd.DataFrame([[aid, dates.get(aid)] + list(sec) for aid, sec in zone_seconds.items()], columns=INDEX_COLS)
+    idx = load_zone_index(user_id)
+    out = pd.concat([idx[~idx["activity_id"].isin(list(zone_seconds))], new], ignore_index=True)
+    write_frame(_index_path(user_id), out)
+    return out
+
+def day_zones_from_index(idx: pd.DataFrame, days: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Pourcentages par jour depuis l'index local (toutes les activités de chaque jour)."""
+    secs = {row.activity_id: np.array([getattr(row, f"z{i}_s") for i in range(1, N_ZONES + 1)], dtype="float64")
+            for row in idx.itertuples(index=False)}
+    daily = daily_zone_percentages(secs, dict(zip(idx["activity_id"], idx["activity_date"])))
+    return daily if days is None else daily[daily["date"].isin(list(days))]
+
+def _written_path(user_id: Any) -> str:
+    return user_file(ZONES_DIR, user_id, "_journal.json")
+
+def _is_auto(current: List[Any], last_written: Optional[List[float]]) -> bool:
+    """Zones vides, ou encore égales à celles écrites automatiquement la dernière fois."""
+    if all(v is None for v in current):
+        return True
+    return last_written is not None and all(
+        v is not None and abs(float(v) - w) < 0.05 for v, w in zip(current, last_written))
+
+def write_journal_zones(sb, user_id: Any, daily: pd.DataFrame) -> Dict[str, int]:
+    """Écrit les pourcentages dans les lignes existantes de `journal` (update par id, seules les
+    colonnes de zones changent). Pas de ligne créée pour un jour sans saisie (la Saisie préremplit
+    les zones depuis l'index) ; les zones tapées à la main ne sont jamais écrasées. Les valeurs
+    écrites sont mémorisées (data/zones/<user_id>_journal.json) pour reconnaître les siennes."""
+    if daily.empty:
+        return {"updated": 0, "skipped": 0, "failed": 0}
+    by_day = {r["date"]: {c: float(r[c]) for c in ZONE_COLS} for r in daily.to_dict("records")}
+    written = read_json(_written_path(user_id), {})
+    todo, skipped = [], 0
+    for part in chunked(list(by_day), 200):
+        res = (sb.table("journal").select(",".join(["id", "date"] + ZONE_COLS))
+                 .eq("user_id", user_id).in_("date", list(part))).execute()
+        for r in res.data or []:
+            z = by_day[str(r["date"])[:10]]
+            if _is_auto([r.get(c) for c in ZONE_COLS], written.get(str(r["id"]))):
+                todo.append((r["id"], z))
+            else:
+                skipped += 1
+
+    def update(item) -> bool:
+        jid, z = item
+        try:
+            sb.table("journal").update(z).eq("id", jid).eq("user_id", user_id).execute()
+            return True
+        except Exception:
+            return False
+
+    with ThreadPoolExecutor(max_workers=ZONE_WORKERS) as pool:
+        ok = list(pool.map(update, todo))
+    for (jid, z), good in zip(todo, ok):
+        if good:
+            written[str(jid)] = [z[c] for c in ZONE_COLS]
+    if any(ok):
+        write_json(_written_path(user_id), written)
+    return {"updated": sum(ok), "skipped": skipped, "failed": len(ok) - sum(ok)}